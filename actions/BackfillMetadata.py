@@ -0,0 +1,144 @@
+"""
+This module contains functions to write or refresh the metadata of already downloaded images in bulk,
+based on the Submission Archive
+"""
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from config import Config
+
+from actions.ProcessPool import imap_windowed
+from actions.WriteMetadata import MetadataModel, get_model_from_submission, set_keywords, write_metadata, write_xmp_sidecar, \
+    get_sidecar_file, is_sidecar_mode
+from actions.downloader.ImgurAlbumDownloader import ImgurAlbumMetadata
+from actions.downloader.RedditGalleryDownloader import RedditGalleryMetadata
+from database import SubmissionArchive, ArchivedSubmission
+
+_STATE_FILE_NAME: str = ".metadata_state.json"
+"""Name of the file in the destination directory that stores which metadata has been written to which file"""
+
+
+def build_models(archive: SubmissionArchive, cfg: Config) -> Iterator[tuple[str, Path, MetadataModel]]:
+    """
+    Build the metadata models of all images in the given archive, using the current config
+    :param archive: Submission Archive
+    :param cfg: Global Config
+    :return: an iterator over the archived file paths, the image files and their metadata models
+    """
+    submissions, albums, images = archive.load()
+    album_metadata: dict[tuple[str, str], ImgurAlbumMetadata] = {}
+    for file, record in images.items():
+        submission_record: Optional[dict[str, Any]] = submissions.get(record["submission"])
+        if submission_record is None:
+            print(f"The archive does not contain submission {record['submission']} of {file}", file=sys.stderr)
+            continue
+        submission: ArchivedSubmission = ArchivedSubmission(submission_record)
+        image_file: Path = archive.resolve(file)
+        if "album" in record:
+            key: tuple[str, str] = (submission.id, record["album"])
+            if key not in album_metadata:
+                if record["album"] not in albums:
+                    print(f"The archive does not contain album {record['album']} of {file}", file=sys.stderr)
+                    continue
+                base: MetadataModel = get_model_from_submission(None, submission)
+                if cfg['metadata_scraper.write_keywords']:
+                    base = set_keywords(base, submission, cfg)
+                album_metadata[key] = ImgurAlbumMetadata(base, albums[record["album"]])
+            yield file, image_file, album_metadata[key].for_image(record["image"], image_file)
+        elif "gallery_item" in record:
+            base: MetadataModel = get_model_from_submission(None, submission)
+            if cfg['metadata_scraper.write_keywords']:
+                base = set_keywords(base, submission, cfg)
+            yield file, image_file, RedditGalleryMetadata(base, submission).for_image(record["gallery_item"], image_file)
+        else:
+            model: MetadataModel = get_model_from_submission(image_file, submission)
+            if cfg['metadata_scraper.write_keywords']:
+                model = set_keywords(model, submission, cfg)
+            yield file, image_file, model
+
+
+def _model_digest(model: MetadataModel, sidecar: bool) -> str:
+    return hashlib.sha1(json.dumps([sidecar, model], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _write_job(image_file: str, model: MetadataModel, sidecar: bool) -> tuple[int, int]:
+    """
+    Write the given metadata. This function is executed in a worker process.
+    :return: the modification time in nanoseconds and the size of the written file
+    """
+    exif_data, iptc_data, xmp_data = model
+    if sidecar:
+        written_file: Path = write_xmp_sidecar(Path(image_file), exif_data, iptc_data, xmp_data)
+    else:
+        written_file: Path = Path(image_file)
+        write_metadata(written_file, exif_data, iptc_data, xmp_data)
+    stat: os.stat_result = written_file.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _save_state(state_file: Path, state: dict[str, list]) -> None:
+    tmp_file: Path = state_file.with_name(state_file.name + ".tmp")
+    with tmp_file.open("w") as sf:
+        json.dump(state, sf)
+    tmp_file.replace(state_file)
+
+
+def backfill_metadata(destination: Path, cfg: Config, workers: Optional[int] = None, force: bool = False) -> int:
+    """
+    Write or refresh the metadata of all images in the given destination directory.
+    Files whose metadata has already been written with the same content and that have not been modified since are skipped.
+    :param destination: Destination directory the images have been scraped into
+    :param cfg: Global Config
+    :param workers: Number of worker processes, or None to use one per CPU
+    :param force: If True, rewrite the metadata of all files
+    :return: the number of files whose metadata has been written
+    """
+    archive: SubmissionArchive = SubmissionArchive(destination / cfg.get("reddit_downloader.submission_archive_file", "submissions.jsonl"))
+    if not archive.archive_file.is_file():
+        print(f"No submission archive found at {archive.archive_file}!", file=sys.stderr)
+        return 0
+    sidecar: bool = is_sidecar_mode(cfg)
+    state_file: Path = destination / _STATE_FILE_NAME
+    state: dict[str, list] = {}
+    if state_file.is_file():
+        with state_file.open("r") as sf:
+            state = json.load(sf)
+
+    written: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+    def tasks() -> Iterator[tuple[tuple[str, str], tuple]]:
+        nonlocal skipped
+        for file, image_file, model in build_models(archive, cfg):
+            if not image_file.is_file():
+                continue  # The image has been deleted, e.g. because it was a duplicate
+            flat_model: MetadataModel = (dict(model[0]), dict(model[1]), dict(model[2]))
+            digest: str = _model_digest(flat_model, sidecar)
+            written_file: Path = get_sidecar_file(image_file) if sidecar else image_file
+            previous: Optional[list] = state.get(file)
+            if not force and previous is not None and previous[0] == digest and written_file.is_file():
+                stat: os.stat_result = written_file.stat()
+                if previous[1] == stat.st_mtime_ns and previous[2] == stat.st_size:
+                    skipped += 1
+                    continue
+            yield (file, digest), (image_file.as_posix(), flat_model, sidecar)
+
+    for (file, digest), future in imap_windowed(_write_job, tasks(), workers):
+        try:
+            mtime_ns, size = future.result()
+        except Exception as e:
+            print(f"Could not write metadata to {file}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        state[file] = [digest, mtime_ns, size]
+        written += 1
+        if written % 1000 == 0:
+            _save_state(state_file, state)
+    _save_state(state_file, state)
+    print(f"Wrote metadata to {written} files, skipped {skipped} files with current metadata, {failed} files failed.")
+    return written
@@ -0,0 +1,91 @@
+"""
+This module contains the filters that decide, based on the metadata in the listing or the Imgur API response,
+whether an image is downloaded at all
+"""
+from typing import Optional
+
+from config import Config
+
+_FORMAT_ALIASES: dict[str, str] = {"jpg": "jpeg", "image/jpeg": "jpeg", "image/jpg": "jpeg", "image/png": "png", "image/gif": "gif",
+                                   "image/webp": "webp"}
+"""Normalized names of all spellings of image formats, as file extensions or MIME types"""
+
+
+def normalize_format(image_format: str) -> str:
+    """
+    Normalize the given image format, e.g. ".JPG", "jpg" and "image/jpeg" all become "jpeg"
+    :param image_format: File extension or MIME type
+    :return: the normalized format
+    """
+    image_format = image_format.lower().lstrip(".")
+    return _FORMAT_ALIASES.get(image_format, image_format)
+
+
+class ImageFilter:
+    """
+    A set of constraints on the size and format of images. Constraints that are zero or empty are disabled,
+    and values that are not known before the download, e.g. the byte size of a reddit image, pass every constraint.
+    """
+
+    def __init__(self, min_width: int = 0, min_height: int = 0, min_aspect_ratio: float = 0.0, max_aspect_ratio: float = 0.0,
+                 max_bytes: int = 0, formats: Optional[list[str]] = None) -> None:
+        """
+        Init a new filter
+        :param min_width: Minimum width in pixels
+        :param min_height: Minimum height in pixels
+        :param min_aspect_ratio: Minimum ratio of width to height, e.g. 1.0 to reject portrait images
+        :param max_aspect_ratio: Maximum ratio of width to height
+        :param max_bytes: Maximum size of the image file
+        :param formats: Allowed image formats, as file extensions or MIME types, e.g. ["jpg", "png"]
+        """
+        super().__init__()
+        self.min_width: int = min_width
+        self.min_height: int = min_height
+        self.min_aspect_ratio: float = min_aspect_ratio
+        self.max_aspect_ratio: float = max_aspect_ratio
+        self.max_bytes: int = max_bytes
+        self.formats: frozenset[str] = frozenset(normalize_format(f) for f in formats or [])
+
+    @staticmethod
+    def from_config(cfg: Config) -> "ImageFilter":
+        """
+        Create the filter that is configured in the "filters" section of the given configuration
+        :param cfg: The global configuration
+        :return: the filter
+        """
+        return ImageFilter(cfg.get("filters.min_width", 0), cfg.get("filters.min_height", 0), cfg.get("filters.min_aspect_ratio", 0.0),
+                           cfg.get("filters.max_aspect_ratio", 0.0), cfg.get("filters.max_bytes", 0), cfg.get("filters.formats", []))
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Check if any constraint is enabled
+        :return: True, if the filter may reject images
+        """
+        return bool(self.min_width or self.min_height or self.min_aspect_ratio or self.max_aspect_ratio or self.max_bytes or self.formats)
+
+    def rejects(self, width: Optional[int] = None, height: Optional[int] = None, size: Optional[int] = None,
+                image_format: Optional[str] = None) -> Optional[str]:
+        """
+        Check the given image against all constraints
+        :param width: Width in pixels, if known
+        :param height: Height in pixels, if known
+        :param size: Size of the image file in bytes, if known
+        :param image_format: File extension or MIME type, if known
+        :return: the reason why the image is rejected, or None, if the image passes all constraints
+        """
+        if width and self.min_width and width < self.min_width:
+            return f"its width of {width}px is below {self.min_width}px"
+        if height and self.min_height and height < self.min_height:
+            return f"its height of {height}px is below {self.min_height}px"
+        if width and height:
+            aspect_ratio: float = width / height
+            if self.min_aspect_ratio and aspect_ratio < self.min_aspect_ratio:
+                return f"its aspect ratio of {aspect_ratio:.2f} is below {self.min_aspect_ratio:.2f}"
+            if self.max_aspect_ratio and aspect_ratio > self.max_aspect_ratio:
+                return f"its aspect ratio of {aspect_ratio:.2f} is above {self.max_aspect_ratio:.2f}"
+        if size and self.max_bytes and size > self.max_bytes:
+            return f"its size of {size} bytes is above {self.max_bytes} bytes"
+        if image_format and self.formats and normalize_format(image_format) not in self.formats:
+            return f"its format {normalize_format(image_format)} is not allowed"
+        return None
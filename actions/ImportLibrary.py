@@ -0,0 +1,193 @@
+"""
+This module contains functions to rebuild the perceptual hash library and the URL history from existing image folders,
+e.g. after moving to a new machine or after losing the library
+"""
+import os
+import re
+import sys
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import pyexiv2
+from imagehashsort import ImageDatabase, perceptual_hash
+
+from actions.ProcessPool import imap_windowed
+from actions.WriteMetadata import get_sidecar_file
+from database import URLManager, SubmissionArchive
+
+_STATE_FILE_NAME: str = ".library_import.txt"
+"""Name of the file in the imported directory that lists all files whose hashes have been saved to the library"""
+
+_IMAGE_EXTENSIONS: frozenset[str] = frozenset((".jpg", ".jpeg", ".png", ".gif", ".webp"))
+
+_REDDIT_MEDIA_NAME: re.Pattern = re.compile(r"[a-z0-9]{13}\.\w+")
+"""The file names of images on i.redd.it. The names of images on i.imgur.com are shorter and in mixed case"""
+
+_PERMALINK_ID: re.Pattern = re.compile(r"/comments/(\w+)")
+
+
+def find_images(root: Path) -> Iterator[Path]:
+    """
+    Find all images in the given directory tree, skipping hidden files and directories, e.g. the blob store
+    :param root: Root directory
+    :return: an iterator over the image files, in directory order
+    """
+    for directory, directories, files in os.walk(root):
+        directories[:] = sorted(d for d in directories if not d.startswith("."))
+        for file in sorted(files):
+            if not file.startswith(".") and os.path.splitext(file)[1].lower() in _IMAGE_EXTENSIONS:
+                yield Path(directory) / file
+
+
+def get_source_url(xmp: dict[str, Any]) -> Optional[str]:
+    """
+    Reconstruct the URL of the submission an image has been downloaded from, based on the XMP metadata written by the scraper.
+    This is only possible for directly linked images, whose original file name is preserved, and for reddit galleries,
+    whose folder name ends with the submission ID.
+    :param xmp: XMP metadata of the image
+    :return: the URL, or None, if it cannot be reconstructed
+    """
+    source: str = xmp.get("Xmp.dc.source", "")
+    preserved_file_name: str = xmp.get("Xmp.xmpMM.PreservedFileName", "")
+    album: str = xmp.get("Xmp.xmpDM.album", "")
+    submission_id: Optional[re.Match] = _PERMALINK_ID.search(source)
+    if album:
+        if submission_id is not None and album.endswith(f" {submission_id.group(1)}"):
+            return f"https://www.reddit.com/gallery/{submission_id.group(1)}"
+        return None  # Imgur albums can only be restored from the Submission Archive
+    if not preserved_file_name or "reddit.com" not in source:
+        return None
+    host: str = "i.redd.it" if _REDDIT_MEDIA_NAME.fullmatch(preserved_file_name) else "i.imgur.com"
+    return f"https://{host}/{preserved_file_name}"
+
+
+def _hash_job(image_files: list[str], read_sources: bool) -> list[tuple[str, Any, Optional[str], Optional[str]]]:
+    """
+    Hash the given images and read their source URLs. This function is executed in a worker process.
+    :return: the file, its perceptual hash or None, the source URL or None, and an error message or None, for every image
+    """
+    results: list[tuple[str, Any, Optional[str], Optional[str]]] = []
+    for image_file in image_files:
+        try:
+            imhash: Any = perceptual_hash(Path(image_file))
+        except Exception as e:
+            results.append((image_file, None, None, str(e)))
+            continue
+        url: Optional[str] = None
+        if read_sources:
+            sidecar_file: Path = get_sidecar_file(Path(image_file))
+            try:
+                with pyexiv2.Image(sidecar_file.as_posix() if sidecar_file.is_file() else image_file) as metadata:
+                    url = get_source_url(metadata.read_xmp())
+            except Exception:
+                pass  # Images without readable metadata are still hashed
+        results.append((image_file, imhash, url, None))
+    return results
+
+
+def _seed_from_archive(root: Path, archive_file_name: str, urlmanager: URLManager) -> int:
+    """Add the URLs of all submissions with downloaded images in the Submission Archive of the given directory to the URL history"""
+    archive: SubmissionArchive = SubmissionArchive(root / archive_file_name)
+    try:
+        submissions, _, images = archive.load()
+        urls: set[str] = {submissions[record["submission"]]["url"] for record in images.values() if record["submission"] in submissions}
+    finally:
+        archive.close()
+    for url in sorted(urls):
+        urlmanager.add_url_to_database(url)
+    return len(urls)
+
+
+def _store(library: ImageDatabase, images: list[tuple[Path, Any]]) -> None:
+    """Store the given images in the library, in a single transaction if the library supports it"""
+    if hasattr(library, "store_images"):
+        library.store_images(images)
+    else:
+        for image_file, imhash in images:
+            library.store_image(image_file, imhash)
+
+
+def import_library(root: Path, library: ImageDatabase, urlmanager: Optional[URLManager] = None, archive_file_name: str = "submissions.jsonl",
+                   workers: Optional[int] = None, batch_size: int = 5000, restart: bool = False) -> int:
+    """
+    Hash all images in the given directory tree in a process pool and store them in the given library.
+    The library is saved after every batch, and all files of the saved batches are recorded in a state file in the directory,
+    so an interrupted import continues with the first file that has not been saved.
+    :param root: Root directory of the images, e.g. the destination directory of the scraper
+    :param library: Perceptual Hash Library to store the hashes in
+    :param urlmanager: If given, add the URLs of all imported images to this URL history. They are taken from the Submission Archive
+                       in the root directory, if there is one, and reconstructed from the metadata of the images otherwise
+    :param archive_file_name: Name of the Submission Archive in the root directory
+    :param workers: Number of worker processes, or None to use one per CPU
+    :param batch_size: Number of images to store before the library is saved
+    :param restart: If True, ignore the state of a previous import and hash all images again
+    :return: the number of imported images
+    """
+    state_file: Path = root / _STATE_FILE_NAME
+    done: set[str] = set()
+    if state_file.is_file() and not restart:
+        with state_file.open("r", encoding="utf-8") as sf:
+            done = {line.rstrip("\n") for line in sf if line.strip()}
+        print(f"Continuing the import, skipping {len(done)} files that have already been imported")
+    elif state_file.is_file():
+        state_file.unlink()
+    if urlmanager is not None and (root / archive_file_name).is_file():
+        print(f"Added {_seed_from_archive(root, archive_file_name, urlmanager)} URLs from the submission archive to the URL history")
+
+    imported: int = 0
+    failed: int = 0
+    batch: list[tuple[Path, Any]] = []
+    urls: list[str] = []
+
+    def save() -> None:
+        nonlocal imported
+        _store(library, batch)
+        library.save()
+        for url in urls:
+            urlmanager.add_url_to_database(url)
+        # Only files whose hashes have been saved are recorded, so an interrupted import never misses a file
+        with state_file.open("a", encoding="utf-8") as sf:
+            sf.writelines(f"{image_file.relative_to(root).as_posix()}\n" for image_file, _ in batch)
+        imported += len(batch)
+        print(f"Imported {imported} images")
+        batch.clear()
+        urls.clear()
+
+    chunk_size: int = 32
+    """The number of images hashed per task, to amortize the inter-process communication"""
+
+    def tasks() -> Iterator[tuple[None, tuple]]:
+        chunk: list[str] = []
+        for image_file in find_images(root):
+            if image_file.relative_to(root).as_posix() in done:
+                continue
+            chunk.append(image_file.as_posix())
+            if len(chunk) == chunk_size:
+                yield None, (chunk, urlmanager is not None)
+                chunk = []
+        if chunk:
+            yield None, (chunk, urlmanager is not None)
+
+    results: Iterator[tuple[None, Future]] = imap_windowed(_hash_job, tasks(), workers, 4)
+    try:
+        for _, future in results:
+            for image_file, imhash, url, error in future.result():
+                if error is not None:
+                    print(f"Could not hash {image_file}: {error}", file=sys.stderr)
+                    failed += 1
+                    continue
+                batch.append((Path(image_file), imhash))
+                if url is not None:
+                    urls.append(url)
+            if len(batch) >= batch_size:
+                save()
+    except KeyboardInterrupt:
+        results.close()  # Cancels the pending chunks
+        print("Received Keyboard Interrupt, saving the imported images.", file=sys.stderr)
+        raise
+    finally:
+        if batch:
+            save()
+    print(f"Imported {imported} images, {failed} images could not be hashed.")
+    return imported
@@ -0,0 +1,199 @@
+"""
+This module contains counters and latency histograms for all stages of the scraper,
+which can be printed as a summary or written to a Prometheus textfile for the node_exporter textfile collector
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""Upper bounds of the latency histogram buckets, in seconds"""
+
+
+class Histogram:
+    """
+    A latency histogram with fixed buckets
+    """
+
+    def __init__(self) -> None:
+        self.bucket_counts: list[int] = [0] * (len(_BUCKETS) + 1)
+        """The number of observations per bucket. The last bucket counts all observations above the largest bound"""
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """
+        Record a single observation
+        :param seconds: Observed latency
+        :return: None
+        """
+        self.bucket_counts[bisect.bisect_left(_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the given quantile as the upper bound of the bucket it falls into
+        :param q: Quantile between 0 and 1
+        :return: the estimated quantile in seconds, or infinity if it is above the largest bucket
+        """
+        rank: float = q * self.count
+        cumulative: int = 0
+        for bound, count in zip(_BUCKETS + (float("inf"),), self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    A thread-safe registry of counters and latency histograms, keyed by stage name
+    """
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started: float = time.perf_counter()
+        self.active: dict[int, list[str]] = {}
+        """The stages every thread is currently executing, by thread identifier, the innermost stage last. Read by the profiler"""
+
+    def reset(self) -> None:
+        """
+        Discard all recorded values
+        :return: None
+        """
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.perf_counter()
+
+    def count(self, name: str, amount: float = 1) -> None:
+        """
+        Increase the given counter
+        :param name: Counter name, e.g. "http_bytes"
+        :param amount: Amount to add
+        :return: None
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record the latency of a single execution of the given stage
+        :param stage: Stage name, e.g. "perceptual_hash"
+        :param seconds: Latency
+        :return: None
+        """
+        with self._lock:
+            histogram: Histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Measure the latency of the enclosed block as an execution of the given stage.
+        Blocks that raise an exception are measured as well.
+        :param stage: Stage name
+        :return: a context manager
+        """
+        start: float = time.perf_counter()
+        try:
+            with self.context(stage):
+                yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def context(self, label: str) -> Iterator[None]:
+        """
+        Mark the enclosed block as part of the given stage or component, without measuring it,
+        so the profiler can attribute the time spent in it, e.g. to a downloader class
+        :param label: Stage or component name
+        :return: a context manager
+        """
+        stages: list[str] = self.active.setdefault(threading.get_ident(), [])
+        stages.append(label)
+        try:
+            yield
+        finally:
+            stages.pop()
+
+    def timed_iter(self, stage: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Measure the time spent waiting for each item of the given iterable, e.g. the page fetches of a listing
+        :param stage: Stage name
+        :param iterable: Iterable to wrap
+        :return: an iterator over the items of the iterable
+        """
+        iterator: Iterator[T] = iter(iterable)
+        while True:
+            start: float = time.perf_counter()
+            try:
+                with self.context(stage):
+                    item: T = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def summary(self) -> str:
+        """
+        Get a human-readable summary of all recorded values
+        :return: the summary
+        """
+        with self._lock:
+            elapsed: float = time.perf_counter() - self.started
+            lines: list[str] = [f"Run time: {elapsed:.1f}s",
+                                f"{'Stage':<20}{'Count':>8}{'Total':>10}{'Mean':>10}{'p50':>10}{'p95':>10}"]
+            for stage, h in sorted(self.histograms.items()):
+                mean: float = h.sum / h.count if h.count else 0.0
+                lines.append(f"{stage:<20}{h.count:>8}{h.sum:>9.1f}s{mean * 1000:>8.1f}ms"
+                             f"{h.quantile(0.5) * 1000:>8.0f}ms{h.quantile(0.95) * 1000:>8.0f}ms")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<20}{value:>8.0f}")
+            if self.counters.get("http_bytes") and elapsed > 0:
+                lines.append(f"Throughput: {self.counters['http_bytes'] / elapsed / 1024 / 1024:.2f} MB/s, "
+                             f"{self.counters.get('images_downloaded', 0) / elapsed:.2f} images/s")
+            return "\n".join(lines)
+
+    def write_prometheus_textfile(self, target_file: Path, prefix: str = "reddit_image_scraper") -> None:
+        """
+        Write all recorded values to a file in the Prometheus text exposition format.
+        The file is replaced atomically, as required by the node_exporter textfile collector.
+        :param target_file: File to write, should end with ".prom"
+        :param prefix: Prefix of all metric names
+        :return: None
+        """
+        with self._lock:
+            lines: list[str] = [f"# HELP {prefix}_stage_seconds Latency of the scraper stages.",
+                                f"# TYPE {prefix}_stage_seconds histogram"]
+            for stage, h in sorted(self.histograms.items()):
+                cumulative: int = 0
+                for bound, count in zip(_BUCKETS, h.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+            lines.append(f"{prefix}_last_run_timestamp_seconds {time.time()}")
+        target_file.parent.mkdir(exist_ok=True, parents=True)
+        tmp_file: Path = target_file.with_name(target_file.name + ".tmp")
+        tmp_file.write_text("\n".join(lines) + "\n")
+        tmp_file.replace(target_file)
+
+
+metrics: Metrics = Metrics()
+"""The global metrics registry"""
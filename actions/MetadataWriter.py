@@ -0,0 +1,318 @@
+"""
+This module contains a worker pool that writes metadata to downloaded images in the background
+"""
+import queue
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+from imagehashsort import ImageDatabase
+
+from actions.Instrumentation import metrics
+from actions.Recompress import Recompressor
+from actions.WriteMetadata import MetadataModel, write_metadata, write_metadata_to_bytes, write_xmp_sidecar, can_embed_metadata
+from database import BlobStore, NamingIndex
+
+if TYPE_CHECKING:  # The downloader package imports this module
+    from actions.downloader.Transfer import DownloadedImage
+
+
+class MetadataWriteBatch:
+    """
+    A batch of metadata writes that belong to a single submission.
+    The completion callback is invoked exactly once, after the batch has been closed and all of its writes have succeeded.
+    If any write fails, the callback is never invoked, and the failed file is deleted, so the submission is downloaded again
+    by the next attempt.
+    """
+
+    def __init__(self, pool: "MetadataWriterPool", on_complete: Optional[Callable[[], None]]) -> None:
+        """
+        Init a new batch. Batches shall be created via MetadataWriterPool.batch()
+        :param pool: The pool that executes the writes
+        :param on_complete: Callback to invoke once all writes succeeded, or None
+        """
+        self._pool: MetadataWriterPool = pool
+        self._on_complete: Optional[Callable[[], None]] = on_complete
+        self._lock: threading.Lock = threading.Lock()
+        self._pending: int = 1
+        """The number of unfinished writes, plus one for the batch itself, as long as it is still open"""
+        self._failed: bool = False
+
+    def write(self, target_file: Path, model: Optional[MetadataModel], data: Optional[bytes] = None, digest: Optional[str] = None,
+              on_written: Optional[Callable[[], None]] = None, phash: Optional[Any] = None) -> None:
+        """
+        Schedule the given metadata to be written to the given file.
+        This call blocks if the queue of the pool is full.
+        :param target_file: File to write
+        :param model: Metadata to write, or None to only write the image bytes
+        :param data: If given, the image bytes that have not been written to the target file yet.
+                     The metadata is added in memory and the file is written exactly once.
+        :param digest: If given, the SHA-256 digest of the downloaded bytes, used to add the file to the blob store
+        :param on_written: Callback to invoke once this file has been written successfully
+        :param phash: If given, the perceptual hash of the image, which is stored in the library of the pool once this file has been
+                      written successfully. Until then, it is only known to hash_known()
+        :return: None
+        """
+        with self._lock:
+            self._pending += 1
+        self._pool.submit(target_file, model, self, data, digest, on_written, phash)
+
+    def hash_known(self, phash: Any) -> bool:
+        """
+        Check if an image with the given perceptual hash is stored in the library of the pool, or is currently being written
+        :param phash: Perceptual hash
+        :return: True, if the hash is known
+        """
+        return self._pool.hash_known(phash)
+
+    def link_known(self, image: "DownloadedImage", model: Optional[MetadataModel]) -> bool:
+        """
+        If the bytes of the given image are already stored in the blob store, link the stored blob to the target file of the image,
+        instead of storing the image again. If an image with the same bytes is still being written, the image is written, too,
+        and replaced by a link to the blob once both have been written.
+        Metadata of linked images is only written to sidecar files, since embedding it would modify the shared blob.
+        The scraper refuses to use a blob store unless the metadata mode is sidecar, see is_blob_storage().
+        :param image: The downloaded image
+        :param model: Metadata of the image, or None
+        :return: True, if the image has been linked and must not be processed any further
+        """
+        blob_store: Optional[BlobStore] = self._pool.blob_store
+        if blob_store is None:
+            return False
+        if self._pool.digest_pending(image.sha256):
+            self.write(image.target_file, model if self._pool.sidecar else None, image.data, image.sha256)
+            return True
+        if not blob_store.contains(image.sha256):
+            return False
+        image.discard()
+        blob_store.materialize(image.sha256, image.target_file)
+        if model is not None and self._pool.sidecar:
+            self.write(image.target_file, model)
+        return True
+
+    def close(self) -> None:
+        """
+        Close the batch. No more writes may be scheduled after this call.
+        :return: None
+        """
+        self.finish(True)
+
+    def abort(self) -> None:
+        """
+        Close the batch without invoking the completion callback, e.g. because the submission could not be downloaded completely.
+        Writes that have already been scheduled are still executed.
+        :return: None
+        """
+        self.finish(False)
+
+    def finish(self, success: bool) -> None:
+        """
+        Finish a single write of the batch, or the batch itself, see close() and abort().
+        This is called by the pool after every write.
+        :param success: False, if the write failed or the batch has been aborted
+        :return: None
+        """
+        with self._lock:
+            self._pending -= 1
+            self._failed = self._failed or not success
+            complete: bool = self._pending == 0 and not self._failed
+        if complete and self._on_complete is not None:
+            self._on_complete()
+
+
+class MetadataWriterPool:
+    """
+    A pool of worker threads that write metadata to image files, fed by a bounded queue.
+    If the number of workers is zero, all metadata is written synchronously on the calling thread.
+    """
+
+    def __init__(self, workers: int, queue_size: int, sidecar: bool = False, blob_store: Optional[BlobStore] = None,
+                 recompressor: Optional[Recompressor] = None, library: Optional[ImageDatabase] = None, max_queued_bytes: int = 0,
+                 naming: Optional[NamingIndex] = None) -> None:
+        """
+        Init a new Metadata Writer Pool and start its workers.
+        :param workers: Number of worker threads
+        :param queue_size: Maximum number of pending writes before submit() blocks
+        :param sidecar: If True, write the metadata to XMP sidecar files and leave the images untouched
+        :param blob_store: If given, add all written files to this blob store
+        :param recompressor: If given, losslessly recompress all written images with this Recompressor, after their metadata has been
+                             written. Images are not recompressed if a blob store is given, since blobs are stored under the digest
+                             of the downloaded bytes
+        :param library: If given, store the perceptual hashes of all successfully written images in this library.
+                        All lookups and stores of the library are serialized by the pool, since the workers store concurrently
+        :param max_queued_bytes: If greater than 0, submit() also blocks while the images that are kept in memory by the pending writes
+                                 would exceed this number of bytes. A single larger image is queued once the queue is empty
+        :param naming: If given, release the names of the files that could not be written in this naming index
+        """
+        self.sidecar: bool = sidecar
+        self.blob_store: Optional[BlobStore] = blob_store
+        self.recompressor: Optional[Recompressor] = recompressor
+        self._queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.library: Optional[ImageDatabase] = library
+        self.naming: Optional[NamingIndex] = naming
+        self._lock: threading.Lock = threading.Lock()
+        self._space: threading.Condition = threading.Condition(self._lock)
+        self.max_queued_bytes: int = max_queued_bytes
+        self._queued_bytes: int = 0
+        """The number of bytes of the images that are kept in memory by the pending writes"""
+        self._pending_hashes: dict[str, int] = {}
+        """The perceptual hashes of the images that are being written, with the number of pending writes of each"""
+        self._pending_digests: dict[str, int] = {}
+        """The digests of the images that are being written to the blob store, with the number of pending writes of each"""
+        self.completed: int = 0
+        """The number of files that have successfully been written"""
+        self.failed: int = 0
+        """The number of files that could not be written"""
+        self._workers: list[threading.Thread] = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name=f"MetadataWriter-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def batch(self, on_complete: Optional[Callable[[], None]] = None) -> MetadataWriteBatch:
+        """
+        Create a new batch of writes
+        :param on_complete: Callback to invoke once all writes of the batch succeeded
+        :return: the batch
+        """
+        return MetadataWriteBatch(self, on_complete)
+
+    def submit(self, target_file: Path, model: Optional[MetadataModel], batch: MetadataWriteBatch, data: Optional[bytes] = None,
+               digest: Optional[str] = None, on_written: Optional[Callable[[], None]] = None, phash: Optional[Any] = None) -> None:
+        """
+        Submit a single write. Use MetadataWriteBatch.write() instead of calling this directly.
+        :param target_file: File to write
+        :param model: Metadata to write, or None
+        :param batch: The batch the write belongs to
+        :param data: The image bytes, if the image has not been written to the target file yet
+        :param digest: The SHA-256 digest of the downloaded bytes, if the file shall be added to the blob store
+        :param on_written: Callback to invoke once the file has been written successfully
+        :param phash: The perceptual hash to store in the library once the file has been written successfully, or None
+        :return: None
+        """
+        with self._lock:
+            if phash is not None:
+                self._pending_hashes[str(phash)] = self._pending_hashes.get(str(phash), 0) + 1
+            if digest is not None and self.blob_store is not None:
+                self._pending_digests[digest] = self._pending_digests.get(digest, 0) + 1
+        if self._workers:
+            with metrics.time("metadata_queue_wait"):
+                if data is not None:
+                    with self._space:
+                        self._space.wait_for(lambda: self.max_queued_bytes <= 0 or self._queued_bytes == 0 or
+                                             self._queued_bytes + len(data) <= self.max_queued_bytes)
+                        self._queued_bytes += len(data)
+                self._queue.put((target_file, model, batch, data, digest, on_written, phash))
+        else:
+            self._write(target_file, model, batch, data, digest, on_written, phash)
+
+    def hash_known(self, phash: Any) -> bool:
+        """
+        Check if an image with the given perceptual hash is stored in the library, or is currently being written
+        :param phash: Perceptual hash
+        :return: True, if the hash is known
+        """
+        with self._lock:
+            if str(phash) in self._pending_hashes:
+                return True
+            return self.library is not None and self.library.hash_in_hashes(phash)
+
+    def digest_pending(self, digest: str) -> bool:
+        """
+        Check if an image with the given digest is currently being written and will be added to the blob store
+        :param digest: Hex SHA-256 digest of the downloaded bytes
+        :return: True, if the digest is pending
+        """
+        with self._lock:
+            return digest in self._pending_digests
+
+    def close(self) -> None:
+        """
+        Wait for all pending writes to finish and stop the workers.
+        :return: None
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._write(*job)
+            data: Optional[bytes] = job[3]
+            if data is not None:
+                with self._space:
+                    self._queued_bytes -= len(data)
+                    self._space.notify_all()
+
+    def _write(self, target_file: Path, model: Optional[MetadataModel], batch: MetadataWriteBatch, data: Optional[bytes],
+               digest: Optional[str], on_written: Optional[Callable[[], None]], phash: Optional[Any]) -> None:
+        try:
+            with metrics.time("metadata_write"):
+                if model is None:
+                    if data is not None:
+                        target_file.write_bytes(data)
+                elif self.sidecar:
+                    if data is not None:
+                        target_file.write_bytes(data)
+                    write_xmp_sidecar(target_file, *model)
+                elif not can_embed_metadata(data if data is not None else target_file):
+                    # Downloading the image again would fail the same way
+                    print(f"Metadata cannot be embedded into {target_file}, it is stored without metadata.", file=sys.stderr)
+                    if data is not None:
+                        target_file.write_bytes(data)
+                elif data is not None:
+                    target_file.write_bytes(write_metadata_to_bytes(data, *model))
+                else:
+                    write_metadata(target_file, *model)
+        except Exception as e:
+            print(f"Could not write metadata to {target_file}, it will be downloaded again: {e}", file=sys.stderr)
+            # The URL is not committed, so the next attempt stores the image again, and its hash must not be known until then
+            target_file.unlink(missing_ok=True)
+            if self.naming is not None:
+                self.naming.release(target_file)
+            with self._lock:
+                self._forget_pending(phash, digest)
+                self.failed += 1
+            batch.finish(False)
+        else:
+            if self.recompressor is not None and self.blob_store is None and (data is not None or digest is not None):
+                # Only downloaded images, linked blobs are shared with other files
+                self.recompressor.recompress(target_file)
+            if digest is not None and self.blob_store is not None:
+                try:
+                    self.blob_store.adopt(target_file, digest)
+                    # Another image with the same bytes might have been stored first
+                    self.blob_store.materialize(digest, target_file)
+                except OSError as e:
+                    print(f"Could not add {target_file} to the blob store: {e}", file=sys.stderr)
+            if phash is not None and self.library is not None:
+                try:
+                    with self._lock:
+                        self.library.store_image(target_file, phash)
+                except Exception as e:
+                    print(f"Could not store the perceptual hash of {target_file} in the library: {e}", file=sys.stderr)
+            with self._lock:
+                self._forget_pending(phash, digest)
+                self.completed += 1
+            if on_written is not None:
+                try:
+                    on_written()
+                except Exception as e:
+                    print(f"Could not record that {target_file} has been written: {e}", file=sys.stderr)
+            batch.finish(True)
+
+    def _forget_pending(self, phash: Optional[Any], digest: Optional[str]) -> None:
+        """Remove a finished write from the pending hashes and digests. The lock must be held"""
+        for pending, key in ((self._pending_hashes, str(phash) if phash is not None else None),
+                             (self._pending_digests, digest if self.blob_store is not None else None)):
+            if key is None:
+                continue
+            pending[key] -= 1
+            if pending[key] == 0:
+                del pending[key]
@@ -0,0 +1,39 @@
+"""
+This module contains a helper to run the tasks of the bulk tools in a process pool without holding all of them in memory
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def imap_windowed(fn: Callable[..., Any], tasks: Iterable[tuple[T, tuple]], workers: Optional[int] = None,
+                  window_per_worker: int = 8) -> Iterator[tuple[T, Future]]:
+    """
+    Execute the given function for all given tasks in a process pool. The tasks are taken from the iterable only while fewer than
+    window_per_worker tasks per worker are pending, so tasks that are produced lazily are never all held in memory at once.
+    If the iterator is closed early, e.g. by a KeyboardInterrupt, all pending tasks that have not been started are cancelled.
+    :param fn: Function to execute in the worker processes. It must be picklable
+    :param tasks: The key of every task, which is yielded with its result, and the arguments of the function
+    :param workers: Number of worker processes, or None to use one per CPU
+    :param window_per_worker: Maximum number of pending tasks per worker process
+    :return: an iterator over the keys and the futures of all finished tasks, in the order they finished
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        max_pending: int = (workers or os.cpu_count() or 1) * window_per_worker
+        pending: dict[Future, T] = {}
+        try:
+            for key, args in tasks:
+                pending[executor.submit(fn, *args)] = key
+                if len(pending) >= max_pending:
+                    done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future
+            while pending:
+                done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+        finally:
+            for future in pending:
+                future.cancel()
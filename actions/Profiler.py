@@ -0,0 +1,195 @@
+"""
+This module contains a profiler that can be started and stopped while the scraper is running, e.g. with SIGUSR1,
+and that attributes the time spent by all threads to the stages recorded by the metrics registry
+"""
+import cProfile
+import io
+import pstats
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+from actions.Instrumentation import metrics
+
+_MAX_STACK_DEPTH: int = 40
+"""The number of innermost frames of every sampled stack that are recorded"""
+
+
+def _thread_group(name: str) -> str:
+    """Get the name of the pool a thread belongs to, e.g. "MetadataWriter" for "MetadataWriter-1\""""
+    return re.sub(r"[-_]\d+$", "", name)
+
+
+def _frame_label(frame: FrameType) -> str:
+    return f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})"
+
+
+class Profiler:
+    """
+    A profiler for live runs, which combines three views, since cProfile only observes the thread it has been enabled on:
+    cProfile statistics of the main thread, stack samples of all threads attributed to the stage each thread is executing,
+    and the top allocators recorded by tracemalloc.
+    All views are written to a new subdirectory of the output directory when the profiler is stopped.
+    """
+
+    def __init__(self, output_dir: Path, sample_interval: float = 0.01) -> None:
+        """
+        Init a new, stopped profiler
+        :param output_dir: Directory to write the profiles into
+        :param sample_interval: Seconds between two stack samples
+        """
+        super().__init__()
+        self.output_dir: Path = output_dir
+        self.sample_interval: float = sample_interval
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop: threading.Event = threading.Event()
+        self._stages: Counter = Counter()
+        """The number of samples per thread group and stage"""
+        self._stacks: Counter = Counter()
+        """The number of samples per thread group, stage and stack, in the folded format of flame graph tools"""
+        self._samples: int = 0
+        self._started: float = 0.0
+        self._started_tracemalloc: bool = False
+        self._dumper: Optional[threading.Thread] = None
+        """The thread that writes the views of the previous run, see toggle()"""
+
+    @property
+    def active(self) -> bool:
+        """
+        Check if the profiler is running
+        :return: True, if the profiler is running
+        """
+        return self._profile is not None
+
+    def start(self) -> None:
+        """
+        Start profiling. The cProfile statistics are collected for the calling thread, which should be the main thread
+        :return: None
+        """
+        if self.active:
+            return
+        if self._dumper is not None:
+            self._dumper.join()  # It still reads the samples of the previous run
+            self._dumper = None
+        self._stages.clear()
+        self._stacks.clear()
+        self._samples = 0
+        self._started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name="ProfilerSampler", daemon=True)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Optional[Path]:
+        """
+        Stop profiling and write all views. Must be called on the thread that has started the profiler
+        :return: the directory the profile has been written into, or None, if the profiler was not running
+        """
+        if not self.active:
+            return None
+        profile: cProfile.Profile = self._profile
+        profile.disable()
+        self._profile = None
+        return self._dump(profile)
+
+    def toggle(self) -> None:
+        """
+        Start the profiler if it is stopped, else stop it and write all views.
+        Writing happens on a separate thread, so this can be called from a signal handler
+        :return: None
+        """
+        if not self.active:
+            self.start()
+            print("Profiling started, send the same signal again to stop it.", file=sys.stderr)
+            return
+        profile: cProfile.Profile = self._profile
+        profile.disable()
+        self._profile = None
+        self._dumper = threading.Thread(target=self._dump, args=(profile,), name="ProfilerDump", daemon=False)
+        self._dumper.start()
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", 0)) -> bool:
+        """
+        Toggle the profiler whenever the given signal is received
+        :param signum: Signal number, SIGUSR1 by default
+        :return: True, if the handler has been installed, False, if the platform does not support the signal
+        """
+        if not signum:
+            return False
+        signal.signal(signum, lambda s, f: self.toggle())
+        return True
+
+    def _sample(self) -> None:
+        own: int = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            names: dict[int, str] = {thread.ident: _thread_group(thread.name) for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread: str = names.get(ident, str(ident))
+                stage: str = "/".join(metrics.active.get(ident) or ()) or "-"
+                self._stages[(thread, stage)] += 1
+                frames: list[str] = []
+                while frame is not None and len(frames) < _MAX_STACK_DEPTH:
+                    frames.append(_frame_label(frame))
+                    frame = frame.f_back
+                self._stacks[";".join([thread, stage] + frames[::-1])] += 1
+            self._samples += 1
+
+    def _dump(self, profile: cProfile.Profile) -> Path:
+        """Stop the sampler and write all views into a new directory"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        elapsed: float = time.perf_counter() - self._started
+        self.output_dir.mkdir(exist_ok=True, parents=True)
+        # The random suffix keeps profiles that are written within the same second apart
+        target_dir: Path = Path(tempfile.mkdtemp(prefix=time.strftime("profile-%Y%m%d-%H%M%S-"), dir=self.output_dir))
+
+        profile.dump_stats(target_dir / "main_thread.prof")
+        report: io.StringIO = io.StringIO()
+        stats: pstats.Stats = pstats.Stats(profile, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(40)
+        (target_dir / "main_thread.txt").write_text(report.getvalue())
+
+        lines: list[str] = [f"{self._samples} samples in {elapsed:.1f}s, every {self.sample_interval * 1000:.0f}ms. "
+                            f"The share of a pool is the sum of the shares of its threads",
+                            f"{'Thread':<24}{'Stage':<48}{'Samples':>8}{'Share':>8}"]
+        for (thread, stage), count in sorted(self._stages.items(), key=lambda item: (item[0][0], -item[1])):
+            lines.append(f"{thread:<24}{stage:<48}{count:>8}{count / max(self._samples, 1):>8.0%}")
+        (target_dir / "stages.txt").write_text("\n".join(lines) + "\n")
+        (target_dir / "stacks.folded").write_text("".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common()))
+
+        # A snapshot of what every thread is doing right now
+        names: dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+        snapshot: list[str] = []
+        for ident, frame in sys._current_frames().items():
+            stage: str = "/".join(metrics.active.get(ident) or ()) or "-"
+            snapshot.append(f"Thread {names.get(ident, ident)} in stage {stage}:\n{''.join(traceback.format_stack(frame))}")
+        (target_dir / "threads.txt").write_text("\n".join(snapshot))
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            allocations: list[str] = [f"Traced memory: {current / 1024 / 1024:.1f} MB, peak {peak / 1024 / 1024:.1f} MB"]
+            allocations.extend(str(statistic) for statistic in tracemalloc.take_snapshot().statistics("lineno")[:30])
+            (target_dir / "allocations.txt").write_text("\n".join(allocations) + "\n")
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        print(f"Profile written to {target_dir}", file=sys.stderr)
+        return target_dir
@@ -0,0 +1,166 @@
+"""
+This module contains a lossless recompression stage for stored images, which re-optimizes JPEGs and PNGs
+without touching their pixels or their metadata
+"""
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from config import Config
+
+from actions.Instrumentation import metrics
+from actions.WriteMetadata import is_sidecar_mode
+
+_PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+
+_TOOLS: dict[str, list[tuple[str, list[str]]]] = {
+    "jpeg": [("jpegtran", ["-copy", "all", "-optimize", "-outfile", "{output}", "{input}"])],
+    "png": [("oxipng", ["-q", "-o", "2", "--out", "{output}", "{input}"]),
+            ("optipng", ["-quiet", "-o2", "-out", "{output}", "{input}"])],
+}
+"""The external tools that losslessly recompress every format, in order of preference, with their arguments.
+All of them keep the metadata of the image"""
+
+
+def _image_format(image_file: Path) -> Optional[str]:
+    with image_file.open("rb") as f:
+        magic: bytes = f.read(8)
+    if magic.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if magic == _PNG_SIGNATURE:
+        return "png"
+    return None
+
+
+def redeflate_png(data: bytes) -> Optional[bytes]:
+    """
+    Recompress the image data of the given PNG with the best zlib compression, merging all IDAT chunks into one.
+    All other chunks, including the metadata, are kept unchanged and in order.
+    :param data: The PNG file
+    :return: the recompressed PNG file, or None, if it is not a valid PNG file
+    """
+    if not data.startswith(_PNG_SIGNATURE):
+        return None
+    chunks: list[tuple[bytes, bytes]] = []
+    idat: list[bytes] = []
+    offset: int = len(_PNG_SIGNATURE)
+    while offset + 12 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        body: bytes = data[offset + 8:offset + 8 + length]
+        if len(body) != length:
+            return None
+        if chunk_type == b"IDAT":
+            if not idat:
+                chunks.append((chunk_type, b""))  # Placeholder for the merged chunk
+            idat.append(body)
+        else:
+            chunks.append((chunk_type, body))
+        offset += 12 + length
+        if chunk_type == b"IEND":
+            break
+    if not idat or chunks[-1][0] != b"IEND":
+        return None
+    try:
+        raw: bytes = zlib.decompress(b"".join(idat))
+    except zlib.error:
+        return None
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9)
+    compressed: bytes = compressor.compress(raw) + compressor.flush()
+    out: list[bytes] = [_PNG_SIGNATURE]
+    for chunk_type, body in chunks:
+        if chunk_type == b"IDAT":
+            body = compressed
+        out.append(struct.pack(">I4s", len(body), chunk_type) + body + struct.pack(">I", zlib.crc32(chunk_type + body)))
+    return b"".join(out)
+
+
+class Recompressor:
+    """
+    Losslessly recompresses stored images in place. JPEGs are recompressed with jpegtran, which optimizes their Huffman tables,
+    and PNGs with oxipng or optipng, or, if neither is installed, by re-deflating their image data with zlib.
+    The pixels and all metadata are kept, so perceptual hashes stay valid. Files are only replaced if they became smaller.
+    """
+
+    def __init__(self, tools: Optional[list[str]] = None, timeout: float = 300.0) -> None:
+        """
+        Init a new Recompressor with the installed external tools
+        :param tools: Names of the external tools that may be used, or None to use all supported tools that are installed
+        :param timeout: Seconds after which an external tool is killed
+        """
+        super().__init__()
+        self.timeout: float = timeout
+        self.commands: dict[str, list[str]] = {}
+        """The command line of the tool that is used for every format, with {input} and {output} placeholders"""
+        for image_format, candidates in _TOOLS.items():
+            for name, args in candidates:
+                executable: Optional[str] = shutil.which(name) if tools is None or name in tools else None
+                if executable is not None:
+                    self.commands[image_format] = [executable] + args
+                    break
+        if "jpeg" not in self.commands and (tools is None or "jpegtran" in tools):
+            print("jpegtran is not installed, JPEG images will not be recompressed.", file=sys.stderr)
+        self._lock: threading.Lock = threading.Lock()
+        self.recompressed: int = 0
+        """The number of files that have been replaced by a smaller version"""
+        self.saved_bytes: int = 0
+        """The number of bytes that have been saved in total"""
+
+    @staticmethod
+    def from_config(cfg: Config) -> Optional["Recompressor"]:
+        """
+        Create the Recompressor that is configured in the given configuration.
+        In the sidecar metadata mode, images are left untouched, so they are not recompressed either
+        :param cfg: The global configuration
+        :return: the Recompressor, or None, if recompression is disabled
+        """
+        if not cfg.get("reddit_downloader.recompress_images", False) or is_sidecar_mode(cfg):
+            return None
+        return Recompressor(list(cfg.get("reddit_downloader.recompress_tools", [])) or None)
+
+    def recompress(self, image_file: Path) -> int:
+        """
+        Losslessly recompress the given image file in place. Errors are printed and leave the file untouched
+        :param image_file: Image file to recompress
+        :return: the number of bytes that have been saved
+        """
+        tmp_file: Path = image_file.with_name(f".{image_file.name}.recompress.tmp")
+        try:
+            with metrics.time("recompress"):
+                image_format: Optional[str] = _image_format(image_file)
+                if image_format is None:
+                    return 0
+                size: int = image_file.stat().st_size
+                command: Optional[list[str]] = self.commands.get(image_format)
+                if command is not None:
+                    tmp_file.unlink(missing_ok=True)
+                    subprocess.run([arg.format(input=image_file.as_posix(), output=tmp_file.as_posix()) for arg in command],
+                                   check=True, timeout=self.timeout, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE)
+                elif image_format == "png":
+                    recompressed: Optional[bytes] = redeflate_png(image_file.read_bytes())
+                    if recompressed is None:
+                        return 0
+                    tmp_file.write_bytes(recompressed)
+                else:
+                    return 0
+                saved: int = size - tmp_file.stat().st_size if tmp_file.exists() else 0
+                if saved <= 0:
+                    return 0
+                os.replace(tmp_file, image_file)
+        except Exception as e:  # e.g. a MemoryError while re-deflating a large PNG, which must not kill the metadata writer
+            print(f"Could not recompress {image_file}: {e!r}", file=sys.stderr)
+            return 0
+        finally:
+            tmp_file.unlink(missing_ok=True)
+        metrics.count("recompressed_images")
+        metrics.count("recompress_saved_bytes", saved)
+        with self._lock:
+            self.recompressed += 1
+            self.saved_bytes += saved
+        return saved
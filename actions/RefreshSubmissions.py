@@ -0,0 +1,169 @@
+"""
+This module contains functions to refresh the scores of already downloaded submissions in their metadata,
+looking them up by their fullnames in batches instead of listing their subreddits and users again
+"""
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+import praw
+import pyexiv2
+from config import Config
+
+from actions.ImportLibrary import find_images
+from actions.Instrumentation import metrics
+from actions.ProcessPool import imap_windowed
+from actions.WriteMetadata import MetadataModel, get_upvotes_comment, set_long_comment, write_metadata, write_xmp_sidecar, \
+    get_sidecar_file, is_sidecar_mode
+from database import SubmissionArchive
+
+_INFO_BATCH_SIZE: int = 100
+"""The maximum number of fullnames the Reddit API accepts in a single info request"""
+
+_UPVOTES_COMMENT: re.Pattern = re.compile(r"-?\d+ upvotes \([^)]*%\), \d+ comments\.")
+"""The part of the long comment that is written by get_upvotes_comment()"""
+
+_PERMALINK_ID: re.Pattern = re.compile(r"/comments/(\w+)")
+
+
+def fetch_submissions(reddit: praw.reddit.Reddit, submission_ids: Iterable[str]) -> Iterator[Any]:
+    """
+    Look up the current state of the given submissions, with one request per 100 submissions
+    :param reddit: The praw Reddit instance
+    :param submission_ids: IDs of the submissions, without the "t3_" prefix
+    :return: an iterator over the submissions that still exist
+    """
+    batch: list[str] = []
+    for submission_id in submission_ids:
+        batch.append(f"t3_{submission_id}")
+        if len(batch) == _INFO_BATCH_SIZE:
+            yield from _fetch_batch(reddit, batch)
+            batch = []
+    if batch:
+        yield from _fetch_batch(reddit, batch)
+
+
+def _fetch_batch(reddit: praw.reddit.Reddit, fullnames: list[str]) -> list[Any]:
+    with metrics.time("reddit_info"):
+        return list(reddit.info(fullnames=fullnames))
+
+
+def _read_comment(image_file: Path, sidecar: bool) -> Optional[str]:
+    """Read the long comment of the given image from its sidecar file or from the image itself"""
+    metadata_file: Path = get_sidecar_file(image_file) if sidecar else image_file
+    if not metadata_file.is_file():
+        return None
+    with pyexiv2.Image(metadata_file.as_posix()) as metadata:
+        return metadata.read_xmp().get("Xmp.xmpDM.comment")
+
+
+def _refresh_job(image_files: list[str], upvotes_comment: str, sidecar: bool) -> list[tuple[str, Optional[bool], Optional[str]]]:
+    """
+    Replace the score in the long comment of the given images. This function is executed in a worker process.
+    :return: the file, whether it has been rewritten (None, if it does not contain a score), and an error message or None, for every image
+    """
+    results: list[tuple[str, Optional[bool], Optional[str]]] = []
+    for image_file in image_files:
+        try:
+            comment: Optional[str] = _read_comment(Path(image_file), sidecar)
+            if comment is None or not _UPVOTES_COMMENT.search(comment):
+                results.append((image_file, None, None))
+                continue
+            refreshed: str = _UPVOTES_COMMENT.sub(upvotes_comment, comment, count=1)
+            if refreshed == comment:
+                results.append((image_file, False, None))
+                continue
+            model: MetadataModel = set_long_comment(({}, {}, {}), refreshed)
+            if sidecar:
+                write_xmp_sidecar(Path(image_file), *model)
+            else:
+                write_metadata(Path(image_file), *model)
+            results.append((image_file, True, None))
+        except Exception as e:
+            results.append((image_file, None, str(e)))
+    return results
+
+
+def _read_submission_id(image_file: str, sidecar: bool) -> tuple[str, Optional[str]]:
+    """Read the ID of the submission of the given image from its metadata. This function is executed in a worker process."""
+    try:
+        with pyexiv2.Image((get_sidecar_file(Path(image_file)) if sidecar else Path(image_file)).as_posix()) as metadata:
+            submission_id: Optional[re.Match] = _PERMALINK_ID.search(metadata.read_xmp().get("Xmp.dc.source", ""))
+    except Exception:
+        return image_file, None
+    return image_file, submission_id.group(1) if submission_id is not None else None
+
+
+def collect_submission_files(destination: Path, archive: SubmissionArchive, sidecar: bool, workers: Optional[int] = None) \
+        -> tuple[dict[str, list[Path]], dict[str, dict[str, Any]]]:
+    """
+    Collect the images of every submission in the given destination directory from the Submission Archive,
+    or from the metadata of the images, if there is no archive
+    :param destination: Destination directory the images have been scraped into
+    :param archive: The Submission Archive of the destination directory
+    :param sidecar: True, if the metadata has been written to sidecar files
+    :param workers: Number of worker processes to read the metadata with, or None to use one per CPU
+    :return: the existing image files by submission ID, and the archived submission records by ID
+    """
+    files: dict[str, list[Path]] = {}
+    if archive.archive_file.is_file():
+        submissions, _, images = archive.load()
+        for file, record in images.items():
+            image_file: Path = archive.resolve(file)
+            if image_file.is_file():
+                files.setdefault(record["submission"], []).append(image_file)
+        return files, submissions
+    print(f"No submission archive found at {archive.archive_file}, reading the submissions from the metadata of all images.")
+    with ProcessPoolExecutor(workers) as executor:
+        image_files: list[str] = [image_file.as_posix() for image_file in find_images(destination)]
+        for image_file, submission_id in executor.map(_read_submission_id, image_files, [sidecar] * len(image_files), chunksize=64):
+            if submission_id is not None:
+                files.setdefault(submission_id, []).append(Path(image_file))
+    return files, {}
+
+
+def refresh_submissions(destination: Path, cfg: Config, reddit: praw.reddit.Reddit, workers: Optional[int] = None) -> int:
+    """
+    Refresh the score, upvote ratio and number of comments in the metadata of all images in the given destination directory.
+    The submissions are looked up in batches of 100 fullnames, and only the long comments of images whose score changed are rewritten.
+    The refreshed submissions are recorded in the Submission Archive, so later metadata backfills keep the current scores.
+    :param destination: Destination directory the images have been scraped into
+    :param cfg: Global Config
+    :param reddit: The praw Reddit instance
+    :param workers: Number of worker processes, or None to use one per CPU
+    :return: the number of images whose metadata has been rewritten
+    """
+    sidecar: bool = is_sidecar_mode(cfg)
+    archive: SubmissionArchive = SubmissionArchive(destination / cfg.get("reddit_downloader.submission_archive_file", "submissions.jsonl"))
+    files, records = collect_submission_files(destination, archive, sidecar, workers)
+    print(f"Refreshing {len(files)} submissions with {sum(len(f) for f in files.values())} images "
+          f"in {(len(files) + _INFO_BATCH_SIZE - 1) // _INFO_BATCH_SIZE} requests")
+
+    written: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+    def tasks() -> Iterator[tuple[str, tuple]]:
+        for submission in fetch_submissions(reddit, list(files.keys())):
+            # The archive may be newer than the metadata, e.g. after a listing, so the score is compared in every image
+            record: Optional[dict[str, Any]] = records.get(submission.id)
+            if archive.archive_file.is_file():
+                archive.add_submission(submission, record.get("target") if record is not None else None)
+            yield submission.id, ([f.as_posix() for f in files[submission.id]], get_upvotes_comment(submission), sidecar)
+
+    try:
+        for _, future in imap_windowed(_refresh_job, tasks(), workers):
+            for image_file, rewritten, error in future.result():
+                if error is not None:
+                    print(f"Could not refresh the metadata of {image_file}: {error}", file=sys.stderr)
+                    failed += 1
+                elif rewritten:
+                    written += 1
+                else:
+                    unchanged += 1
+    finally:
+        archive.close()
+    print(f"Refreshed the metadata of {written} images, {unchanged} images were up to date, {failed} images failed.")
+    return written
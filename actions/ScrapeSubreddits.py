@@ -1,7 +1,10 @@
 import sys
+import threading
+import time
 from collections import namedtuple
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Iterable, Iterator, Optional
 from urllib.parse import urlparse
 
 import praw
@@ -10,17 +13,340 @@ from imagehashsort import ImageDatabase
 from praw.models import Submission, Redditor
 from prawcore import NotFound, PrawcoreException
 
-from actions.downloader import ImgurAlbumDownloader, Downloader, HTTPDownloader
-from database import URLManager
+from actions.Instrumentation import metrics
+from actions.MetadataWriter import MetadataWriterPool, MetadataWriteBatch
+from actions.Recompress import Recompressor
+from actions.WriteMetadata import is_sidecar_mode
+from actions.downloader import ImgurAlbumDownloader, Downloader, HTTPDownloader, RedditGalleryDownloader, BandwidthLimiter, Throttle
+from actions.downloader.Transfer import classify_failure
+from database import URLManager, SubmissionArchive, ArchivedSubmission, BlobStore, NamingIndex, JobQueue, Job, FailureCache, \
+    ListingCache
 from reddit import RedditObject, Subreddit, User, SortMethod, UserPageKind
 
 
-# TODO
-# # handle 'ctrl + c' if downloads takes too long
-#     def sigint_handler(signum, frame):
-#         print('\nQuitting...')
-#         sys.exit(1)
-#     signal.signal(signal.SIGINT, sigint_handler)
+STORAGE_MODES: tuple[str, ...] = ("files", "blobs")
+"""All supported values of reddit_downloader.storage_mode"""
+
+
+def is_blob_storage(cfg: Config) -> bool:
+    """
+    Check if the configured storage mode stores identical images only once, in the blob store
+    :param cfg: The global configuration
+    :return: True for the 'blobs' mode, False for the 'files' mode
+    :raises ValueError: if the configured storage mode is unknown, or if it is 'blobs' and the metadata mode is not sidecar.
+                        All links of a blob share its file, so metadata that is embedded by the scraper, or later by a backfill
+                        or refresh, would end up in every duplicate and the blob would no longer match its digest
+    """
+    mode: str = cfg.get("reddit_downloader.storage_mode", "files")
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {mode}, expected one of {', '.join(STORAGE_MODES)}")
+    if mode == "blobs" and not is_sidecar_mode(cfg):
+        raise ValueError("The storage mode blobs requires the metadata mode sidecar")
+    return mode == "blobs"
+
+
+def _commit_url(urlmanager: URLManager, url: str, on_done: Optional[Callable[[], None]] = None) -> None:
+    """Commit a downloaded URL to the URL history"""
+    with metrics.time("db_commit"):
+        urlmanager.add_url_to_database(url)
+    if on_done is not None:
+        on_done()
+
+
+def _get_downloader(url: str) -> Optional[Downloader]:
+    """Get the downloader for the given submission URL, or None if the URL is not supported"""
+    if "imgur.com/a/" in url or "imgur.com/gallery/" in url:
+        return ImgurAlbumDownloader()
+    elif "reddit.com/gallery/" in url:
+        return RedditGalleryDownloader()
+    elif '://i.imgur.com/' in url or '://i.redd.it' in url:
+        return HTTPDownloader()
+    return None
+
+
+def _download_submission(submission: Any, count: int, target: str, cfg: Config, destination: Path, urlmanager: URLManager,
+                         library: ImageDatabase, archive: SubmissionArchive, naming: NamingIndex, metadata_writer: MetadataWriterPool,
+                         job: Optional[Job] = None, failures: Optional[FailureCache] = None, throttle: Optional[Throttle] = None) -> int:
+    """
+    Download a single submission, unless its URL has already been downloaded, is not supported, or failed before
+    :param submission: praw Submission or ArchivedSubmission
+    :param count: The number of images that have been downloaded so far
+    :param target: The printable name of the RedditObject that is scraped
+    :param destination: Destination directory of the RedditObject
+    :param metadata_writer: The pool to write metadata with
+    :param job: If given, the Job Queue job of the submission, which is completed once the submission has been processed completely,
+                i.e. its URL has been committed, or it has been skipped
+    :param failures: If given, skip URLs that are gone or are waiting to be retried, and record download failures in this cache.
+                     Failed URLs are never committed to the URL history
+    :param throttle: If given, limit the bandwidth of the image transfers with this throttle
+    :return: the number of downloaded images, including the ones whose metadata is still being written.
+             If such a write fails, the image is deleted and the whole submission is downloaded again by the next attempt
+    """
+    on_done: Optional[Callable[[], None]] = job.complete if job is not None else None
+    u: namedtuple = urlparse(submission.url)
+    """The parts of the URL"""
+    with metrics.time("url_lookup"):
+        known: bool = urlmanager.parsed_url_already_in_database(u)
+    downloader: Optional[Downloader] = _get_downloader(submission.url) if not known else None
+    blocked: Optional[str] = failures.blocked(submission.url) if failures is not None and downloader is not None else None
+    if downloader is None or blocked is not None:
+        if known:
+            print(f"Skipping URL {submission.url} because it has already been downloaded before.")
+        elif blocked is not None:
+            print(f"Skipping URL {submission.url} because {blocked}.")
+        if on_done is not None:
+            on_done()
+        return 0  # Unsupported URL
+    if isinstance(downloader, HTTPDownloader):
+        print(f'Downloading image {count} from {target} {submission.url}')
+    # The URL is only committed after all metadata of the submission has been written successfully
+    batch: MetadataWriteBatch = metadata_writer.batch(partial(_commit_url, urlmanager, submission.url, on_done))
+    try:
+        with metrics.context(type(downloader).__name__):
+            downloaded: int = downloader.download(submission, cfg, destination, urlmanager, library, batch, archive, naming, job, throttle)
+    except Exception as e:
+        permanent: Optional[bool] = classify_failure(e)
+        if permanent is None:
+            raise
+        batch.abort()
+        print(f"{submission.url} could not be downloaded{' and will not be retried' if permanent else ''}: {e}", file=sys.stderr)
+        metrics.count("failed_downloads")
+        if failures is not None:
+            failures.record(submission.url, permanent, str(e))
+        if on_done is not None:
+            on_done()
+        return 0
+    batch.close()
+    if failures is not None:
+        failures.forget(submission.url)
+    return downloaded
+
+
+def _list_into_queue(results: Iterable, target: str, listing: str, queue: JobQueue, urlmanager: URLManager,
+                     archive: SubmissionArchive, failures: Optional[FailureCache], stop: threading.Event, limit_reached: threading.Event,
+                     backlog_full: Callable[[], bool], errors: list[BaseException]) -> None:
+    """
+    Fetch the listing and queue all new submissions, until the listing ends or the stop event is set.
+    The listing is paused while the queued submissions cover the rest of the limit.
+    If the listing is stopped because the limit has been reached, the next listing starts from the beginning, so new submissions are
+    not delayed behind the rest of this one. Otherwise, it continues where this one has been interrupted.
+    """
+    finished: bool = False
+    try:
+        submission: Submission
+        for submission in metrics.timed_iter("listing", results):
+            while backlog_full() and not stop.is_set():
+                stop.wait(0.1)
+            if stop.is_set():
+                break
+            metrics.count("submissions_seen")
+            archive.add_submission(submission, target)
+            if urlmanager.url_already_in_database(submission.url):
+                print(f"Skipping URL {submission.url} because it has already been downloaded before.")
+                queue.advance_listing(listing, submission.fullname)
+            elif _get_downloader(submission.url) is not None and (failures is None or failures.blocked(submission.url) is None):
+                queue.enqueue(submission.id, target, archive.submission_to_record(submission, target), listing, submission.fullname)
+            else:
+                queue.advance_listing(listing, submission.fullname)
+        else:
+            finished = True
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        queue.release_listing(listing, finished or limit_reached.is_set())
+
+
+def _scrape_from_queue(listing_from: Callable[[Optional[str]], Iterable], listing: str, target: str, limit: Optional[int],
+                       queue: JobQueue, poll_seconds: float, urlmanager: URLManager, archive: SubmissionArchive,
+                       failures: Optional[FailureCache], download: Callable[..., int]) -> None:
+    """
+    Scrape a RedditObject through the given Job Queue, which may be shared with other scraper processes.
+    Submissions that are still queued, e.g. from an interrupted run, are downloaded first.
+    Then the process that claims the listing fetches it in the background, continuing where a previous listing has been interrupted,
+    and queues all new submissions, while all processes download the queued submissions.
+    The listing is paused while the queued submissions of the target cover the rest of the limit.
+    :param listing_from: Function that returns the praw listing of the RedditObject, starting after the given fullname
+    :param listing: The key of the listing, i.e. the full URL of the RedditObject
+    :param target: The printable name of the RedditObject
+    :param limit: Limit of images that should newly be downloaded by this process, or None
+    :param queue: The Job Queue
+    :param poll_seconds: Seconds to wait for new submissions while another process is fetching the listing
+    :param failures: If given, do not queue submissions whose URLs are gone or are waiting to be retried
+    :param download: Function to download a single submission, see _download_submission()
+    :return: None
+    :raises PrawcoreException: if the listing could not be fetched
+    """
+    stop: threading.Event = threading.Event()
+    limit_reached: threading.Event = threading.Event()
+    errors: list[BaseException] = []
+    lister: Optional[threading.Thread] = None
+    tried_listing: bool = False
+    """Every process tries to claim the listing only once, so a finished listing is not fetched again"""
+    count: int = 0
+
+    def backlog_full() -> bool:
+        return limit is not None and queue.pending(target) >= limit - count
+
+    try:
+        while limit is None or count < limit:
+            job: Optional[Job] = queue.claim(target)
+            if job is not None:
+                count += download(ArchivedSubmission(job.record), count, job=job)
+            elif not tried_listing:
+                tried_listing = True
+                if queue.claim_listing(listing):
+                    cursor: Optional[str] = queue.listing_cursor(listing)
+                    if cursor is not None:
+                        print(f"Continuing the listing of {target} after {cursor}")
+                    lister = threading.Thread(target=_list_into_queue, name="Lister", daemon=True,
+                                              args=(listing_from(cursor), target, listing, queue, urlmanager, archive, failures, stop,
+                                                    limit_reached, backlog_full, errors))
+                    lister.start()
+            elif lister is not None and lister.is_alive():
+                time.sleep(min(poll_seconds, 0.1))  # Wait for the next page of the listing
+            elif queue.listing_in_progress(listing):
+                time.sleep(poll_seconds)  # Wait for another process to queue more submissions
+            else:
+                break  # All submissions have been listed and claimed
+        else:
+            print(f"Reached limit of {limit} submissions to download!")
+            limit_reached.set()
+    finally:
+        stop.set()
+        if lister is not None:
+            lister.join()
+    if errors:
+        raise errors[0]
+
+
+def _scrape_directly(listing_from: Callable[[Optional[str]], Iterable], listing: str, target: str, limit: Optional[int],
+                     queue: Optional[JobQueue], urlmanager: URLManager, archive: SubmissionArchive, failures: Optional[FailureCache],
+                     download: Callable[..., int]) -> None:
+    """
+    Scrape a RedditObject in a single process, downloading every submission as soon as it has been listed.
+    If a Job Queue is given, it is used as a journal: submissions that are still queued from an interrupted run are downloaded first,
+    the listing continues where it has been interrupted, and every new listed submission stays queued until it has been processed.
+    Submissions that are skipped anyway, e.g. because their URLs have already been downloaded, are not queued.
+    :param listing_from: Function that returns the praw listing of the RedditObject, starting after the given fullname
+    :param listing: The key of the listing, i.e. the full URL of the RedditObject
+    :param target: The printable name of the RedditObject
+    :param limit: Limit of images that should newly be downloaded, or None
+    :param queue: The Job Queue of this process, or None
+    :param urlmanager: URL Manager, submissions whose URLs have already been downloaded are not queued
+    :param archive: Submission Archive to record all listed submissions in
+    :param failures: If given, do not queue submissions whose URLs are gone or are waiting to be retried
+    :param download: Function to download a single submission, see _download_submission()
+    :return: None
+    :raises PrawcoreException: if the listing could not be fetched
+    """
+    count: int = 0
+    cursor: Optional[str] = None
+    if queue is not None:
+        while limit is None or count < limit:
+            job: Optional[Job] = queue.claim(target)
+            if job is None:
+                break
+            count += download(ArchivedSubmission(job.record), count, job=job)
+        else:
+            print(f"Reached limit of {limit} submissions to download!")
+            return  # The listing has not been continued, so its position is kept
+        queue.claim_listing(listing)
+        cursor = queue.listing_cursor(listing)
+        if cursor is not None:
+            print(f"Continuing the listing of {target} after {cursor}")
+    finished: bool = False
+    listed: Optional[str] = None
+    """The fullname of the last listed submission, which is only recorded in the queue when the listing is released"""
+    try:
+        submission: Submission
+        for submission in metrics.timed_iter("listing", listing_from(cursor)):
+            if limit is not None and count >= limit:
+                print(f"Reached limit of {limit} submissions to download!")
+                finished = True  # The next listing starts from the beginning, so new submissions are not delayed
+                break
+            metrics.count("submissions_seen")
+            archive.add_submission(submission, target)
+            job: Optional[Job] = None
+            if queue is not None and not urlmanager.url_already_in_database(submission.url) and \
+                    _get_downloader(submission.url) is not None and (failures is None or failures.blocked(submission.url) is None):
+                queue.enqueue(submission.id, target, archive.submission_to_record(submission, target), listing, submission.fullname)
+                job = queue.claim(target, submission.id)
+                if job is None:
+                    print(f"Skipping URL {submission.url} because it has been given up after too many attempts.")
+                    continue
+            listed = submission.fullname
+            count += download(submission, count, job=job)  # Skips the submissions that have not been queued
+        else:
+            finished = True
+    finally:
+        if queue is not None:
+            queue.release_listing(listing, finished, listed)
+
+
+def _close(metadata_writer: MetadataWriterPool, queue: Optional[JobQueue]) -> None:
+    """Wait for all metadata to be written, then return all unfinished claims to the queue"""
+    metadata_writer.close()
+    if queue is not None:
+        queue.release()
+
+
+def _sorted_listing(results: Any, reddit_object: RedditObject, after: Optional[str]) -> Iterable:
+    """
+    Get the listing of the given praw object in the sort order of the RedditObject
+    :param results: The praw Subreddit or the praw sublisting of a user
+    :param reddit_object: The RedditObject
+    :param after: If given, start the listing after the submission with this fullname
+    :return: the listing generator
+    """
+    params: dict[str, str] = {"after": after} if after is not None else {}
+    match reddit_object.sort_method:
+        case SortMethod.HOT:
+            return results.hot(limit=None, params=params)  # TODO This is technically limited to 1000 posts :(
+        case SortMethod.NEW:
+            return results.new(limit=None, params=params)
+        case SortMethod.CONTROVERSIAL:
+            return results.controversial(reddit_object.top_kind.name.lower(), limit=None, params=params)
+        case SortMethod.TOP:
+            return results.top(reddit_object.top_kind.name.lower(), limit=None, params=params)
+        case SortMethod.BEST:
+            return results.best(limit=None, params=params)
+        case SortMethod.RISING:
+            return results.rising(limit=None, params=params)
+        case _:
+            raise NotImplementedError(f"Unknown sort method: {reddit_object.sort_method}")
+
+
+def _cached_listing(reddit: praw.reddit.Reddit, listing_from: Callable[[Optional[str]], Any], listing: str, cache: ListingCache,
+                    archive: SubmissionArchive, after: Optional[str]) -> Iterator:
+    """
+    Get the given listing page by page, serving all pages that have been fetched recently from the Listing Cache,
+    and storing all fetched pages in it
+    :param reddit: The praw Reddit instance
+    :param listing_from: Function that returns the praw listing generator, starting after the given fullname, see _sorted_listing()
+    :param listing: The key of the listing, i.e. the full URL of the RedditObject
+    :param cache: The Listing Cache
+    :param archive: The Submission Archive, to convert the fetched submissions to records
+    :param after: If given, start the listing after the submission with this fullname
+    :return: the listing generator
+    """
+    generator = listing_from(after)
+    params: dict[str, Any] = {k: v for k, v in generator.params.items() if k != "after"}
+    params["limit"] = 100  # The maximum page size of the Reddit API
+    while True:
+        page: Optional[tuple[list[Any], Optional[str]]] = cache.get_page(listing, after)
+        if page is not None:
+            metrics.count("listing_pages_cached")
+            submissions, next_after = page
+        else:
+            result = reddit.get(generator.url, params={**params, "after": after} if after is not None else params)
+            submissions, next_after = list(result), result.after
+            if all(isinstance(submission, Submission) for submission in submissions):  # Comments are not cached
+                cache.put_page(listing, after, submissions, [archive.submission_to_record(s) for s in submissions], next_after)
+        yield from submissions
+        if not submissions or next_after is None or next_after == after:
+            return
+        after = next_after
+
 
 class SubredditDoesNotExist(Exception):
     """
@@ -36,27 +362,20 @@ class UserDoesNotExist(Exception):
     pass
 
 
-def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destination: Path, cfg: Config, urlmanager: URLManager,
-                     library: ImageDatabase) -> None:
+def _find_listing(reddit: praw.reddit.Reddit, reddit_object: RedditObject) -> Any:
     """
-    Scrape the given reddit object
-    :param library: PHash Library
-    :param urlmanager: URL Manager
-    :param cfg: The global configuration
-    :param destination: Destination directory
-    :param reddit_object: Reddit object to scrape
-    :param limit: Limit of images that should newly be downloaded, or None to disable the limit
-    :return: None
+    Check if the given reddit object exists, and build its praw object
+    :param reddit: The praw Reddit instance
+    :param reddit_object: The RedditObject
+    :return: the praw Subreddit or the praw sublisting of the user
+    :raises SubredditDoesNotExist: if the subreddit does not exist
+    :raises UserDoesNotExist: if the user does not exist
     """
-    import actions
-    reddit: praw.reddit.Reddit = actions.connect_to_reddit(cfg)
-
     print(f"Searching for {reddit_object.printable_name()}...")
     # Check if the subreddit or user exists
     if reddit_object.is_subreddit:
         # noinspection PyTypeChecker
         reddit_object: Subreddit = reddit_object
-        destination_path: Path = destination / actions.sanitize_filename(f"reddit_sub_{reddit_object.subreddit_name}")
         try:
             reddit.subreddits.search_by_name(reddit_object.subreddit_name, exact=True)
         except NotFound as e:
@@ -68,8 +387,6 @@ def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destinat
             reddit.redditors.search(reddit_object.user_name, exact=True)
         except NotFound as e:
             raise UserDoesNotExist from e
-        destination_path: Path = destination / actions.sanitize_filename(f"reddit_user_{reddit_object.user_name}")
-        pass  # TODO IMPLEMENT
     else:
         raise NotImplementedError(f"Unknown kind of RedditObject to download: {reddit_object}")
 
@@ -77,7 +394,7 @@ def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destinat
     if reddit_object.is_subreddit:
         reddit_object: Subreddit = reddit_object
         results = reddit.subreddit(reddit_object.subreddit_name)
-    elif reddit_object.is_user:
+    else:
         reddit_object: User = reddit_object
         results = Redditor(reddit, reddit_object.user_name)
         match reddit_object.user_page_kind:
@@ -100,26 +417,51 @@ def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destinat
                 results = results.hidden()
             case _:
                 raise NotImplementedError(f"Not implemented: {reddit_object.user_page_kind}")
+    print(f"Found {reddit_object.printable_name()}. Starting Download.")
+    return results
+
 
+def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destination: Path, cfg: Config, urlmanager: URLManager,
+                     library: ImageDatabase, archive: SubmissionArchive, queue: Optional[JobQueue] = None,
+                     failures: Optional[FailureCache] = None, listing_cache: Optional[ListingCache] = None,
+                     bandwidth: Optional[BandwidthLimiter] = None) -> None:
+    """
+    Scrape the given reddit object
+    :param bandwidth: If given, limit the bandwidth of all image transfers in total, per target and per host with this limiter
+    :param listing_cache: If given, serve the pages of the listing from this cache while they are fresh, and store all fetched pages in it
+    :param failures: If given, record all URLs that could not be downloaded in this cache, and skip them until they may be retried
+    :param queue: If given, queue all listed submissions in this Job Queue, and continue the work that is left in it from an interrupted run.
+                  If workers are enabled, cooperate with all other scraper processes that share it, otherwise it is only used as a journal
+                  of the submissions that are being downloaded
+    :param archive: Submission Archive to record all seen submissions and downloaded images in
+    :param library: PHash Library
+    :param urlmanager: URL Manager
+    :param cfg: The global configuration
+    :param destination: Destination directory
+    :param reddit_object: Reddit object to scrape
+    :param limit: Limit of images that should newly be downloaded, or None to disable the limit
+    :return: None
+    """
+    import actions
+    reddit: praw.reddit.Reddit = actions.connect_to_reddit(cfg)
+
+    # The reddit object is only looked up once its listing is fetched, so submissions that are left in the queue are downloaded first
+    if reddit_object.is_subreddit:
+        # noinspection PyTypeChecker
+        reddit_object: Subreddit = reddit_object
+        destination_path: Path = destination / actions.sanitize_filename(f"reddit_sub_{reddit_object.subreddit_name}")
+    elif reddit_object.is_user:
+        # noinspection PyTypeChecker
+        reddit_object: User = reddit_object
+        destination_path: Path = destination / actions.sanitize_filename(f"reddit_user_{reddit_object.user_name}")
     else:
         raise NotImplementedError(f"Unknown kind of RedditObject to download: {reddit_object}")
-    match reddit_object.sort_method:
-        case SortMethod.HOT:
-            results = results.hot(limit=None)  # TODO This is technically limited to 1000 posts :(
-        case SortMethod.NEW:
-            results = results.new(limit=None)
-        case SortMethod.CONTROVERSIAL:
-            results = results.controversial(reddit_object.top_kind.name.lower(), limit=None)
-        case SortMethod.TOP:
-            results = results.top(reddit_object.top_kind.name.lower(), limit=None)
-        case SortMethod.BEST:
-            results = results.best(limit=None)
-        case SortMethod.RISING:
-            results = results.rising(limit=None)
-        case _:
-            raise NotImplementedError(f"Unknown sort method: {reddit_object.sort_method}")
 
-    print(f"Found {reddit_object.printable_name()}. Starting Download.")
+    def listing_from(after: Optional[str]) -> Iterable:
+        return _sorted_listing(_find_listing(reddit, reddit_object), reddit_object, after)
+
+    if listing_cache is not None:
+        listing_from = partial(_cached_listing, reddit, listing_from, reddit_object.get_full_url(), listing_cache, archive)
 
     # Todo Convert imagehashsort.py database to object and use it here to determine whether to download an image.
     # Todo Use SQLite as database format and enable imagehashsort.py to use the same database format
@@ -128,27 +470,26 @@ def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destinat
     # 3. Check if the phash is already known, if yes, delete the downloaded image
     # 4. (opt-out) rename image to its PHash
     # find images/gifs in subreddit
+    naming: NamingIndex = NamingIndex(destination, destination / cfg.get("reddit_downloader.naming_index_file", ".naming_index.txt"),
+                                      cfg.get("reddit_downloader.output_layout", "flat"), shared=queue is not None)
+    metadata_writer: MetadataWriterPool = MetadataWriterPool(cfg.get("metadata_scraper.writer_threads", 2),
+                                                             cfg.get("metadata_scraper.writer_queue_size", 32),
+                                                             is_sidecar_mode(cfg),
+                                                             BlobStore(destination / cfg.get("reddit_downloader.blob_store_dir", ".blobs"))
+                                                             if is_blob_storage(cfg) else None,
+                                                             Recompressor.from_config(cfg), library,
+                                                             cfg.get("metadata_scraper.writer_queue_max_bytes", 256 * 1024 * 1024), naming)
+    target: str = reddit_object.printable_name()
+    download: Callable[..., int] = partial(_download_submission, target=target, cfg=cfg, destination=destination_path,
+                                           urlmanager=urlmanager, library=library, archive=archive, naming=naming,
+                                           metadata_writer=metadata_writer, failures=failures,
+                                           throttle=bandwidth.for_target(target) if bandwidth is not None and bandwidth.enabled else None)
     try:
-        count = 0
-        submission: Submission
-        for submission in results:
-            if count >= limit:
-                print(f"Reached limit of {limit} submissions to download!")
-                break
-            u: namedtuple = urlparse(submission.url)
-            """The parts of the URL"""
-            if urlmanager.parsed_url_already_in_database(u):
-                print(f"Skipping URL {submission.url} because it has already been downloaded before.")
-                continue
-            if "imgur.com/a/" in submission.url or "imgur.com/gallery/" in submission.url:
-                downloader: Downloader = ImgurAlbumDownloader()
-            elif '://i.imgur.com/' in submission.url or '://i.redd.it' in submission.url:
-                print(f'Downloading image {count} from {reddit_object.printable_name()} {submission.url}')
-                downloader: Downloader = HTTPDownloader()
-            else:
-                continue  # Unsupported URL
-            count += downloader.download(submission, cfg, destination_path, urlmanager, library)
-            urlmanager.add_url_to_database(submission.url)
+        if queue is not None and cfg.get("workers.enabled", False):
+            _scrape_from_queue(listing_from, reddit_object.get_full_url(), target, limit, queue, cfg.get("workers.poll_seconds", 5),
+                               urlmanager, archive, failures, download)
+        else:
+            _scrape_directly(listing_from, reddit_object.get_full_url(), target, limit, queue, urlmanager, archive, failures, download)
 
             # .gifv file extensions do not play, convert to .gif
             # elif extension == '.gifv':
@@ -163,13 +504,23 @@ def scrape_subreddit(reddit_object: RedditObject, limit: Optional[int], destinat
 
     except PrawcoreException as e:
         print(f'Error accessing subreddit!\n{str(e)}')
-        library.save()
+        _close(metadata_writer, queue)
+        with metrics.time("library_save"):
+            library.save()
     except KeyboardInterrupt:
-        library.save()
+        _close(metadata_writer, queue)
+        with metrics.time("library_save"):
+            library.save()
         sys.stdout.flush()
         print(f"Received Keyboard Interrupt.", file=sys.stderr)
     except BaseException as e:
+        _close(metadata_writer, queue)
         library.emergency_save()
         raise e
     else:
-        library.save()
+        _close(metadata_writer, queue)
+        with metrics.time("library_save"):
+            library.save()
+    if metadata_writer.failed > 0:
+        print(f"Metadata could not be written to {metadata_writer.failed} of "
+              f"{metadata_writer.completed + metadata_writer.failed} files!", file=sys.stderr)
@@ -2,14 +2,74 @@
 This module contains functions to write metadata to images
 """
 import datetime as dt
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 import praw.models
 import pyexiv2
 from config import Config
 
+_EMPTY_XMP_PACKET: str = '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n' \
+                         '<x:xmpmeta xmlns:x="adobe:ns:meta/">\n' \
+                         ' <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n' \
+                         ' </rdf:RDF>\n' \
+                         '</x:xmpmeta>\n' \
+                         '<?xpacket end="w"?>\n'
+"""An XMP packet without any properties, used to create new sidecar files"""
+
 MetadataModel = tuple[dict[str, str], dict[str, str], dict[str, str]]
+"""
+The metadata model, consisting of Exif, IPTC and XMP data.
+Values are never modified in place, they are always replaced, so models may share their values, see overlay_model()
+"""
+
+METADATA_MODES: tuple[str, ...] = ("embed", "sidecar")
+"""All supported values of metadata_scraper.metadata_mode"""
+
+_READ_ONLY_SIGNATURES: tuple[bytes, ...] = (b"GIF87a", b"GIF89a")
+"""The signatures of the downloaded image formats that exiv2 cannot write metadata to"""
+
+
+def is_sidecar_mode(cfg: Config) -> bool:
+    """
+    Check if the configured metadata mode writes XMP sidecar files instead of embedding the metadata into the images
+
+    :param cfg: Global Config
+    :return: True for the 'sidecar' mode, False for the 'embed' mode
+    :raises ValueError: if the configured metadata mode is unknown
+    """
+    mode: str = cfg.get("metadata_scraper.metadata_mode", "embed")
+    if mode not in METADATA_MODES:
+        raise ValueError(f"Unknown metadata mode {mode}, expected one of {', '.join(METADATA_MODES)}")
+    return mode == "sidecar"
+
+
+def overlay_model(base: MetadataModel) -> MetadataModel:
+    """
+    Create a new model on top of the given base model, which can be shared between many images, e.g. all images of an album.
+    Only the three mappings are copied, their values are shared with the base model, since no setter modifies them in place.
+    This is as cheap as a chain of mappings, but does not leave three additional objects per image to the garbage collector.
+
+    :param base: Base model
+    :return: the new model
+    """
+    exif_data, iptc_data, xmp_data = base
+    return dict(exif_data), dict(iptc_data), dict(xmp_data)
+
+
+@lru_cache(maxsize=1024)
+def format_epoch(epoch: float) -> tuple[str, str, str, str]:
+    """
+    Format the given epoch in all formats used in the metadata. The result is cached, since all images of an album share
+    a few distinct epochs.
+
+    :param epoch: Epoch
+    :return: a tuple of the Exif date time, the IPTC date, the IPTC time and the XMP date time
+    """
+    timestamp: dt.datetime = dt.datetime.utcfromtimestamp(epoch)
+    return (timestamp.strftime("%Y:%m:%d %H:%M:%S"), timestamp.strftime("%Y-%m-%d"), timestamp.strftime("%H:%M:%S"),
+            timestamp.strftime("%Y-%M-%DT%H:%M:%S"))
 
 
 def set_time_created(model: MetadataModel, epoch: int) -> MetadataModel:
@@ -21,18 +81,19 @@ def set_time_created(model: MetadataModel, epoch: int) -> MetadataModel:
     :return: the new model
     """
     exif_data, iptc_data, xmp_data = model
+    exif_time, iptc_date, iptc_time, xmp_time = format_epoch(epoch)
     # Set Exif Time
-    exif_data["Exif.Photo.DateTimeOriginal"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y:%m:%d %H:%M:%S")
-    exif_data["Exif.Image.DateTime"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y:%m:%d %H:%M:%S")
-    exif_data["Exif.Photo.DateTimeDigitized"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y:%m:%d %H:%M:%S")
+    exif_data["Exif.Photo.DateTimeOriginal"] = exif_time
+    exif_data["Exif.Image.DateTime"] = exif_time
+    exif_data["Exif.Photo.DateTimeDigitized"] = exif_time
     # Set IPTC Time
-    iptc_data["Iptc.Application2.DateCreated"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y-%m-%d")
-    iptc_data["Iptc.Application2.TimeCreated"] = dt.datetime.utcfromtimestamp(epoch).strftime("%H:%M:%S")
+    iptc_data["Iptc.Application2.DateCreated"] = iptc_date
+    iptc_data["Iptc.Application2.TimeCreated"] = iptc_time
     # Set XMP Time
-    xmp_data["Xmp.xmp.CreateDate"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y-%M-%DT%H:%M:%S") + ".000"
-    xmp_data["Xmp.acdsee.datetime"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y:%m:%d %H:%M:%S")
-    xmp_data["Xmp.dc.date"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y-%M-%DT%H:%M:%S")
-    xmp_data["Xmp.xmpDM.releaseDate"] = dt.datetime.utcfromtimestamp(epoch).strftime("%Y-%M-%DT%H:%M:%S")
+    xmp_data["Xmp.xmp.CreateDate"] = xmp_time + ".000"
+    xmp_data["Xmp.acdsee.datetime"] = exif_time
+    xmp_data["Xmp.dc.date"] = xmp_time
+    xmp_data["Xmp.xmpDM.releaseDate"] = xmp_time
     return exif_data, iptc_data, xmp_data
 
 
@@ -114,25 +175,35 @@ def set_keywords(model: MetadataModel, submission: praw.models.Submission, cfg:
     subreddit_name: str = cfg['metadata_scraper.subreddit_name']
     user_name: str = cfg['metadata_scraper.user_name']
     exif_data, iptc_data, xmp_data = model
-    # Set XMP keywords
+    subject: list[str] = [subreddit_name, submission.subreddit.display_name]
+    hierarchical_subject: list[str] = [f"{subreddit_name}{lightroom_sep}{submission.subreddit.display_name}"]
+    tags_list: list[str] = [f"{subreddit_name}/{submission.subreddit.display_name}"]
+    if submission.author is not None:  # Set User Keywords
+        subject += [user_name, submission.author.name]
+        hierarchical_subject += [f"{user_name}{lightroom_sep}{submission.author.name}"]
+        tags_list += [f"{user_name}/{submission.author.name}"]
+    # Set XMP keywords. The lists are never modified in place, since they might be shared with other models
     # noinspection PyTypeChecker
-    xmp_data["Xmp.dc.subject"] = [subreddit_name, submission.subreddit.display_name]
+    xmp_data["Xmp.dc.subject"] = subject
     # noinspection PyTypeChecker
-    xmp_data["Xmp.lr.hierarchicalSubject"] = [f"{subreddit_name}{lightroom_sep}{submission.subreddit.display_name}"]
+    xmp_data["Xmp.lr.hierarchicalSubject"] = hierarchical_subject
     # noinspection PyTypeChecker
-    xmp_data["Xmp.acdsee.categories"] = [f"{subreddit_name}{lightroom_sep}{submission.subreddit.display_name}"]
+    xmp_data["Xmp.acdsee.categories"] = list(hierarchical_subject)
     # noinspection PyTypeChecker
-    xmp_data["Xmp.digiKam.TagsList"] = [f"{subreddit_name}/{submission.subreddit.display_name}"]
-
-    if submission.author is not None:  # Set User Keywords
-        # noinspection PyTypeChecker
-        xmp_data["Xmp.dc.subject"] += [user_name, submission.author.name]
-        xmp_data["Xmp.lr.hierarchicalSubject"] += [f"{user_name}{lightroom_sep}{submission.author.name}"]
-        xmp_data["Xmp.acdsee.categories"] += [f"{user_name}{lightroom_sep}{submission.author.name}"]
-        xmp_data["Xmp.digiKam.TagsList"] += [f"{user_name}/{submission.author.name}"]
+    xmp_data["Xmp.digiKam.TagsList"] = tags_list
     return exif_data, iptc_data, xmp_data
 
 
+def get_upvotes_comment(submission: praw.models.Submission) -> str:
+    """
+    Get the part of the long comment that contains the score of the given submission, which changes after the download
+
+    :param submission: Submission or ArchivedSubmission
+    :return: the comment, e.g. "100 upvotes (0.95%), 10 comments."
+    """
+    return f"{submission.score} upvotes ({submission.upvote_ratio}%), {submission.num_comments} comments."
+
+
 def get_model_from_submission(target_file: Optional[Path], submission: praw.models.Submission) -> MetadataModel:
     """
     Get the metadata model from the given submission.
@@ -145,7 +216,7 @@ def get_model_from_submission(target_file: Optional[Path], submission: praw.mode
     # and https://github.com/LeoHsiao1/pyexiv2/blob/master/docs/Tutorial.md
     # and https://exiv2.org/tags.html
     # and https://praw.readthedocs.io/en/latest/code_overview/models/submission.html
-    upvotes_comment: str = f"{submission.score} upvotes ({submission.upvote_ratio}%), {submission.num_comments} comments."
+    upvotes_comment: str = get_upvotes_comment(submission)
     exif_data = {
         'Exif.Image.Rating': None,  # Delete the rating
     }
@@ -177,6 +248,19 @@ def get_model_from_submission(target_file: Optional[Path], submission: praw.mode
     return exif_data, iptc_data, xmp_data
 
 
+def can_embed_metadata(image: Union[bytes, Path]) -> bool:
+    """
+    Check if metadata can be embedded into the given image. GIF images can only carry metadata in sidecar files
+
+    :param image: The image bytes, or the image file
+    :return: False, if exiv2 cannot write metadata to the format of the image
+    """
+    if isinstance(image, Path):
+        with image.open("rb") as f:
+            image = f.read(8)
+    return not image.startswith(_READ_ONLY_SIGNATURES)
+
+
 def write_metadata(target_file: Path, exif_data: dict[str, str], iptc_data: dict[str, str], xmp_data: dict[str, str]) -> None:
     """
     Write the given metadata to an image file
@@ -192,3 +276,53 @@ def write_metadata(target_file: Path, exif_data: dict[str, str], iptc_data: dict
         metadata.modify_exif(exif_data)
         metadata.modify_iptc(iptc_data)
         metadata.modify_xmp(xmp_data)
+
+
+def write_metadata_to_bytes(data: bytes, exif_data: dict[str, str], iptc_data: dict[str, str], xmp_data: dict[str, str]) -> bytes:
+    """
+    Write the given metadata to an image that is kept in memory
+
+    :param data: The image bytes
+    :param xmp_data:
+    :param iptc_data:
+    :param exif_data:
+    :return: the image bytes including the metadata
+    """
+    with pyexiv2.ImageData(data) as metadata:
+        metadata.modify_exif(exif_data)
+        metadata.modify_iptc(iptc_data)
+        metadata.modify_xmp(xmp_data)
+        return metadata.get_bytes()
+
+
+def get_sidecar_file(target_file: Path) -> Path:
+    """
+    Get the XMP sidecar file of the given image file, e.g. "image.png.xmp" for "image.png"
+
+    :param target_file: Image file
+    :return: the sidecar file
+    """
+    return target_file.with_name(target_file.name + ".xmp")
+
+
+def write_xmp_sidecar(target_file: Path, exif_data: dict[str, str], iptc_data: dict[str, str], xmp_data: dict[str, str]) -> Path:
+    """
+    Write the given metadata to the XMP sidecar file of the given image, leaving the image itself untouched.
+    Exif and IPTC data is converted to its XMP equivalent, values given as XMP data take precedence.
+    An existing sidecar file is updated.
+
+    :param target_file: Image file to write the sidecar for
+    :param xmp_data:
+    :param iptc_data:
+    :param exif_data:
+    :return: the sidecar file
+    """
+    sidecar_file: Path = get_sidecar_file(target_file)
+    if not sidecar_file.is_file():
+        sidecar_file.write_text(_EMPTY_XMP_PACKET, encoding="utf-8")
+    data: dict = pyexiv2.convert_exif_to_xmp({k: v for k, v in exif_data.items() if v is not None})
+    data.update(pyexiv2.convert_iptc_to_xmp({k: v for k, v in iptc_data.items() if v is not None}))
+    data.update(xmp_data)
+    with pyexiv2.Image(sidecar_file.as_posix()) as metadata:
+        metadata.modify_xmp(data)
+    return sidecar_file
@@ -1,7 +1,16 @@
+from actions.Instrumentation import Metrics, metrics
+from actions.Profiler import Profiler
+from actions.ImageFilter import ImageFilter, normalize_format
 from actions.RedditConnector import connect_to_reddit, get_imgur_client_id
-from actions.ScrapeSubreddits import scrape_subreddit
+from actions.ScrapeSubreddits import scrape_subreddit, STORAGE_MODES, is_blob_storage
 from actions.WriteMetadata import MetadataModel, get_model_from_submission, write_metadata, set_time_created, set_post_title, set_keywords, \
-    set_author, set_long_comment
+    set_author, set_long_comment, overlay_model, format_epoch, get_upvotes_comment, \
+    write_metadata_to_bytes, get_sidecar_file, write_xmp_sidecar, METADATA_MODES, is_sidecar_mode, \
+    can_embed_metadata
+from actions.BackfillMetadata import backfill_metadata
+from actions.ImportLibrary import import_library
+from actions.Recompress import Recompressor, redeflate_png
+from actions.RefreshSubmissions import refresh_submissions
 
 
 def sanitize_filename(filename: str, repl='_') -> str:
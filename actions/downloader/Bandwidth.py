@@ -0,0 +1,139 @@
+"""
+This module contains token buckets that limit the download bandwidth of the scraper in total, per target and per host
+"""
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from actions.Instrumentation import metrics
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that limits the rate of bytes.
+    Bytes are taken after they have been received, so the bucket may go into debt, which the receiving thread has to wait off.
+    """
+
+    def __init__(self, bytes_per_second: float, burst_bytes: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Init a new, full token bucket
+        :param bytes_per_second: The rate the bucket is refilled with
+        :param burst_bytes: The capacity of the bucket, i.e. the number of bytes that may be received at once after a pause.
+                            One second of the rate by default
+        :param clock: Function that returns the current time in seconds
+        """
+        super().__init__()
+        self.bytes_per_second: float = bytes_per_second
+        self.burst_bytes: float = burst_bytes if burst_bytes is not None else bytes_per_second
+        self.clock: Callable[[], float] = clock
+        self._tokens: float = self.burst_bytes
+        self._updated: float = clock()
+        self._lock: threading.Lock = threading.Lock()
+
+    def take(self, amount: int) -> float:
+        """
+        Take the given number of bytes from the bucket
+        :param amount: Number of bytes that have been received
+        :return: the number of seconds the caller has to wait until the bucket is out of debt
+        """
+        with self._lock:
+            now: float = self.clock()
+            self._tokens = min(self.burst_bytes, self._tokens + (now - self._updated) * self.bytes_per_second)
+            self._updated = now
+            self._tokens -= amount
+            return -self._tokens / self.bytes_per_second if self._tokens < 0 else 0.0
+
+
+class Throttle:
+    """
+    The token buckets a single transfer is limited by
+    """
+
+    def __init__(self, limiter: "BandwidthLimiter", buckets: list[TokenBucket]) -> None:
+        self.limiter: BandwidthLimiter = limiter
+        self.buckets: list[TokenBucket] = buckets
+
+    def for_url(self, url: str) -> "Throttle":
+        """
+        Get the throttle of a transfer of the given URL, which is additionally limited by the bucket of its host
+        :param url: URL to transfer
+        :return: the throttle
+        """
+        host: Optional[TokenBucket] = self.limiter.host_bucket(urlparse(url).hostname or "")
+        return Throttle(self.limiter, self.buckets + [host]) if host is not None else self
+
+    def consume(self, amount: int) -> None:
+        """
+        Account for the given number of received bytes, and wait until all buckets allow receiving more
+        :param amount: Number of bytes that have been received
+        :return: None
+        """
+        if not self.buckets:
+            return
+        wait: float = max(bucket.take(amount) for bucket in self.buckets)
+        if wait > 0:
+            metrics.count("bandwidth_wait_seconds", wait)
+            self.limiter.sleep(wait)
+
+
+class BandwidthLimiter:
+    """
+    Limits the download bandwidth of all transfers of this process in total, and optionally per target and per host.
+    Every transfer waits for the most restrictive of its buckets.
+    """
+
+    def __init__(self, max_bytes_per_second: float = 0, max_bytes_per_second_per_target: float = 0,
+                 max_bytes_per_second_per_host: float = 0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        """
+        Init a new bandwidth limiter. 0 disables a limit
+        :param max_bytes_per_second: Maximum bandwidth of all transfers together
+        :param max_bytes_per_second_per_target: Maximum bandwidth of the transfers of every target, i.e. subreddit or user
+        :param max_bytes_per_second_per_host: Maximum bandwidth of the transfers from every host, e.g. i.redd.it
+        :param clock: Function that returns the current time in seconds
+        :param sleep: Function to wait with
+        """
+        super().__init__()
+        self.max_bytes_per_second_per_target: float = max_bytes_per_second_per_target
+        self.max_bytes_per_second_per_host: float = max_bytes_per_second_per_host
+        self.clock: Callable[[], float] = clock
+        self.sleep: Callable[[float], None] = sleep
+        self._global: Optional[TokenBucket] = TokenBucket(max_bytes_per_second, clock=clock) if max_bytes_per_second > 0 else None
+        self._targets: dict[str, TokenBucket] = {}
+        self._hosts: dict[str, TokenBucket] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Check if any limit is set
+        :return: True, if at least one limit is set
+        """
+        return self._global is not None or self.max_bytes_per_second_per_target > 0 or self.max_bytes_per_second_per_host > 0
+
+    def _bucket(self, buckets: dict[str, TokenBucket], key: str, bytes_per_second: float) -> Optional[TokenBucket]:
+        if bytes_per_second <= 0:
+            return None
+        with self._lock:
+            bucket: Optional[TokenBucket] = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = TokenBucket(bytes_per_second, clock=self.clock)
+            return bucket
+
+    def host_bucket(self, host: str) -> Optional[TokenBucket]:
+        """
+        Get the bucket of the given host
+        :param host: Host name
+        :return: the bucket, or None, if the bandwidth per host is not limited
+        """
+        return self._bucket(self._hosts, host, self.max_bytes_per_second_per_host)
+
+    def for_target(self, target: str) -> Throttle:
+        """
+        Get the throttle of the transfers of the given target
+        :param target: The printable name of the RedditObject that is scraped
+        :return: the throttle
+        """
+        target_bucket: Optional[TokenBucket] = self._bucket(self._targets, target, self.max_bytes_per_second_per_target)
+        return Throttle(self, [bucket for bucket in (self._global, target_bucket) if bucket is not None])
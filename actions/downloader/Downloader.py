@@ -1,11 +1,14 @@
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
+from typing import Optional
 
 from config import Config
 from imagehashsort import ImageDatabase
 from praw.models import Submission
 
-from database import URLManager
+from actions.MetadataWriter import MetadataWriteBatch
+from actions.downloader.Bandwidth import Throttle
+from database import URLManager, SubmissionArchive, NamingIndex, Job
 
 
 class Downloader(metaclass=ABCMeta):
@@ -14,14 +17,24 @@ class Downloader(metaclass=ABCMeta):
     """
 
     @abstractmethod
-    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase) -> int:
+    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase,
+                 metadata: MetadataWriteBatch, archive: SubmissionArchive, naming: NamingIndex, job: Optional[Job] = None,
+                 throttle: Optional[Throttle] = None) -> int:
         """
         Download the content of the given submission
+        :param throttle: If given, limit the bandwidth of all image transfers with this throttle
+        :param job: If given, the Job Queue job of the submission, to skip the parts that have been stored in a previous attempt,
+                    and to record the progress of submissions with several images in
+        :param naming: Naming Index that assigns unique paths in the sharded output layout
+        :param archive: Submission Archive to record the downloaded images in
+        :param metadata: Batch to schedule the metadata writes of the downloaded files on
         :param library: Perceptual Hash Library
         :param urlmanager: URL Manager with already-downloaded URLs
         :param destination: Destination to download the files into
         :param cfg: Global Config
         :param submission: Submission to download
         :return: the number of successfully downloaded images
+        :raises Exception: if the submission could not be downloaded. Failures that are recognized by classify_failure()
+                           are recorded in the Failure Cache, all others abort the scraper
         """
         pass
@@ -1,8 +1,8 @@
 import os
-import urllib.request
 from collections import namedtuple
+from functools import partial
 from pathlib import Path
-from urllib.error import HTTPError
+from typing import Callable, Optional
 from urllib.parse import urlparse
 
 from config import Config
@@ -10,8 +10,13 @@ from imagehashsort import ImageDatabase, perceptual_hash
 from praw.models import Submission
 
 import actions
+from actions.ImageFilter import ImageFilter
+from actions.Instrumentation import metrics
+from actions.MetadataWriter import MetadataWriteBatch
 from actions.downloader import Downloader
-from database import URLManager
+from actions.downloader.Bandwidth import Throttle
+from actions.downloader.Transfer import DownloadedImage, ImageRejected, download_image
+from database import URLManager, SubmissionArchive, NamingIndex, Job, get_preview_sizes
 
 
 class HTTPDownloader(Downloader):
@@ -19,33 +24,68 @@ class HTTPDownloader(Downloader):
     A downloader that downloads images that are directly linked in a subreddit
     """
 
-    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase) -> int:
+    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase,
+                 metadata: MetadataWriteBatch, archive: SubmissionArchive, naming: NamingIndex, job: Optional[Job] = None,
+                 throttle: Optional[Throttle] = None) -> int:
         img_extensions: list[str] = ['.jpg', '.jpeg', '.png']
         if cfg['reddit_downloader.download_gif']:
             img_extensions.append(".gif")
         u: namedtuple = urlparse(submission.url)
-        target_file = destination / Path(u.path).name
         img_url = submission.url
         _, extension = os.path.splitext(u.path)
         if extension not in img_extensions:
             return 0
+        if job is not None and job.is_done(img_url):
+            return 0  # Stored before the previous attempt has been interrupted, only the URL is left to be committed
+        image_filter: ImageFilter = ImageFilter.from_config(cfg)
+        if image_filter.enabled:
+            # The size of the source image of the preview is the size of the linked image
+            sizes: list[list[int]] = get_preview_sizes(submission)
+            width, height = sizes[0] if sizes else (None, None)
+            reason: Optional[str] = image_filter.rejects(width, height, image_format=extension)
+            if reason is not None:
+                print(f"Skipping {img_url} because {reason}.")
+                metrics.count("filtered_images")
+                return 0
+        on_written: Optional[Callable[[], None]] = partial(job.mark_done, img_url) if job is not None else None
+        target_file = naming.reserve(destination, Path(u.path).name, submission.created_utc)
         target_file.parent.mkdir(exist_ok=True, parents=True)
+        # Download the full-size image. Failures are recorded by the caller, so the URL is not committed
         try:
-            urllib.request.urlretrieve(img_url, filename=target_file)  # Download the full-size image
-        except HTTPError as e:
-            if e.code == 404:
-                print(f"{img_url} could not be downloaded (404 not found)!")
-                return 0
-        imhash = perceptual_hash(target_file)
-        if cfg["reddit_downloader.discard_phashed_duplicates"] and library.hash_in_hashes(imhash):
-            print(f"{target_file} was detected to be a perceptual duplicate of another image and will be deleted!")
-            target_file.unlink()
+            image: DownloadedImage = download_image(img_url, target_file, cfg.get("reddit_downloader.in_memory_max_bytes", 0), throttle,
+                                                    image_filter if image_filter.enabled else None)
+        except ImageRejected as e:
+            naming.release(target_file)
+            print(f"Skipping {img_url} because {e.reason}.")
+            metrics.count("filtered_images")
             return 0
-        library.store_image(target_file, imhash)
-        # library.save()  # TODO Interval?
+        except BaseException:
+            naming.release(target_file)  # The next attempt is assigned the same name
+            raise
+        model: Optional[actions.MetadataModel] = None
         if cfg["metadata_scraper.write_metadata"]:
-            exif_data, iptc_data, xmp_data = actions.get_model_from_submission(target_file, submission)
+            model = actions.get_model_from_submission(target_file, submission)
             if cfg['metadata_scraper.write_keywords']:
-                exif_data, iptc_data, xmp_data = actions.set_keywords((exif_data, iptc_data, xmp_data), submission, cfg)
-            actions.write_metadata(target_file, exif_data, iptc_data, xmp_data)
+                model = actions.set_keywords(model, submission, cfg)
+        if metadata.link_known(image, model):
+            print(f"{target_file} is already stored and has been linked to its stored copy.")
+            archive.add_image(target_file, submission.id)
+            if on_written is not None:
+                on_written()
+            return 1
+        with metrics.time("perceptual_hash"):
+            imhash = perceptual_hash(image.source())
+        with metrics.time("library_lookup"):
+            duplicate: bool = cfg["reddit_downloader.discard_phashed_duplicates"] and metadata.hash_known(imhash)
+        if duplicate:
+            print(f"{target_file} was detected to be a perceptual duplicate of another image and will be deleted!")
+            metrics.count("phash_duplicates")
+            image.discard()
+            naming.release(target_file)
+            if on_written is not None:
+                on_written()
+            return 0
+        archive.add_image(target_file, submission.id)
+        # The hash is stored in the library once the file has been written
+        metadata.write(target_file, model, image.data, image.sha256, on_written, imhash)
         return 1
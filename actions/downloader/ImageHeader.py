@@ -0,0 +1,109 @@
+"""
+This module contains functions to read the format and the size of an image from the first bytes of its file,
+so a transfer can be aborted as soon as it is clear that the image is not wanted
+"""
+import struct
+from typing import Optional
+
+_JPEG_SOF_MARKERS: frozenset[int] = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+"""Markers of the JPEG segments that contain the size of the image"""
+
+_JPEG_STANDALONE_MARKERS: frozenset[int] = frozenset(range(0xD0, 0xDA)) | {0x01}
+"""JPEG markers that are not followed by a segment length"""
+
+_HTML_PREFIXES: tuple[bytes, ...] = (b"<!doctype html", b"<html", b"<head", b"<body")
+
+
+class ImageHeader:
+    """
+    The format and the size of an image, as far as they could be read from the beginning of its file
+    """
+
+    def __init__(self, image_format: str, width: Optional[int] = None, height: Optional[int] = None) -> None:
+        """
+        :param image_format: Normalized image format, e.g. "jpeg"
+        :param width: Width in pixels, or None, if more bytes are needed to read it
+        :param height: Height in pixels, or None, if more bytes are needed to read it
+        """
+        self.format: str = image_format
+        self.width: Optional[int] = width
+        self.height: Optional[int] = height
+
+    @property
+    def complete(self) -> bool:
+        """
+        Check if the size of the image has been read
+        :return: True, if width and height are known
+        """
+        return self.width is not None and self.height is not None
+
+    def __repr__(self) -> str:
+        return f"ImageHeader({self.format!r}, {self.width}, {self.height})"
+
+
+def is_html(data: bytes) -> bool:
+    """
+    Check if the given bytes are the beginning of an HTML page, e.g. an error page that is served instead of an image
+    :param data: The first bytes of the response
+    :return: True, if the response is an HTML page
+    """
+    return data[:512].lstrip(b"\xef\xbb\xbf \t\r\n").lower().startswith(_HTML_PREFIXES)
+
+
+def sniff_image(data: bytes) -> Optional[ImageHeader]:
+    """
+    Read the format and the size of the image that starts with the given bytes.
+    JPEG, PNG, GIF and WebP images are recognized.
+    :param data: The first bytes of the image file
+    :return: the header, which is incomplete if more bytes are needed to read the size, or None, if the format is not recognized
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(data) < 24:
+            return ImageHeader("png")
+        width, height = struct.unpack(">II", data[16:24])
+        return ImageHeader("png", width, height)
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        if len(data) < 10:
+            return ImageHeader("gif")
+        width, height = struct.unpack("<HH", data[6:10])
+        return ImageHeader("gif", width, height)
+    if data.startswith(b"\xff\xd8"):
+        return _sniff_jpeg(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _sniff_webp(data)
+    return None
+
+
+def _sniff_jpeg(data: bytes) -> ImageHeader:
+    """Walk the segments of a JPEG file up to the first frame header, which contains the size"""
+    offset: int = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return ImageHeader("jpeg")  # Corrupt, the size cannot be read
+        marker: int = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1  # Fill byte
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                break
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return ImageHeader("jpeg", width, height)
+        offset += 2 + struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    return ImageHeader("jpeg")
+
+
+def _sniff_webp(data: bytes) -> ImageHeader:
+    chunk: bytes = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return ImageHeader("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L" and len(data) >= 25:
+        b0, b1, b2, b3 = data[21:25]
+        return ImageHeader("webp", 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10))
+    if chunk == b"VP8X" and len(data) >= 30:
+        return ImageHeader("webp", 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little"))
+    return ImageHeader("webp")
@@ -1,14 +1,12 @@
 #!/usr/bin/env python3
-import datetime as dt
 import json
 import pprint
 import sys
-import urllib
-import urllib.request
-from collections import namedtuple
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 from urllib.parse import urlparse
 
 import requests
@@ -18,8 +16,18 @@ from praw.models import Submission
 
 import actions
 from actions import get_imgur_client_id
+from actions.ImageFilter import ImageFilter
+from actions.Instrumentation import metrics
+from actions.MetadataWriter import MetadataWriteBatch
+from actions.WriteMetadata import MetadataModel
 from actions.downloader.Downloader import Downloader
-from database import URLManager
+from actions.downloader.Bandwidth import Throttle
+from actions.downloader.Transfer import DownloadedImage, DownloadFailure, ImageRejected, download_image, download_bytes, classify_failure
+from database import URLManager, SubmissionArchive, NamingIndex, Job
+
+
+_THUMBNAIL_SUFFIX: str = "t"
+"""The size suffix of Imgur's small thumbnails, which are at most 160x160 pixels and keep the aspect ratio of the image"""
 
 
 class NotAnImgurAlbumUrlError(Exception):
@@ -28,12 +36,115 @@ class NotAnImgurAlbumUrlError(Exception):
         super().__init__(f"Not a valid Imgur album URL: {url}", *args)
 
 
+def get_thumbnail_url(image_data: dict) -> str:
+    """
+    Get the URL of the small thumbnail of the given Imgur image
+    :param image_data: The data of the image in the Imgur API response
+    :return: the URL of the thumbnail
+    """
+    return urlparse(image_data['link'])._replace(path=f"/{image_data['id']}{_THUMBNAIL_SUFFIX}.jpg").geturl()
+
+
+def _hash_thumbnail(image_data: dict, throttle: Optional[Throttle]) -> Optional[Any]:
+    """Download and hash the thumbnail of the given image. This function is executed on a worker thread"""
+    try:
+        with metrics.time("thumbnail_transfer"):
+            data: bytes = download_bytes(get_thumbnail_url(image_data), throttle)
+        with metrics.time("thumbnail_hash"):
+            return perceptual_hash(BytesIO(data))
+    except Exception as e:
+        print(f"Could not hash the thumbnail of {image_data['link']}, the image will be downloaded: {e}", file=sys.stderr)
+        return None
+
+
+def get_album_title(album_data: dict) -> str:
+    """
+    Get the title of an album, as returned by the Imgur API
+    :param album_data: The "data" part of the Imgur API response
+    :return: the title, or the album id if the album does not have a title
+    """
+    return f"{album_data['title']}" if album_data['title'] is not None else album_data['id']
+
+
+def get_album_title_id(album_data: dict) -> str:
+    """
+    Get a unique album identifier that is both unique and human-readable
+    :param album_data: The "data" part of the Imgur API response
+    :return: the identifier
+    """
+    return f"{get_album_title(album_data)} {album_data['id']}".strip()
+
+
+class ImgurAlbumMetadata:
+    """
+    The metadata of a single Imgur album.
+    Everything that is shared between the images of an album is computed once, and the metadata of each image is an overlay
+    on top of the reddit post metadata, so no per-image deep copies of the post metadata are made.
+    """
+
+    def __init__(self, reddit_post_metadata: MetadataModel, album_data: dict) -> None:
+        """
+        Precompute the album metadata.
+        :param reddit_post_metadata: The base metadata of the reddit post. It must not be modified afterwards
+        :param album_data: The "data" part of the Imgur API response
+        """
+        self.base: MetadataModel = reddit_post_metadata
+        self.album_title_id: str = get_album_title_id(album_data)
+        self.album_description: str = album_data['description'] if album_data['description'] is not None else ''
+        exif, _, xmp = reddit_post_metadata
+        self.post_title: str = exif.get("Exif.Image.ImageDescription", "")
+        br: str = '\n'
+        album_upload_time: str = actions.format_epoch(int(album_data['datetime']))[0]
+        # The album comment is split into the parts before and after the image-specific values
+        self._comment_head: str = (xmp.get('Xmp.exif.UserComment', "") + "\n" +
+                                   f"Imgur Album: {get_album_title(album_data)} {album_data['link']} "
+                                   f"({album_data.get('images_count', '1')} images)"
+                                   f"{(br + self.album_description) if self.album_description else ''}\n"
+                                   f"Album Views: {album_data['views']}, Image Views: ").lstrip()
+        self._comment_middle: str = f", Account name: {album_data['account_url']} ({album_data['account_id']})\n" \
+                                    f"Album Upvotes on Imgur: {album_data.get('ups', 'N/A')}, " \
+                                    f"Points: {album_data.get('points', 'N/A')}, " \
+                                    f"Score: {album_data.get('score', 'N/A')}, " \
+                                    f"Number of Comments: Image "
+        self._comment_tail: str = f" Album {album_data.get('comment_count', 'N/A')}.\n" \
+                                  f"Album uploaded: {album_upload_time}"
+
+    def for_image(self, image_data: dict, image_file: Path) -> MetadataModel:
+        """
+        Get the metadata of a single image of the album
+        :param image_data: The image data, as returned by the Imgur API
+        :param image_file: The file the image is stored in
+        :return: the metadata model
+        """
+        model: MetadataModel = actions.overlay_model(self.base)
+        exif, iptc, xmp = actions.set_time_created(model, int(image_data['datetime']))
+        image_title: str = "" if image_data['title'] is None else image_data['title']
+        image_description: str = "" if image_data['description'] is None else image_data['description']
+        if image_title:
+            if self.post_title != "":  # Append reddit post title
+                image_title += " - " + self.post_title
+            actions.set_post_title(model, image_title)
+        if self.album_description:
+            image_description = (image_description + "\n" + "(" + self.album_description + ")").strip()
+        if image_description:
+            iptc["Iptc.Application2.Caption"] = image_description.strip()
+        comment: str = f"{self._comment_head}{image_data['views']}{self._comment_middle}" \
+                       f"{image_data.get('comment_count', 'N/A')}{self._comment_tail}"
+        actions.set_long_comment(model, comment)
+        xmp["Xmp.xmpMM.PreservedFileName"] = image_file.name
+        xmp["Xmp.crs.RawFileName"] = image_file.name
+        xmp["Xmp.xmpDM.album"] = self.album_title_id
+        return exif, iptc, xmp
+
+
 class ImgurAlbumDownloader(Downloader):
     """
     A downloader that downloads whole Imgur albums and sorts their images into a subfolder
     """
 
-    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase) -> int:
+    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase,
+                 metadata: MetadataWriteBatch, archive: SubmissionArchive, naming: NamingIndex, job: Optional[Job] = None,
+                 throttle: Optional[Throttle] = None) -> int:
         allow_duplicate_hashes: bool = cfg["reddit_downloader.keep_imgur_album_phash_duplicates"] or \
                                        not cfg["reddit_downloader.discard_phashed_duplicates"]
         url: str = submission.url
@@ -45,24 +156,50 @@ class ImgurAlbumDownloader(Downloader):
             meta_object = None
         client_id = get_imgur_client_id(cfg)
         return self.download_single_album(url, destination, client_id, reddit_post_metadata=meta_object, library=library,
-                                          allow_duplicate_phashes=allow_duplicate_hashes)
+                                          allow_duplicate_phashes=allow_duplicate_hashes, metadata_batch=metadata,
+                                          max_in_memory_bytes=cfg.get("reddit_downloader.in_memory_max_bytes", 0),
+                                          archive=archive, submission_id=submission.id, naming=naming,
+                                          api_url=cfg.get("reddit_connector.imgur_api_url", "https://api.imgur.com/3"), job=job,
+                                          image_filter=ImageFilter.from_config(cfg), throttle=throttle,
+                                          thumbnail_prededup=cfg.get("reddit_downloader.imgur_thumbnail_prededup", False),
+                                          threads=max(cfg.get("reddit_downloader.gallery_threads", 4), 1))
 
     # noinspection PyMethodMayBeStatic
     def download_single_album(self, url: str, target_path: Path, client_id: str, /, debug=False,
                               reddit_post_metadata: Optional[tuple[dict[str, str], dict[str, str], dict[str, str]]] = None,
-                              library: Optional[ImageDatabase] = None, allow_duplicate_phashes: bool = True) -> int:
+                              library: Optional[ImageDatabase] = None, allow_duplicate_phashes: bool = True,
+                              metadata_batch: Optional[MetadataWriteBatch] = None, max_in_memory_bytes: int = 0,
+                              archive: Optional[SubmissionArchive] = None, submission_id: Optional[str] = None,
+                              naming: Optional[NamingIndex] = None, api_url: str = "https://api.imgur.com/3",
+                              job: Optional[Job] = None, image_filter: Optional[ImageFilter] = None,
+                              throttle: Optional[Throttle] = None, thumbnail_prededup: bool = False, threads: int = 4) -> int:
         """
         Download a single given Imgur album and store it into the appropriate subfolder in the given path.
         The subfolder is the title of the imgur album, plus a unique identifier (the id part of the imgur URL).
 
         :param debug: if True, print debug messages to stdout
+        :param metadata_batch: If given, schedule the metadata writes on this batch instead of writing them synchronously
+        :param max_in_memory_bytes: Images up to this size are kept in memory until their metadata has been added
+        :param archive: If given, record the album and the downloaded images in this archive
+        :param submission_id: ID of the submission the album was posted in, required if an archive is given
+        :param naming: If given, store the album in the shard of the target path that is assigned by this naming index
+        :param api_url: Base URL of the imgur API
+        :param job: If given, skip the images that have been stored in a previous attempt of this job, and record every stored image in it
+        :param image_filter: If given, skip the images that are rejected by this filter, based on the sizes and types in the album data
+        :param throttle: If given, limit the bandwidth of the image transfers with this throttle
+        :param thumbnail_prededup: If True and duplicates are not allowed, hash the small thumbnails of all images first,
+                                   and download only the images whose thumbnails do not match an image in the library.
+                                   If all thumbnails match, the album is skipped completely
+        :param threads: Number of thumbnails that are downloaded in parallel
         :param allow_duplicate_phashes: If True, allow duplicate images
-        :param library: If given, check for hashes in the image library
+        :param library: If given, check for hashes in the image library. If a metadata batch is given, the library of its pool is used
         :param reddit_post_metadata: The base metadata of the reddit post, or None, if no metadata should be scraped at all
         :param client_id: Imgur Client ID
         :param url: URL to download
         :param target_path: Target path where the subfolder shall be created
         :return: the number of downloaded images
+        :raises DownloadFailure: if the album could not be fetched from the Imgur API
+        :raises HTTPError: if an image could not be downloaded, unless it is gone
         """
         if not url.endswith("/"):
             url += "/"  # Makes parsing easier
@@ -79,27 +216,28 @@ class ImgurAlbumDownloader(Downloader):
             raise NotAnImgurAlbumUrlError(url)
         ind = ind + len(urlstart)
         album_id: str = url[ind:url.find("/", ind)]
-        api_url: str = f"https://api.imgur.com/3/{'album' if album else 'gallery'}/{album_id}"
+        api_url = f"{api_url.rstrip('/')}/{'album' if album else 'gallery'}/{album_id}"
         headers = {'Authorization': f'Client-ID {client_id}'}
         if debug:
             print(f"{headers=}\n{api_url=}\n{url[ind:]=}")
-        response = requests.request("GET", api_url, headers=headers)
+        with metrics.time("imgur_api"):
+            response = requests.request("GET", api_url, headers=headers)
         if debug:
             print(f"{response=}\n{response.status_code=}\n{response.text=}")
         if response.status_code != 200:
-            # TODO Handle errors here
-            return 0
+            raise DownloadFailure.from_status(api_url, response.status_code)
         success_json = json.loads(response.text)
         if debug:
             pprint.pprint(success_json)
 
-        album_title: str = f"{success_json['data']['title']}" \
-            if success_json['data']['title'] is not None else success_json['data']['id']
-        album_description: str = f"{success_json['data']['description'] if success_json['data']['description'] is not None else ''}"
-        album_epoch: int = int(success_json['data']['datetime'])
-        album_title_id: str = f"{album_title} {success_json['data']['id']}".strip()
-        """A unique album identifier that is both unique and human-readable"""
+        album_title_id: str = get_album_title_id(success_json['data'])
+        if archive is not None:
+            archive.add_album(success_json['data']['id'], success_json['data'])
+        album_metadata: Optional[ImgurAlbumMetadata] = ImgurAlbumMetadata(reddit_post_metadata, success_json['data']) \
+            if reddit_post_metadata is not None else None
 
+        if naming is not None:
+            target_path = naming.shard(target_path, success_json['data']['id'], int(success_json['data']['datetime']))
         if success_json['data']['is_album']:
             target_folder: Path = target_path / actions.sanitize_filename(album_title_id)
             images: list[dict[str, str]] = success_json['data']['images']
@@ -110,68 +248,150 @@ class ImgurAlbumDownloader(Downloader):
             images: list[dict[str, str]] = [success_json['data']]
             print(f"Downloading imgur photo from gallery {album_title_id} from {url}")
 
-        # Download the images and add metadata
-        downloaded: int = 0
+        # Writes that are still pending are only known to the batch, which also serializes the lookups with its workers
+        hash_known: Optional[Callable[[Any], bool]] = None
+        if metadata_batch is not None:
+            hash_known = metadata_batch.hash_known
+        elif library is not None:
+            hash_known = library.hash_in_hashes
+        known: set[str] = set()
+        if thumbnail_prededup and hash_known is not None and not allow_duplicate_phashes:
+            candidates: list[dict[str, Any]] = [image_data for image_data in images if not image_data['is_ad'] and
+                                                not (job is not None and job.is_done(image_data['id'])) and
+                                                not (image_filter is not None and
+                                                     image_filter.rejects(image_data.get('width'), image_data.get('height'),
+                                                                          image_data.get('size'), image_data.get('type')))]
+            known = self._known_by_thumbnail(candidates, hash_known, throttle, threads)
+            if candidates and len(known) == len(candidates):
+                print(f"Skipping imgur album {album_title_id} because the thumbnails of all its {len(candidates)} images "
+                      f"match stored images.")
+                metrics.count("thumbnail_duplicates", len(known))
+                metrics.count("thumbnail_duplicate_albums")
+                return 0
+
+        # Select the images and reserve their files in album order
+        selected: list[tuple[int, dict[str, Any]]] = []
         for i, image_data in enumerate(images):
             if image_data['is_ad']:
                 if debug:
                     print(f"Skipped image {image_data['link']} because it is an ad")
                 continue  # Skip ads
-            image_title: str = "" if image_data['title'] is None else image_data['title']
-            image_description: str = "" if image_data['description'] is None else image_data['description']
-            image_url: str = image_data['link']
-            image_u: namedtuple = urlparse(image_data['link'])
-            image_epoch: int = int(image_data['datetime'])
+            if job is not None and job.is_done(image_data['id']):
+                if debug:
+                    print(f"Skipped image {image_data['link']} because it has been stored before")
+                continue  # Stored before the previous attempt has been interrupted
+            if image_filter is not None:
+                reason: Optional[str] = image_filter.rejects(image_data.get('width'), image_data.get('height'), image_data.get('size'),
+                                                             image_data.get('type'))
+                if reason is not None:
+                    print(f"Skipping image {image_data['link']} from imgur album because {reason}.")
+                    metrics.count("filtered_images")
+                    continue
+            if image_data['id'] in known:
+                print(f"Skipping image {image_data['link']} from imgur album because its thumbnail matches a stored image.")
+                metrics.count("thumbnail_duplicates")
+                if job is not None:
+                    job.mark_done(image_data['id'])
+                continue
+            selected.append((i, image_data))
+        image_files: list[Path] = [target_folder / actions.sanitize_filename(f"{i + 1:02d} {Path(urlparse(image_data['link']).path).name}")
+                                   for i, image_data in selected]
+        if naming is not None and image_files:
+            image_files = naming.unique_all(image_files)
 
-            # Download the image
-            image_file: Path = target_folder / actions.sanitize_filename(f"{i + 1:02d} {Path(image_u.path).name}")
+        # Download the images and add metadata
+        downloaded: int = 0
+        for j, ((i, image_data), image_file) in enumerate(zip(selected, image_files)):
+            image_url: str = image_data['link']
             image_file.parent.mkdir(exist_ok=True, parents=True)
             print(f"Downloading image {i+1}/{len(images)} from imgur album: {image_url}")
-            urllib.request.urlretrieve(image_url, filename=image_file)
-            if library is not None:
-                phash = perceptual_hash(image_file)
-                if library.hash_in_hashes(phash):
+            try:
+                image: DownloadedImage = download_image(image_url, image_file, max_in_memory_bytes, throttle,
+                                                        image_filter if image_filter is not None and image_filter.enabled else None)
+            except ImageRejected as e:
+                if naming is not None:
+                    naming.release(image_file)
+                # The album data does not always tell the truth, e.g. about the size of the images
+                print(f"Skipping image {image_url} from imgur album because {e.reason}.")
+                metrics.count("filtered_images")
+                continue
+            except Exception as e:
+                if not classify_failure(e):
+                    # Retry the whole album later, the images that have been stored are skipped then
+                    if naming is not None:
+                        naming.release(*image_files[j:])  # The next attempt is assigned the same names
+                    raise
+                if naming is not None:
+                    naming.release(image_file)
+                print(f"{image_url} could not be downloaded because it is gone ({e})!")
+                continue
+            on_written: Optional[Callable[[], None]] = partial(job.mark_done, image_data['id']) if job is not None else None
+            model: Optional[MetadataModel] = album_metadata.for_image(image_data, image_file) if album_metadata is not None else None
+            if metadata_batch is not None and metadata_batch.link_known(image, model):
+                print(f"The image {image_file} is already stored and has been linked to its stored copy.")
+                if archive is not None:
+                    archive.add_image(image_file, submission_id, success_json['data']['id'], image_data)
+                if on_written is not None:
+                    on_written()
+                downloaded += 1
+                continue
+            phash: Optional[Any] = None
+            if hash_known is not None:
+                with metrics.time("perceptual_hash"):
+                    phash = perceptual_hash(image.source())
+                with metrics.time("library_lookup"):
+                    duplicate: bool = hash_known(phash)
+                if duplicate:
                     if not allow_duplicate_phashes:
                         print(f"The image {image_file} was a duplicate and will be deleted!")
-                        image_file.unlink()
+                        metrics.count("phash_duplicates")
+                        image.discard()
+                        if naming is not None:
+                            naming.release(image_file)
+                        if on_written is not None:
+                            on_written()
                         continue
-                library.store_image(image_file, phash)
-                # library.save()  # TODO Interval?
+                    phash = None  # Only the first image with a hash is stored in the library
+            if archive is not None:
+                archive.add_image(image_file, submission_id, success_json['data']['id'], image_data)
             downloaded += 1
 
             # Add metadata
-            if reddit_post_metadata is not None:
-                br: str = '\n'
-                add_comment: str = f"Imgur Album: {album_title} {success_json['data']['link']} " \
-                                   f"({success_json['data'].get('images_count', '1')} images)" \
-                                   f"{(br + album_description) if album_description else ''}\n" \
-                                   f"Album Views: {success_json['data']['views']}, Image Views: {image_data['views']}, " \
-                                   f"Account name: {success_json['data']['account_url']} ({success_json['data']['account_id']})\n" \
-                                   f"Album Upvotes on Imgur: {success_json['data'].get('ups', 'N/A')}, " \
-                                   f"Points: {success_json['data'].get('points', 'N/A')}, " \
-                                   f"Score: {success_json['data'].get('score', 'N/A')}, " \
-                                   f"Number of Comments: Image {image_data.get('comment_count', 'N/A')} Album " \
-                                   f"{success_json['data'].get('comment_count', 'N/A')}.\n" \
-                                   f"Album uploaded: {dt.datetime.utcfromtimestamp(album_epoch).strftime('%Y:%m:%d %H:%M:%S')}"
-                exif, iptc, xmp = deepcopy(reddit_post_metadata)
-                exif, iptc, xmp = actions.set_time_created((exif, iptc, xmp), image_epoch)
-                if image_title:
-                    if exif.get("Exif.Image.ImageDescription", "") != "":  # Append reddit post title
-                        image_title += " - " + exif["Exif.Image.ImageDescription"]
-                    actions.set_post_title((exif, iptc, xmp), image_title)
-                if album_description:
-                    image_description = (image_description + "\n" + "(" + album_description + ")").strip()
-                if image_description:
-                    iptc["Iptc.Application2.Caption"] = image_description.strip()
-                new_comment: str = (xmp.get('Xmp.exif.UserComment', "") + "\n" + add_comment).strip()
-                exif, iptc, xmp = actions.set_long_comment((exif, iptc, xmp), new_comment)
-                xmp["Xmp.xmpMM.PreservedFileName"] = image_file.name
-                xmp["Xmp.crs.RawFileName"] = image_file.name
-                xmp["Xmp.xmpDM.album"] = album_title_id
-                actions.write_metadata(image_file, exif, iptc, xmp)
+            if metadata_batch is not None:
+                # The hash is stored in the library once the file has been written
+                metadata_batch.write(image_file, model, image.data, image.sha256, on_written, phash)
+            else:
+                image.persist()
+                if model is not None and actions.can_embed_metadata(image_file):
+                    actions.write_metadata(image_file, *model)
+                if library is not None and phash is not None:
+                    library.store_image(image_file, phash)
+                if on_written is not None:
+                    on_written()
 
         return downloaded
 
+    # noinspection PyMethodMayBeStatic
+    def _known_by_thumbnail(self, images: list[dict[str, Any]], hash_known: Callable[[Any], bool], throttle: Optional[Throttle],
+                            threads: int) -> set[str]:
+        """
+        Find the images whose thumbnails match an image in the library
+        :param images: The data of the images in the Imgur API response
+        :param hash_known: Function that checks if a perceptual hash is known, e.g. the hash_in_hashes() method of the library
+        :param throttle: If given, limit the bandwidth of the thumbnail transfers with this throttle
+        :param threads: Number of thumbnails that are downloaded in parallel
+        :return: the IDs of the known images
+        """
+        known: set[str] = set()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for image_data, phash in zip(images, executor.map(_hash_thumbnail, images, [throttle] * len(images))):
+                if phash is None:
+                    continue
+                with metrics.time("library_lookup"):
+                    if hash_known(phash):
+                        known.add(image_data['id'])
+        return known
+
 
 def test() -> int:
     credentials_file: Path = Path("credentials.json")
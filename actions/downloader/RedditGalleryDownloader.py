@@ -0,0 +1,159 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from config import Config
+from imagehashsort import ImageDatabase, perceptual_hash
+from praw.models import Submission
+
+import actions
+from actions.ImageFilter import ImageFilter
+from actions.Instrumentation import metrics
+from actions.MetadataWriter import MetadataWriteBatch
+from actions.WriteMetadata import MetadataModel
+from actions.downloader.Downloader import Downloader
+from actions.downloader.Bandwidth import Throttle
+from actions.downloader.Transfer import DownloadedImage, ImageRejected, download_image, classify_failure
+from database import URLManager, SubmissionArchive, NamingIndex, Job, get_gallery_items
+
+
+def get_gallery_title_id(submission: Any) -> str:
+    """
+    Get a gallery identifier that is both unique and human-readable
+    :param submission: praw Submission or ArchivedSubmission
+    :return: the identifier
+    """
+    return f"{submission.title} {submission.id}".strip()
+
+
+class RedditGalleryMetadata:
+    """
+    The metadata of a single reddit gallery. The metadata of each image is an overlay on top of the reddit post metadata.
+    """
+
+    def __init__(self, reddit_post_metadata: MetadataModel, submission: Any) -> None:
+        """
+        Precompute the gallery metadata.
+        :param reddit_post_metadata: The base metadata of the reddit post. It must not be modified afterwards
+        :param submission: praw Submission or ArchivedSubmission
+        """
+        self.base: MetadataModel = reddit_post_metadata
+        self.gallery_title_id: str = get_gallery_title_id(submission)
+
+    def for_image(self, item: dict[str, Any], image_file: Path) -> MetadataModel:
+        """
+        Get the metadata of a single image of the gallery
+        :param item: The gallery item, as returned by get_gallery_items()
+        :param image_file: The file the image is stored in
+        :return: the metadata model
+        """
+        exif, iptc, xmp = actions.overlay_model(self.base)
+        if item.get("caption"):
+            iptc["Iptc.Application2.Caption"] = f"{item['caption']}\n{iptc.get('Iptc.Application2.Caption', '')}".strip()
+        xmp["Xmp.xmpMM.PreservedFileName"] = image_file.name
+        xmp["Xmp.crs.RawFileName"] = image_file.name
+        xmp["Xmp.xmpDM.album"] = self.gallery_title_id
+        return exif, iptc, xmp
+
+
+class RedditGalleryDownloader(Downloader):
+    """
+    A downloader that downloads reddit galleries and sorts their images into a subfolder.
+    The images are fetched in parallel, and hashed and stored in gallery order.
+    """
+
+    def download(self, submission: Submission, cfg: Config, destination: Path, urlmanager: URLManager, library: ImageDatabase,
+                 metadata: MetadataWriteBatch, archive: SubmissionArchive, naming: NamingIndex, job: Optional[Job] = None,
+                 throttle: Optional[Throttle] = None) -> int:
+        items: list[dict[str, Any]] = get_gallery_items(submission)
+        if not items:
+            print(f"Skipping {submission.url} because its gallery is empty or has been deleted.")
+            return 0
+        allow_duplicate_hashes: bool = not cfg["reddit_downloader.discard_phashed_duplicates"]
+        gallery_metadata: Optional[RedditGalleryMetadata] = None
+        if cfg["metadata_scraper.write_metadata"]:
+            base: MetadataModel = actions.get_model_from_submission(None, submission)
+            if cfg['metadata_scraper.write_keywords']:
+                base = actions.set_keywords(base, submission, cfg)
+            gallery_metadata = RedditGalleryMetadata(base, submission)
+        image_filter: ImageFilter = ImageFilter.from_config(cfg)
+        max_in_memory_bytes: int = cfg.get("reddit_downloader.in_memory_max_bytes", 0)
+        media_url: str = cfg.get("reddit_connector.reddit_media_url", "https://i.redd.it").rstrip("/")
+        target_folder: Path = naming.shard(destination, submission.id, int(submission.created_utc)) / \
+            actions.sanitize_filename(get_gallery_title_id(submission))
+        print(f"Downloading reddit gallery {get_gallery_title_id(submission)} from {submission.url}")
+
+        # Select the images and reserve their files in gallery order, then fetch them in parallel
+        selected: list[tuple[int, dict[str, Any], str]] = []
+        for i, item in enumerate(items):
+            if job is not None and job.is_done(item["id"]):
+                continue  # Stored before the previous attempt has been interrupted
+            if item["file"].endswith(".gif") and not cfg['reddit_downloader.download_gif']:
+                continue
+            image_url: str = f"{media_url}/{item['file']}"
+            reason: Optional[str] = image_filter.rejects(item["width"], item["height"], image_format=item["type"])
+            if reason is not None:
+                print(f"Skipping image {image_url} from reddit gallery because {reason}.")
+                metrics.count("filtered_images")
+                continue
+            selected.append((i, item, image_url))
+        if not selected:
+            return 0
+        image_files: list[Path] = naming.unique_all([target_folder / actions.sanitize_filename(f"{i + 1:02d} {item['file']}")
+                                                     for i, item, _ in selected])
+        target_folder.mkdir(exist_ok=True, parents=True)
+
+        downloaded: int = 0
+        with ThreadPoolExecutor(max_workers=max(cfg.get("reddit_downloader.gallery_threads", 4), 1)) as executor:
+            futures: list[Future] = [executor.submit(download_image, image_url, image_file, max_in_memory_bytes, throttle,
+                                                     image_filter if image_filter.enabled else None)
+                                     for (_, _, image_url), image_file in zip(selected, image_files)]
+            for j, ((i, item, image_url), image_file, future) in enumerate(zip(selected, image_files, futures)):
+                print(f"Downloading image {i + 1}/{len(items)} from reddit gallery: {image_url}")
+                try:
+                    image: DownloadedImage = future.result()
+                except ImageRejected as e:
+                    naming.release(image_file)
+                    print(f"Skipping image {image_url} from reddit gallery because {e.reason}.")
+                    metrics.count("filtered_images")
+                    continue
+                except Exception as e:
+                    if not classify_failure(e):
+                        # Retry the whole gallery later, the images that have been stored are skipped then
+                        for remaining in futures:
+                            remaining.cancel()
+                        executor.shutdown(wait=True)
+                        for remaining in futures[j + 1:]:
+                            if remaining.done() and not remaining.cancelled() and remaining.exception() is None:
+                                remaining.result().discard()  # Large images have already been written to their files
+                        naming.release(*image_files[j:])  # The next attempt is assigned the same names
+                        raise
+                    naming.release(image_file)
+                    print(f"{image_url} could not be downloaded because it is gone ({e})!")
+                    continue
+                on_written: Optional[Callable[[], None]] = partial(job.mark_done, item["id"]) if job is not None else None
+                model: Optional[MetadataModel] = gallery_metadata.for_image(item, image_file) if gallery_metadata is not None else None
+                if metadata.link_known(image, model):
+                    print(f"The image {image_file} is already stored and has been linked to its stored copy.")
+                    archive.add_image(image_file, submission.id, gallery_item=item)
+                    if on_written is not None:
+                        on_written()
+                    downloaded += 1
+                    continue
+                with metrics.time("perceptual_hash"):
+                    phash = perceptual_hash(image.source())
+                with metrics.time("library_lookup"):
+                    duplicate: bool = metadata.hash_known(phash)
+                if duplicate and not allow_duplicate_hashes:
+                    print(f"The image {image_file} was a duplicate and will be deleted!")
+                    metrics.count("phash_duplicates")
+                    image.discard()
+                    naming.release(image_file)
+                    if on_written is not None:
+                        on_written()
+                    continue
+                archive.add_image(image_file, submission.id, gallery_item=item)
+                metadata.write(image_file, model, image.data, image.sha256, on_written, None if duplicate else phash)
+                downloaded += 1
+        return downloaded
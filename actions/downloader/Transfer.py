@@ -0,0 +1,294 @@
+"""
+This module contains functions to transfer images from the web, either into memory or directly into their target file
+"""
+import hashlib
+import http.client
+import time
+import urllib.request
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Union
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+
+import requests
+
+from actions.Instrumentation import metrics
+from actions.ImageFilter import ImageFilter
+from actions.downloader.Bandwidth import Throttle
+from actions.downloader.ImageHeader import ImageHeader, is_html, sniff_image
+
+_CHUNK_SIZE: int = 64 * 1024
+"""The number of bytes read from the connection at once"""
+
+_SNIFF_CHUNK_SIZE: int = 8 * 1024
+"""The number of bytes read from the connection at once until the header of the image has been read"""
+
+_SNIFF_MAX_BYTES: int = 256 * 1024
+"""The number of bytes after which the header of an image is not searched any further, e.g. because of large embedded metadata"""
+
+_IMGUR_REMOVED_PLACEHOLDER: tuple[str, int, int] = ("png", 161, 81)
+"""Format and size of the image Imgur serves instead of deleted images"""
+
+_GONE_STATUS: frozenset[int] = frozenset((404, 410))
+"""HTTP status codes of resources that have been deleted and will never be available again"""
+
+_REMOVED_PLACEHOLDERS: frozenset[str] = frozenset(("/removed.png", "/removed.jpg"))
+"""Paths that image hosts redirect deleted images to"""
+
+
+class DownloadFailure(Exception):
+    """
+    Exception that is thrown if a resource could not be downloaded
+    """
+
+    def __init__(self, url: str, reason: str, permanent: bool, *args: object) -> None:
+        """
+        :param url: URL that could not be downloaded
+        :param reason: Human-readable reason
+        :param permanent: True, if the resource is gone and retrying is pointless
+        """
+        super().__init__(reason, *args)
+        self.url: str = url
+        self.reason: str = reason
+        self.permanent: bool = permanent
+
+    @staticmethod
+    def from_status(url: str, status: int) -> "DownloadFailure":
+        """
+        Create the failure of a response with the given HTTP error status
+        :param url: Requested URL
+        :param status: HTTP status code
+        :return: the failure
+        """
+        return DownloadFailure(url, f"HTTP {status}", status in _GONE_STATUS)
+
+
+class ImageRejected(Exception):
+    """
+    Exception that is thrown if the transfer of an image has been aborted, because the image is rejected by a filter
+    """
+
+    def __init__(self, url: str, reason: str, *args: object) -> None:
+        """
+        :param url: URL of the image
+        :param reason: Human-readable reason why the image is rejected
+        """
+        super().__init__(reason, *args)
+        self.url: str = url
+        self.reason: str = reason
+
+
+def classify_failure(e: BaseException) -> Optional[bool]:
+    """
+    Check if the given exception means that a download failed permanently, e.g. because the image has been deleted,
+    or transiently, e.g. because of a timeout, a server error or rate limiting
+    :param e: Exception raised by a download
+    :return: True for permanent failures, False for transient ones, or None, if the exception is not a download failure
+    """
+    if isinstance(e, DownloadFailure):
+        return e.permanent
+    if isinstance(e, HTTPError):
+        return e.code in _GONE_STATUS
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code in _GONE_STATUS
+    if isinstance(e, (URLError, TimeoutError, ConnectionError, http.client.HTTPException, requests.RequestException)):
+        return False
+    return None
+
+
+class DownloadedImage:
+    """
+    An image that has been downloaded either into memory or into its target file.
+    Images that are kept in memory are only written to their target file by persist(), or together with their metadata.
+    """
+
+    def __init__(self, target_file: Path, data: Optional[bytes], sha256: str) -> None:
+        """
+        Init a new downloaded image
+        :param target_file: The file the image is stored in, or will be stored in
+        :param data: The image bytes, or None, if the image has already been written to the target file
+        :param sha256: Hex SHA-256 digest of the downloaded bytes
+        """
+        self.target_file: Path = target_file
+        self.data: Optional[bytes] = data
+        self.sha256: str = sha256
+
+    @property
+    def in_memory(self) -> bool:
+        """
+        Check if the image is only kept in memory
+        :return: True, if the image has not been written to its target file
+        """
+        return self.data is not None
+
+    def source(self) -> Union[Path, BytesIO]:
+        """
+        Get a source to read the image from, e.g. to calculate its perceptual hash
+        :return: a file-like object if the image is kept in memory, else the target file
+        """
+        return BytesIO(self.data) if self.data is not None else self.target_file
+
+    def persist(self) -> None:
+        """
+        Write the image to its target file, if it is only kept in memory
+        :return: None
+        """
+        if self.data is not None:
+            self.target_file.write_bytes(self.data)
+            self.data = None
+
+    def discard(self) -> None:
+        """
+        Discard the image, deleting the target file if it has already been written
+        :return: None
+        """
+        if self.data is None:
+            self.target_file.unlink(missing_ok=True)
+        self.data = None
+
+
+def download_image(url: str, target_file: Path, max_in_memory_bytes: int, throttle: Optional[Throttle] = None,
+                   image_filter: Optional[ImageFilter] = None) -> DownloadedImage:
+    """
+    Download the given image. Images up to the given size are kept in memory, larger images are written to the target file.
+    The header of the image is read while it is transferred, and the transfer is aborted as soon as the response turns out to be
+    an HTML page, the placeholder of a deleted Imgur image, or an image that is rejected by the given filter.
+    :param url: URL to download
+    :param target_file: The file to write the image into, if it is too large to be kept in memory
+    :param max_in_memory_bytes: The maximum size of images that are kept in memory. 0 writes all images to disk immediately
+    :param throttle: If given, limit the bandwidth of the transfer with the buckets of this throttle and of the host of the URL
+    :param image_filter: If given, abort the transfer of images whose format, size or file size is rejected by this filter
+    :return: the downloaded image
+    :raises HTTPError: if the server responded with an error
+    :raises DownloadFailure: if the host responded with an empty body, the placeholder of a deleted image or an HTML page
+    :raises ImageRejected: if the image is rejected by the filter
+    """
+    with metrics.time("http_transfer"):
+        start: float = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            metrics.observe("http_ttfb", time.perf_counter() - start)
+            if urlparse(response.geturl()).path in _REMOVED_PLACEHOLDERS and urlparse(url).path not in _REMOVED_PLACEHOLDERS:
+                raise DownloadFailure(url, "removed by its host", True)
+            content_length: Optional[str] = response.headers.get("Content-Length")
+            size: Optional[int] = int(content_length) if content_length is not None and content_length.isdigit() else None
+            if image_filter is not None and (reason := image_filter.rejects(size=size)) is not None:
+                metrics.count("aborted_transfers")
+                raise ImageRejected(url, reason)
+            transfer: _Transfer = _Transfer(url, response, throttle.for_url(url) if throttle is not None else None,
+                                            image_filter.max_bytes if image_filter is not None else 0)
+            transfer.check_header(image_filter)
+            image: DownloadedImage = transfer.receive(target_file, max_in_memory_bytes, size)
+    metrics.count("images_downloaded")
+    return image
+
+
+def download_bytes(url: str, throttle: Optional[Throttle] = None, max_bytes: int = 1024 * 1024) -> bytes:
+    """
+    Download a small resource into memory, e.g. a thumbnail
+    :param url: URL to download
+    :param throttle: If given, limit the bandwidth of the transfer with the buckets of this throttle and of the host of the URL
+    :param max_bytes: Abort the transfer once more bytes have been received
+    :return: the body of the response
+    :raises HTTPError: if the server responded with an error
+    :raises ImageRejected: if the resource is larger than the given size
+    """
+    with urllib.request.urlopen(url) as response:
+        transfer: _Transfer = _Transfer(url, response, throttle.for_url(url) if throttle is not None else None, max_bytes)
+        return b"".join(iter(transfer.read, b""))
+
+
+class _Transfer:
+    """
+    The body of a single response, which is received in chunks, limited by a throttle
+    """
+
+    def __init__(self, url: str, response, throttle: Optional[Throttle], max_bytes: int) -> None:
+        """
+        :param url: Requested URL
+        :param response: The response to read the body of
+        :param throttle: If given, limit the bandwidth of the transfer with this throttle
+        :param max_bytes: If greater than 0, abort the transfer once more bytes have been received
+        """
+        self.url: str = url
+        self.response = response
+        self.throttle: Optional[Throttle] = throttle
+        self.max_bytes: int = max_bytes
+        self.digest = hashlib.sha256()
+        self.received: int = 0
+        self.prefix: bytearray = bytearray()
+        """The bytes that have been received to check the header of the image, and have not been stored yet"""
+
+    def read(self, chunk_size: int = _CHUNK_SIZE) -> bytes:
+        """Read the next chunk of the body, which is empty at the end of the body"""
+        chunk: bytes = self.response.read(chunk_size)
+        if not chunk:
+            return chunk
+        metrics.count("http_bytes", len(chunk))
+        self.received += len(chunk)
+        if self.max_bytes and self.received > self.max_bytes:
+            metrics.count("aborted_transfers")
+            raise ImageRejected(self.url, f"its size is above {self.max_bytes} bytes")
+        if self.throttle is not None:
+            self.throttle.consume(len(chunk))
+        self.digest.update(chunk)
+        return chunk
+
+    def check_header(self, image_filter: Optional["ImageFilter"]) -> None:
+        """
+        Receive the beginning of the body until the header of the image has been read, and check it
+        :param image_filter: If given, check the format and the size of the image with this filter
+        :return: None
+        :raises DownloadFailure: if the body is empty, an HTML page or the placeholder of a deleted Imgur image
+        :raises ImageRejected: if the image is rejected by the filter
+        """
+        header: Optional[ImageHeader] = None
+        while len(self.prefix) < _SNIFF_MAX_BYTES and (chunk := self.read(_SNIFF_CHUNK_SIZE)):
+            self.prefix += chunk
+            if len(self.prefix) < 32:
+                continue
+            header = sniff_image(self.prefix)
+            if header is None or header.complete:
+                break
+        if not self.prefix:
+            raise DownloadFailure(self.url, "empty response", False)
+        if header is None:
+            if is_html(self.prefix):
+                metrics.count("aborted_transfers")
+                raise DownloadFailure(self.url, "the host responded with an HTML page instead of an image", False)
+            return  # Not a known image format, e.g. a video. Keep it, like the downloaders always did
+        if (header.format, header.width, header.height) == _IMGUR_REMOVED_PLACEHOLDER and \
+                (urlparse(self.url).hostname or "").endswith("imgur.com"):
+            metrics.count("aborted_transfers")
+            raise DownloadFailure(self.url, "removed by its host", True)
+        if image_filter is not None and (reason := image_filter.rejects(header.width, header.height, image_format=header.format)):
+            metrics.count("aborted_transfers")
+            raise ImageRejected(self.url, reason)
+
+    def receive(self, target_file: Path, max_in_memory_bytes: int, size: Optional[int]) -> DownloadedImage:
+        """
+        Receive the rest of the body, either into memory or into the target file
+        :param target_file: The file to write the image into, if it is too large to be kept in memory
+        :param max_in_memory_bytes: The maximum size of images that are kept in memory
+        :param size: The announced size of the body, if known
+        :return: the downloaded image
+        """
+        buffer: BytesIO = BytesIO(self.prefix)
+        buffer.seek(0, 2)
+        self.prefix = bytearray()
+        if size is None or size <= max_in_memory_bytes:
+            while buffer.tell() <= max_in_memory_bytes:
+                chunk: bytes = self.read()
+                if not chunk:
+                    return DownloadedImage(target_file, buffer.getvalue(), self.digest.hexdigest())
+                buffer.write(chunk)
+            # The image is larger than announced, spill everything to disk
+        try:
+            with target_file.open("wb") as tf:
+                tf.write(buffer.getbuffer())
+                while chunk := self.read():
+                    tf.write(chunk)
+        except BaseException:
+            target_file.unlink(missing_ok=True)  # Do not leave a partial image behind
+            raise
+        return DownloadedImage(target_file, None, self.digest.hexdigest())
@@ -1,3 +1,5 @@
+from actions.downloader.Bandwidth import BandwidthLimiter, Throttle, TokenBucket
 from actions.downloader.Downloader import Downloader
 from actions.downloader.HTTPDownloader import HTTPDownloader
 from actions.downloader.ImgurAlbumDownloader import ImgurAlbumDownloader
+from actions.downloader.RedditGalleryDownloader import RedditGalleryDownloader
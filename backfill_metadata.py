@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Write or refresh the metadata of all images in a scraped destination directory, based on the submission archive that was
+recorded while scraping. No Reddit API access is required, so the metadata scraper can be disabled while scraping and the
+metadata can be written later, e.g. after changing the keyword hierarchy in the config.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from config import Config
+
+from actions import backfill_metadata
+from download_images import load_config
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Reddit Image Scraper Metadata Backfill",
+                                     description='Write or refresh the metadata of all images that have already been scraped.')
+    parser.add_argument('-o', '--out-dir', required=False, action="store", dest="dest_dir", default='out',
+                        help='Specify the destination directory the files have been scraped into. Default is "out/"')
+    parser.add_argument('-c', '--config', required=False, action="store", dest="config_file", default=None,
+                        help='Specifies the config file to read the configuration from. Defaults to a global config file '
+                             'in the user\'s configuration directory.')
+    parser.add_argument('-j', '--jobs', required=False, action="store", type=int, dest="jobs", default=None,
+                        help='Specify the number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('-f', '--force', required=False, action="store_true", dest="force",
+                        help='Rewrite the metadata of all files, even if it is already up to date')
+    args = parser.parse_args()
+
+    dest_dir: Path = Path(args.dest_dir)
+    if not dest_dir.is_dir():
+        print(f"Destination directory {dest_dir} does not exist!", file=sys.stderr)
+        sys.exit(1)
+    cfg: Config = load_config(args.config_file)
+    backfill_metadata(dest_dir, cfg, args.jobs, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+"""
+This package contains micro-benchmarks and benchmark harnesses for performance-critical parts of the scraper.
+Run a benchmark with e.g. "python3 -m benchmark.bench_metadata_model".
+"""
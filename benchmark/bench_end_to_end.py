@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of scrape_subreddit against local stand-ins for Reddit, Imgur and the image hosts.
+The fake services run in a separate process, so the reported CPU time and peak RSS only cover the scraper.
+Exits with status 1 if --min-images-per-second is given and the throughput is below it, so it can be used as a gate.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from config import Config
+from imagehashsort import JSONImageDatabase
+
+import actions
+from benchmark.fake_services import serve
+from database import URLManager, SubmissionArchive, JobQueue
+from reddit import RedditObject
+
+_SUBREDDIT: str = "benchmark"
+
+_CONFIG: str = """
+metadata_scraper: {{
+    write_metadata: {write_metadata},
+    write_keywords: {write_metadata},
+    metadata_mode: '{metadata_mode}',
+    writer_threads: {writer_threads},
+    writer_queue_size: 32,
+    subreddit_name: 'Subreddit',
+    user_name: 'Reddit User',
+    lightroom_hierarchy_separator: '|'
+}},
+reddit_connector: {{
+    use_credential_file: true,
+    credential_file: '{credential_file}',
+    imgur_api_url: 'http://127.0.0.1:{port}/3',
+    reddit_media_url: 'http://i.redd.it'
+}},
+reddit_downloader: {{
+    download_gif: false,
+    url_history_file: 'url_history.txt',
+    in_memory_max_bytes: {in_memory_max_bytes},
+    submission_archive_file: 'submissions.jsonl',
+    pending_queue_file: 'pending.sqlite',
+    output_layout: '{output_layout}',
+    naming_index_file: '.naming_index.txt',
+    storage_mode: '{storage_mode}',
+    blob_store_dir: '.blobs',
+    phash_file: 'images.db',
+    gallery_threads: 4,
+    discard_phashed_duplicates: true,
+    keep_imgur_album_phash_duplicates: false
+}},
+instrumentation: {{
+    print_summary: false,
+    prometheus_textfile: ''
+}}
+"""
+"""The scraper configuration used for the benchmark"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the whole download path against local fake Reddit and Imgur servers")
+    parser.add_argument('-n', '--submissions', type=int, default=200, help="Number of submissions in the subreddit")
+    parser.add_argument('--album-ratio', type=float, default=0.1, help="Fraction of submissions that link to an Imgur album")
+    parser.add_argument('--gallery-ratio', type=float, default=0.0, help="Fraction of submissions that are reddit galleries")
+    parser.add_argument('--album-size', type=int, default=10, help="Number of images per Imgur album and reddit gallery")
+    parser.add_argument('--size', default="1280x720", help="Size of all images as WIDTHxHEIGHT")
+    parser.add_argument('--format', choices=("jpg", "png", "mixed"), default="jpg", help="Format of all images")
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05, help="Fraction of images that are byte-identical duplicates")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Delay of every response of the fake services")
+    parser.add_argument('--writer-threads', type=int, default=2, help="Number of metadata writer threads")
+    parser.add_argument('--in-memory-max-bytes', type=int, default=33554432, help="Maximum size of images that are kept in memory")
+    parser.add_argument('--metadata-mode', choices=("embed", "sidecar", "off"), default="embed", help="How metadata is written")
+    parser.add_argument('--output-layout', default="flat", help="Output layout of the downloaded files")
+    parser.add_argument('--storage-mode', choices=("files", "blobs"), default="files",
+                        help="Storage mode of the downloaded files, blobs requires the sidecar or off metadata mode")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the generated corpus")
+    parser.add_argument('--min-images-per-second', type=float, default=None, help="Fail if the throughput is below this value")
+    parser.add_argument('--json', action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+    width, height = (int(x) for x in args.size.split("x"))
+
+    connection, child_connection = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child_connection, args.latency_ms / 1000),
+                                     kwargs=dict(subreddit=_SUBREDDIT, submissions=args.submissions, album_ratio=args.album_ratio,
+                                                 album_size=args.album_size, size=(width, height), image_format=args.format,
+                                                 duplicate_ratio=args.duplicate_ratio, seed=args.seed,
+                                                 gallery_ratio=args.gallery_ratio), daemon=True)
+    server.start()
+    print("Generating corpus...", file=sys.stderr)
+    corpus: dict = connection.recv()
+    port: int = corpus["port"]
+    # The APIs are contacted directly, the image hosts through the fake services acting as a proxy
+    os.environ["http_proxy"] = f"http://127.0.0.1:{port}"
+    os.environ["no_proxy"] = "127.0.0.1,localhost"
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        base_dir: Path = Path(tempdir)
+        dest_dir: Path = base_dir / "out"
+        credential_file: Path = base_dir / "credentials.json"
+        credential_file.write_text(json.dumps({
+            "client_id": "benchmark", "client_secret": "benchmark", "user_agent": "RedditImageScraper benchmark",
+            "imgur_client_id": "benchmark", "oauth_url": f"http://127.0.0.1:{port}", "reddit_url": f"http://127.0.0.1:{port}",
+        }))
+        cfg: Config = Config(io.StringIO(_CONFIG.format(
+            write_metadata="false" if args.metadata_mode == "off" else "true",
+            metadata_mode="sidecar" if args.metadata_mode == "sidecar" else "embed", writer_threads=args.writer_threads,
+            credential_file=credential_file.as_posix(), port=port, in_memory_max_bytes=args.in_memory_max_bytes,
+            output_layout=args.output_layout, storage_mode=args.storage_mode)))
+        urlmanager: URLManager = URLManager(base_dir / cfg["reddit_downloader.url_history_file"])
+        library: JSONImageDatabase = JSONImageDatabase(base_dir / cfg["reddit_downloader.phash_file"])
+        archive: SubmissionArchive = SubmissionArchive(dest_dir / cfg["reddit_downloader.submission_archive_file"])
+        queue: JobQueue = JobQueue(base_dir / cfg["reddit_downloader.pending_queue_file"])
+
+        actions.metrics.reset()
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()  # Silence the per-image progress output
+        cpu_start: float = time.process_time()
+        start: float = time.perf_counter()
+        try:
+            # The limit counts downloaded images, so it must not stop the scraper before the end of the listing
+            actions.scrape_subreddit(RedditObject.from_user_string(f"r/{_SUBREDDIT}"), corpus["images"] + 1, dest_dir, cfg,
+                                     urlmanager, library, archive, queue)
+        finally:
+            elapsed: float = time.perf_counter() - start
+            cpu: float = time.process_time() - cpu_start
+            summary: str = actions.metrics.summary()
+            sys.stdout = stdout
+            archive.close()
+            queue.close()
+            connection.send("stop")
+            server.join(5)
+
+    images: float = actions.metrics.counters.get("images_downloaded", 0)
+    transferred: float = actions.metrics.counters.get("http_bytes", 0)
+    result: dict = {
+        "corpus_images": corpus["images"], "corpus_unique_images": corpus["unique_images"], "corpus_bytes": corpus["bytes"],
+        "downloaded_images": images, "seconds": elapsed, "images_per_second": images / elapsed,
+        "megabytes_per_second": transferred / elapsed / 1024 / 1024, "cpu_seconds": cpu, "cpu_utilization": cpu / elapsed,
+        "peak_rss_megabytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"Corpus: {corpus['images']} images ({corpus['unique_images']} unique), {corpus['bytes'] / 1024 / 1024:.1f} MB")
+        print(f"Downloaded {images:.0f} images in {elapsed:.2f}s: {result['images_per_second']:.1f} images/s, "
+              f"{result['megabytes_per_second']:.1f} MB/s")
+        print(f"CPU: {cpu:.2f}s ({result['cpu_utilization'] * 100:.0f}%), peak RSS: {result['peak_rss_megabytes']:.1f} MB")
+        print(summary)
+    if args.min_images_per_second is not None and result["images_per_second"] < args.min_images_per_second:
+        print(f"Throughput of {result['images_per_second']:.1f} images/s is below the required "
+              f"{args.min_images_per_second:.1f} images/s!", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
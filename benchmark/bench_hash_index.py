@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the near-duplicate search of the Hash Index on a large library of random 64-bit perceptual hashes.
+Compares the vectorized search with a Python-level scan over the same hashes, and checks that both find the same distances.
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from database import HashIndex
+
+
+def python_nearest_distance(hashes: list[int], imhash: int) -> int:
+    """The near-duplicate search as a Python-level scan"""
+    return min((h ^ imhash).bit_count() for h in hashes)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the near-duplicate search of the Hash Index")
+    parser.add_argument('-n', '--hashes', type=int, default=1_000_000, help="Number of hashes in the index")
+    parser.add_argument('-q', '--queries', type=int, default=200, help="Number of queries to measure")
+    parser.add_argument('-k', '--max-distance', type=int, default=6, help="Maximum Hamming distance of near-duplicates")
+    parser.add_argument('--python-queries', type=int, default=3, help="Number of queries to measure with the Python-level scan")
+    args = parser.parse_args()
+
+    rng: np.random.Generator = np.random.default_rng(0)
+    hashes: np.ndarray = rng.integers(0, 1 << 64, size=args.hashes, dtype=np.uint64)
+    with tempfile.TemporaryDirectory() as tempdir:
+        index_file: Path = Path(tempdir) / "images.hashes"
+        hashes.astype("<u8").tofile(index_file)
+        start: float = time.perf_counter()
+        index: HashIndex = HashIndex(index_file)
+        load_seconds: float = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for h in hashes[:10_000]:
+            index.add(int(h))
+        append_seconds: float = (time.perf_counter() - start) / 10_000
+
+        # Half of the queries are near-duplicates of a stored hash, with up to max_distance flipped bits
+        random.seed(0)
+        queries: list[int] = []
+        for i in range(args.queries):
+            query: int = int(hashes[random.randrange(args.hashes)])
+            if i % 2 == 0:
+                for bit in random.sample(range(64), random.randint(1, args.max_distance)):
+                    query ^= 1 << bit
+            else:
+                query = random.getrandbits(64)
+            queries.append(query)
+        latencies: list[float] = []
+        found: int = 0
+        for query in queries:
+            start = time.perf_counter()
+            found += index.contains_within(query, args.max_distance)
+            latencies.append(time.perf_counter() - start)
+
+        hash_list: list[int] = [int(h) for h in hashes]
+        python_latencies: list[float] = []
+        for query in queries[:args.python_queries]:
+            start = time.perf_counter()
+            expected: int = python_nearest_distance(hash_list, query)
+            python_latencies.append(time.perf_counter() - start)
+            if expected != index.nearest_distance(query):
+                print(f"The searches disagree on {query:016x}", file=sys.stderr)
+                return 1
+
+    latencies.sort()
+    print(f"Index with {args.hashes} hashes, loaded in {load_seconds * 1000:.1f} ms, appends: {append_seconds * 1e6:.1f} us each")
+    print(f"Vectorized search: {statistics.mean(latencies) * 1000:8.2f} ms mean, "
+          f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:8.2f} ms p99, {found}/{len(queries)} near-duplicates within {args.max_distance} bits")
+    if python_latencies:
+        print(f"Python scan:       {statistics.mean(python_latencies) * 1000:8.2f} ms mean "
+              f"({statistics.mean(python_latencies) / statistics.mean(latencies):.0f}x slower)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
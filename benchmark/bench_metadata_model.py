@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the metadata model of a synthetic 500-image Imgur album.
+Compares the legacy approach (deepcopy of the post metadata and nine strftime calls per image)
+with the ImgurAlbumMetadata, which shares everything but the three mappings of the post metadata.
+"""
+import argparse
+import datetime as dt
+import gc
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+import actions
+from actions.downloader.ImgurAlbumDownloader import ImgurAlbumMetadata
+
+
+def synthetic_submission() -> SimpleNamespace:
+    """
+    Create an object that looks like a praw Submission to the metadata functions
+    :return: the submission
+    """
+    return SimpleNamespace(score=1234, upvote_ratio=0.97, num_comments=56, selftext="Some self text " * 20,
+                           subreddit=SimpleNamespace(display_name="wallpapers"), permalink="/r/wallpapers/comments/abc123/title/",
+                           author=SimpleNamespace(name="exampleuser"), author_flair_text="Flair", created_utc=1650000000.0,
+                           title="A synthetic album with a reasonably long title")
+
+
+def synthetic_album(num_images: int) -> dict:
+    """
+    Create the "data" part of an Imgur API album response
+    :param num_images: Number of images in the album
+    :return: the album data
+    """
+    return {
+        'id': "AbCdEfG", 'title': "Synthetic Album", 'description': "An album description " * 10, 'datetime': 1650000000,
+        'link': "https://imgur.com/a/AbCdEfG", 'images_count': num_images, 'views': 100000, 'account_url': "exampleuser",
+        'account_id': 42, 'ups': 10, 'points': 9, 'score': 8, 'comment_count': 7, 'is_album': True,
+        'images': [{'title': f"Image {i}" if i % 2 else None, 'description': f"Description of image {i}" if i % 3 else None,
+                    'datetime': 1650000000 + i // 50, 'views': 1000 + i, 'comment_count': i % 5, 'is_ad': False,
+                    'link': f"https://i.imgur.com/img{i:05d}.png"} for i in range(num_images)],
+    }
+
+
+def legacy_album_models(base: actions.MetadataModel, album: dict) -> list[actions.MetadataModel]:
+    """The per-image metadata construction as it was done before the overlay models were introduced"""
+    ret: list[actions.MetadataModel] = []
+    album_title: str = album['title']
+    album_description: str = album['description']
+    album_title_id: str = f"{album_title} {album['id']}".strip()
+    for i, image_data in enumerate(album['images']):
+        image_title: str = "" if image_data['title'] is None else image_data['title']
+        image_description: str = "" if image_data['description'] is None else image_data['description']
+        image_epoch: int = int(image_data['datetime'])
+        br: str = '\n'
+        add_comment: str = f"Imgur Album: {album_title} {album['link']} " \
+                           f"({album.get('images_count', '1')} images)" \
+                           f"{(br + album_description) if album_description else ''}\n" \
+                           f"Album Views: {album['views']}, Image Views: {image_data['views']}, " \
+                           f"Account name: {album['account_url']} ({album['account_id']})\n" \
+                           f"Album Upvotes on Imgur: {album.get('ups', 'N/A')}, " \
+                           f"Points: {album.get('points', 'N/A')}, " \
+                           f"Score: {album.get('score', 'N/A')}, " \
+                           f"Number of Comments: Image {image_data.get('comment_count', 'N/A')} Album " \
+                           f"{album.get('comment_count', 'N/A')}.\n" \
+                           f"Album uploaded: {dt.datetime.utcfromtimestamp(album['datetime']).strftime('%Y:%m:%d %H:%M:%S')}"
+        exif, iptc, xmp = deepcopy(base)
+        for key in ("Exif.Photo.DateTimeOriginal", "Exif.Image.DateTime", "Exif.Photo.DateTimeDigitized"):
+            exif[key] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%Y:%m:%d %H:%M:%S")
+        iptc["Iptc.Application2.DateCreated"] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%Y-%m-%d")
+        iptc["Iptc.Application2.TimeCreated"] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%H:%M:%S")
+        xmp["Xmp.xmp.CreateDate"] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%Y-%M-%DT%H:%M:%S") + ".000"
+        xmp["Xmp.acdsee.datetime"] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%Y:%m:%d %H:%M:%S")
+        for key in ("Xmp.dc.date", "Xmp.xmpDM.releaseDate"):
+            xmp[key] = dt.datetime.utcfromtimestamp(image_epoch).strftime("%Y-%M-%DT%H:%M:%S")
+        if image_title:
+            if exif.get("Exif.Image.ImageDescription", "") != "":
+                image_title += " - " + exif["Exif.Image.ImageDescription"]
+            actions.set_post_title((exif, iptc, xmp), image_title)
+        if album_description:
+            image_description = (image_description + "\n" + "(" + album_description + ")").strip()
+        if image_description:
+            iptc["Iptc.Application2.Caption"] = image_description.strip()
+        new_comment: str = (xmp.get('Xmp.exif.UserComment', "") + "\n" + add_comment).strip()
+        actions.set_long_comment((exif, iptc, xmp), new_comment)
+        image_file: Path = Path(f"{i + 1:02d} img{i:05d}.png")
+        xmp["Xmp.xmpMM.PreservedFileName"] = image_file.name
+        xmp["Xmp.crs.RawFileName"] = image_file.name
+        xmp["Xmp.xmpDM.album"] = album_title_id
+        ret.append((exif, iptc, xmp))
+    return ret
+
+
+def overlay_album_models(base: actions.MetadataModel, album: dict) -> list[actions.MetadataModel]:
+    """The per-image metadata construction using ImgurAlbumMetadata"""
+    actions.format_epoch.cache_clear()  # Do not carry over cached timestamps between rounds
+    album_metadata: ImgurAlbumMetadata = ImgurAlbumMetadata(base, album)
+    return [album_metadata.for_image(image_data, Path(f"{i + 1:02d} img{i:05d}.png")) for i, image_data in enumerate(album['images'])]
+
+
+def measure(name: str, fn: Callable[[], list], rounds: int) -> None:
+    """
+    Measure the run time, the allocated memory and the garbage collections of the given function and print the result
+    :param name: Name to print
+    :param fn: Function to benchmark
+    :param rounds: Number of rounds
+    :return: None
+    """
+    gc.collect()
+    collections_before: int = sum(stat['collections'] for stat in gc.get_stats())
+    start: float = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed: float = time.perf_counter() - start
+    collections: int = sum(stat['collections'] for stat in gc.get_stats()) - collections_before
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{name:>8}: {elapsed / rounds * 1000:8.2f} ms per album, {peak / 1024:8.1f} KiB peak, {collections} GC runs in {rounds} rounds")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the metadata model of a synthetic Imgur album")
+    parser.add_argument('-n', '--images', type=int, default=500, help="Number of images in the album")
+    parser.add_argument('-r', '--rounds', type=int, default=20, help="Number of rounds to measure")
+    args = parser.parse_args()
+
+    submission = synthetic_submission()
+    base: actions.MetadataModel = actions.get_model_from_submission(None, submission)
+    album: dict = synthetic_album(args.images)
+    if [tuple(map(dict, m)) for m in overlay_album_models(base, album)] != legacy_album_models(base, album):
+        print("The overlay models differ from the legacy models!", file=sys.stderr)
+        return 1
+    print(f"Synthetic album with {args.images} images:")
+    measure("legacy", lambda: legacy_album_models(base, album), args.rounds)
+    measure("overlay", lambda: overlay_album_models(base, album), args.rounds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the RedditObject parser on a large generated target list, with long and duplicate requests.
+Compares the legacy parser, which slices off one character at a time, with the single-pass parser,
+and checks that both produce the same Reddit Objects and the same errors.
+"""
+import argparse
+import random
+import sys
+import time
+from typing import Any, Callable
+
+from reddit import RedditObject, Subreddit, User, SortMethod, TopKind, UserPageKind, NoValidRedditObjectError
+
+
+def legacy_from_user_string(user_string: str, /, default_top_kind: TopKind = next(iter(TopKind)),
+                            default_sort_method: SortMethod = next(iter(SortMethod)),
+                            default_user_page: UserPageKind = next(iter(UserPageKind))) -> RedditObject:
+    """RedditObject.from_user_string() as it was implemented before the single-pass parser was introduced"""
+    SUBREDDIT, USER = 0, 1
+
+    def parse_enum(remaining_string: str, type: Any) -> tuple[str, Any]:
+        tk = ""
+        while len(remaining_string) > 0 and remaining_string[0].isalpha():
+            tk += remaining_string[0]
+            remaining_string = remaining_string[1:]
+        if len(tk) == 0:
+            raise NoValidRedditObjectError(user_string, f"Expected {type}, instead got {remaining_string}")
+        try:
+            return remaining_string, type[tk.upper()]
+        except KeyError:
+            raise NoValidRedditObjectError(user_string, f"Not a {type}: {rem}")
+
+    def parse_topkind(rem: str) -> tuple[str, TopKind]:
+        return parse_enum(rem, TopKind)
+
+    def parse_sortmethod(rem: str) -> tuple[str, SortMethod]:
+        return parse_enum(rem, SortMethod)
+
+    def parse_userpage(rem: str) -> tuple[str, SortMethod]:
+        return parse_enum(rem, UserPageKind)
+
+    def parse_slashes(rem: str, expect=False) -> str:
+        if len(rem) == 0 or rem[0] != '/':
+            if expect:
+                raise NoValidRedditObjectError(user_string, f"Expected a slash before {rem}")
+            else:
+                return rem
+        while len(rem) > 0 and rem[0] == '/':
+            rem = rem[1:]
+        return rem
+
+    def parse_variable_name(rem: str) -> tuple[str, str]:
+        """Parse a variable name given like variable=value... and return "value..." """
+        if len(rem) == 0:
+            raise NoValidRedditObjectError(user_string, f"Expected a variable identifier after the question mark, instead got {rem}")
+        ret = ""
+        while len(rem) > 0 and rem[0] != '=':
+            ret += rem[0]
+            rem = rem[1:]
+        if len(rem) > 0 and rem[0] == '=':
+            rem = rem[1:]
+        return rem, ret
+
+    rem: str = user_string.strip()
+
+    # Parse the protocol
+    if rem.lower().startswith("https://"):
+        https = True
+        rem = rem[len("https://"):]
+    elif rem.lower().startswith("http://"):
+        https = False
+        rem = rem[len("http://"):]
+    else:
+        https = True
+    rem = parse_slashes(rem)
+
+    # Parse the host
+    if rem.lower().startswith("www.reddit.com/"):
+        rem = rem[len("www.reddit.com/"):]
+    elif rem.lower().startswith("reddit.com/"):
+        rem = rem[len("reddit.com/"):]
+    rem = parse_slashes(rem)
+
+    # Parse the kind
+    if rem.lower().startswith("r/"):
+        kind = SUBREDDIT
+        rem = rem[len("r/"):]
+    elif rem.lower().startswith("user/"):
+        kind = USER
+        rem = rem[len("user/"):]
+    elif rem.lower().startswith("u/"):
+        kind = USER
+        rem = rem[len("u/"):]
+    else:
+        kind = SUBREDDIT
+    rem = parse_slashes(rem)
+
+    # Parse Name
+    def is_allowable_character(char: str):
+        return char.isalnum() or char == '_'
+
+    if len(rem) == 0 or not is_allowable_character(rem[0]):
+        raise NoValidRedditObjectError(user_string, f"Invalid Subreddit or User name: {rem}")
+    name: str = ""
+    while len(rem) > 0 and is_allowable_character(rem[0]):
+        name += rem[0]
+        rem = rem[1:]
+    if len(name) == 0:
+        raise NoValidRedditObjectError(user_string, f"Empty name! Remaining: {rem}")
+
+    sort_method = default_sort_method
+    top_kind = default_top_kind
+    user_page = default_user_page
+    # Parse specifiers
+    if len(rem) > 0:
+        rem = parse_slashes(rem, expect=True)
+        if kind is USER:
+            rem, user_page = parse_userpage(rem)
+            rem = parse_slashes(rem)
+        if len(rem) > 0:
+            rem, sort_method = parse_sortmethod(rem)
+    rem = parse_slashes(rem)
+    while len(rem) > 0:
+        if rem[0] == '?' or rem[0] == '&':
+            rem = rem[1:]
+            rem, varname = parse_variable_name(rem)
+            if varname == 't':
+                rem, top_kind = parse_topkind(rem)
+            else:
+                while len(rem) > 0 and (rem[0].isalnum() or rem[0] == '_'):
+                    rem = rem[1:]
+        else:
+            raise NoValidRedditObjectError(user_string, f"Must have a question mark: {rem}")
+    rem = parse_slashes(rem)
+    if len(rem) > 0:
+        raise NoValidRedditObjectError(user_string, f"Unexpected input: \"{rem}\"")
+
+    if kind is USER:
+        return User(user_name=name.lower(), user_page_kind=user_page, sort_method=sort_method, top_kind=top_kind, https=https)
+    elif kind is SUBREDDIT:
+        return Subreddit(subreddit_name=name.lower(), sort_method=sort_method, top_kind=top_kind, https=https)
+    else:
+        raise NoValidRedditObjectError(user_string, f"Invalid Kind {kind}")
+
+
+def synthetic_targets(count: int, duplicate_ratio: float, seed: int) -> list[str]:
+    """
+    Generate a target list
+    :param count: Number of lines
+    :param duplicate_ratio: Fraction of lines that repeat an earlier line
+    :param seed: Random seed
+    :return: the lines
+    """
+    rnd: random.Random = random.Random(seed)
+    lines: list[str] = []
+    for i in range(count):
+        if lines and rnd.random() < duplicate_ratio:
+            lines.append(rnd.choice(lines))
+            continue
+        name: str = f"Target_{i}_" + "x" * rnd.randint(3, 200)
+        match rnd.randint(0, 5):
+            case 0:
+                lines.append(name)
+            case 1:
+                lines.append(f"r/{name}")
+            case 2:
+                lines.append(f"https://www.reddit.com/r/{name}/top/?t=week&" + "&".join(f"var{j}=value{j}" for j in range(rnd.randint(0, 20))))
+            case 3:
+                lines.append(f"u/{name}/saved/new")
+            case 4:
+                lines.append(f"http://reddit.com/user/{name}/submitted/controversial?t=all")
+            case _:
+                lines.append(f"r/{name}^invalid")
+    return lines
+
+
+def parse_all(parser: Callable[[str], RedditObject], lines: list[str]) -> list[Any]:
+    """Parse all lines with the given parser, returning each Reddit Object or the arguments of each error"""
+    ret: list[Any] = []
+    for line in lines:
+        try:
+            ret.append(parser(line))
+        except NoValidRedditObjectError as e:
+            ret.append(e.args)
+    return ret
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the RedditObject parser on a large target list")
+    parser.add_argument('-n', '--lines', type=int, default=5000, help="Number of lines in the target list")
+    parser.add_argument('-d', '--duplicate-ratio', type=float, default=0.3, help="Fraction of duplicate lines")
+    parser.add_argument('-r', '--rounds', type=int, default=5, help="Number of rounds to measure")
+    args = parser.parse_args()
+
+    lines: list[str] = synthetic_targets(args.lines, args.duplicate_ratio, 0)
+    legacy: list[Any] = parse_all(legacy_from_user_string, lines)
+    single_pass: list[Any] = parse_all(RedditObject.from_user_string, lines)
+    for line, a, b in zip(lines, legacy, single_pass):
+        if a != b or (isinstance(a, RedditObject) and (a.https, a.get_full_url()) != (b.https, b.get_full_url())):
+            print(f"The parsers disagree on {line}: {a} != {b}", file=sys.stderr)
+            return 1
+    print(f"Target list with {args.lines} lines, {sum(len(line) for line in lines) // len(lines)} characters on average:")
+    for name, fn in (("legacy", lambda: parse_all(legacy_from_user_string, lines)),
+                     ("single", lambda: parse_all(RedditObject.from_user_string, lines)),
+                     ("bulk", lambda: RedditObject.from_user_strings(lines))):
+        start: float = time.perf_counter()
+        for _ in range(args.rounds):
+            fn()
+        print(f"{name:>8}: {(time.perf_counter() - start) / args.rounds * 1000:8.2f} ms per list")
+    targets, errors = RedditObject.from_user_strings(lines)
+    print(f"{len(targets)} unique targets, {len(errors)} invalid lines")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Local stand-ins for the Reddit API, the Imgur API and the i.redd.it / i.imgur.com image hosts, serving a generated corpus.
+The Reddit and Imgur APIs are served directly; the image hosts are served as an HTTP forward proxy,
+so the scraper can download the original "http://i.redd.it/..." URLs by setting the http_proxy environment variable.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from multiprocessing.connection import Connection
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+
+class Corpus:
+    """
+    A generated set of submissions, Imgur albums and images
+    """
+
+    def __init__(self, subreddit: str, submissions: int, album_ratio: float = 0.1, album_size: int = 10,
+                 size: tuple[int, int] = (1280, 720), image_format: str = "jpg", duplicate_ratio: float = 0.0, seed: int = 0,
+                 gallery_ratio: float = 0.0) -> None:
+        """
+        Generate a new corpus
+        :param subreddit: Name of the subreddit that all submissions are posted in
+        :param submissions: Number of submissions
+        :param album_ratio: Fraction of submissions that link to an Imgur album instead of an i.redd.it image
+        :param album_size: Number of images per album and per reddit gallery
+        :param size: Size of all images as (width, height)
+        :param image_format: "jpg", "png" or "mixed"
+        :param duplicate_ratio: Fraction of images that are byte-identical copies of an earlier image, served under a new URL
+        :param seed: Random seed
+        :param gallery_ratio: Fraction of submissions that are reddit galleries
+        """
+        self.subreddit: str = subreddit
+        self.posts: list[dict[str, Any]] = []
+        """The data of all submissions, as returned in a Reddit listing, newest first"""
+        self.albums: dict[str, dict[str, Any]] = {}
+        """The "data" part of the Imgur API response of every album, by album ID"""
+        self.images: dict[str, bytes] = {}
+        """The bytes of all images, by URL path, e.g. "/abc123.jpg" """
+        self.total_bytes: int = 0
+        self._random: random.Random = random.Random(seed)
+        self._size: tuple[int, int] = size
+        self._format: str = image_format
+        self._duplicate_ratio: float = duplicate_ratio
+        self.unique: list[bytes] = []
+        """The bytes of all distinct images"""
+        created: int = 1650000000
+        for i in range(submissions):
+            post_id: str = f"b{i:06d}"
+            created -= 60
+            gallery: Optional[dict[str, Any]] = None
+            kind: float = self._random.random()
+            if kind < album_ratio:
+                album_id: str = f"A{i:06d}"
+                url: str = f"https://imgur.com/a/{album_id}"
+                self.albums[album_id] = self._album(album_id, album_size, created)
+                preview: Optional[dict] = None
+            elif kind < album_ratio + gallery_ratio:
+                url = f"https://www.reddit.com/gallery/{post_id}"
+                gallery = self._gallery(post_id, album_size)
+                preview = None
+            else:
+                url = f"http://i.redd.it/{self._image(post_id)}"
+                preview = {"images": [{"source": {"url": url, "width": size[0], "height": size[1]},
+                                       "resolutions": [{"url": url, "width": 108, "height": 108 * size[1] // size[0]}]}]}
+            post: dict[str, Any] = {
+                "id": post_id, "name": f"t3_{post_id}", "title": f"Benchmark submission {i}", "selftext": "",
+                "author": "benchmarkuser", "author_flair_text": None, "score": 100 + i, "upvote_ratio": 0.95, "num_comments": i % 50,
+                "created_utc": float(created), "subreddit": subreddit, "subreddit_name_prefixed": f"r/{subreddit}",
+                "permalink": f"/r/{subreddit}/comments/{post_id}/benchmark_submission_{i}/", "url": url, "is_self": False,
+            }
+            if preview is not None:
+                post["preview"] = preview
+            if gallery is not None:
+                post.update(gallery)
+            self.posts.append(post)
+        self._index: dict[str, int] = {post["name"]: i for i, post in enumerate(self.posts)}
+
+    def _image(self, name: str) -> str:
+        """Generate an image, or pick a duplicate of an earlier one, and return its file name"""
+        extension: str = self._format if self._format != "mixed" else self._random.choice(("jpg", "png"))
+        if self.unique and self._random.random() < self._duplicate_ratio:
+            data: bytes = self._random.choice(self.unique)
+            extension = "png" if data.startswith(b"\x89PNG") else "jpg"
+        else:
+            # Upscaling random noise yields smooth images with distinct perceptual hashes
+            noise: Image.Image = Image.frombytes("RGB", (8, 8), self._random.randbytes(8 * 8 * 3))
+            buffer: BytesIO = BytesIO()
+            noise.resize(self._size, Image.BICUBIC).save(buffer, "PNG" if extension == "png" else "JPEG", quality=90)
+            data = buffer.getvalue()
+            self.unique.append(data)
+        file_name: str = f"{name}.{extension}"
+        self.images[f"/{file_name}"] = data
+        self.total_bytes += len(data)
+        return file_name
+
+    def _album(self, album_id: str, album_size: int, created: int) -> dict[str, Any]:
+        """Generate the Imgur API data of an album"""
+        images: list[dict[str, Any]] = []
+        for i in range(album_size):
+            file_name: str = self._image(f"{album_id}{i:03d}")
+            images.append({
+                "id": file_name.split(".")[0], "title": f"Image {i}", "description": None, "datetime": created, "views": 1000 + i,
+                "comment_count": None, "is_ad": False, "link": f"http://i.imgur.com/{file_name}",
+                "type": "image/png" if file_name.endswith(".png") else "image/jpeg",
+                "width": self._size[0], "height": self._size[1], "size": len(self.images[f"/{file_name}"]),
+            })
+        return {
+            "id": album_id, "title": f"Benchmark album {album_id}", "description": None, "datetime": created,
+            "link": f"https://imgur.com/a/{album_id}", "images_count": album_size, "views": 10000, "account_url": "benchmarkuser",
+            "account_id": 1, "ups": 1, "points": 1, "score": 1, "comment_count": 0, "is_album": True, "images": images,
+        }
+
+    def _gallery(self, post_id: str, gallery_size: int) -> dict[str, Any]:
+        """Generate the gallery_data and media_metadata of a reddit gallery"""
+        items: list[dict[str, Any]] = []
+        media_metadata: dict[str, dict[str, Any]] = {}
+        for i in range(gallery_size):
+            file_name: str = self._image(f"{post_id}g{i:03d}")
+            media_id, extension = file_name.split(".")
+            items.append({"media_id": media_id, "id": i, "caption": f"Caption {i}" if i % 2 == 0 else ""})
+            media_metadata[media_id] = {"status": "valid", "e": "Image", "m": f"image/{extension}", "id": media_id,
+                                        "s": {"u": f"https://preview.redd.it/{file_name}", "x": self._size[0], "y": self._size[1]}}
+        return {"is_gallery": True, "gallery_data": {"items": items}, "media_metadata": media_metadata}
+
+    def thumbnail(self, path: str) -> Optional[bytes]:
+        """
+        Get the small thumbnail of an Imgur image, which is requested with the suffix "t" on the image ID, e.g. "/abc123t.jpg"
+        :param path: URL path of the thumbnail
+        :return: the thumbnail as JPEG, at most 160x160 pixels, or None, if there is no such image
+        """
+        stem: str = path.rsplit(".", 1)[0]
+        if not stem.endswith("t"):
+            return None
+        data: Optional[bytes] = self.images.get(f"{stem[:-1]}.jpg") or self.images.get(f"{stem[:-1]}.png")
+        if data is None:
+            return None
+        image: Image.Image = Image.open(BytesIO(data)).convert("RGB")
+        image.thumbnail((160, 160))
+        buffer: BytesIO = BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        return buffer.getvalue()
+
+    def listing(self, after: Optional[str], limit: int) -> dict[str, Any]:
+        """
+        Get a page of the subreddit listing
+        :param after: Fullname of the last submission of the previous page, or None for the first page
+        :param limit: Page size
+        :return: the listing, as returned by the Reddit API
+        """
+        start: int = self._index[after] + 1 if after in self._index else 0
+        children: list[dict[str, Any]] = [{"kind": "t3", "data": post} for post in self.posts[start:start + limit]]
+        return {"kind": "Listing", "data": {"after": children[-1]["data"]["name"] if start + limit < len(self.posts) else None,
+                                            "before": None, "dist": len(children), "children": children}}
+
+
+    def info(self, fullnames: list[str]) -> dict[str, Any]:
+        """
+        Look up the given submissions. Their scores have grown by one since they have been listed, so a refresh has something to update
+        :param fullnames: Fullnames of the submissions
+        :return: the listing of the existing submissions, as returned by the Reddit API
+        """
+        children: list[dict[str, Any]] = [{"kind": "t3", "data": {**self.posts[self._index[fullname]],
+                                                                  "score": self.posts[self._index[fullname]]["score"] + 1}}
+                                          for fullname in fullnames if fullname in self._index]
+        return {"kind": "Listing", "data": {"after": None, "before": None, "dist": len(children), "children": children}}
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """
+    A request handler that serves the Reddit API, the Imgur API and, as a forward proxy, the image hosts
+    """
+    protocol_version: str = "HTTP/1.1"
+    corpus: Corpus
+    latency: float = 0.0
+    """Delay of every response, in seconds"""
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        time.sleep(self.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data: Any, status: int = 200) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path: str = urlparse(self.path).path.rstrip("/")
+        if path == "/api/v1/access_token":
+            self._send_json({"access_token": "benchmark", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+        elif path == "/api/search_reddit_names":
+            self._send_json({"names": [self.corpus.subreddit]})
+        else:
+            self._send_json({"message": "Not Found", "error": 404}, 404)
+
+    def do_GET(self) -> None:
+        u = urlparse(self.path)
+        if u.netloc in ("i.redd.it", "i.imgur.com"):  # Proxy request for an image
+            data: Optional[bytes] = self.corpus.images.get(u.path)
+            if data is None and u.netloc == "i.imgur.com":
+                data = self.corpus.thumbnail(u.path)
+            if data is None:
+                self._send(404, b"Not Found", "text/plain")
+            else:
+                self._send(200, data, "image/png" if data.startswith(b"\x89PNG") else "image/jpeg")
+            return
+        parts: list[str] = [part for part in u.path.split("/") if part]
+        if len(parts) == 3 and parts[0] == "r" and parts[1] == self.corpus.subreddit:
+            query: dict[str, list[str]] = parse_qs(u.query)
+            self._send_json(self.corpus.listing(query.get("after", [None])[0], int(query.get("limit", ["25"])[0])))
+        elif parts == ["api", "info"]:
+            fullnames: list[str] = parse_qs(u.query).get("id", [""])[0].split(",")
+            self._send_json(self.corpus.info(fullnames))
+        elif len(parts) == 3 and parts[0] == "3" and parts[1] in ("album", "gallery") and parts[2] in self.corpus.albums:
+            self._send_json({"data": self.corpus.albums[parts[2]], "success": True, "status": 200})
+        else:
+            self._send_json({"message": "Not Found", "error": 404}, 404)
+
+
+def serve(connection: Connection, latency: float, **corpus_args: Any) -> None:
+    """
+    Generate a corpus and serve it until the process is terminated. Intended as the target of a separate process,
+    so the CPU time and memory of the fake services are not attributed to the scraper.
+    :param connection: Pipe to send the port and the corpus statistics through, once the server is ready
+    :param latency: Delay of every response, in seconds
+    :param corpus_args: Arguments of the Corpus
+    :return: None
+    """
+    corpus: Corpus = Corpus(**corpus_args)
+    handler = type("Handler", (FakeServiceHandler,), {"corpus": corpus, "latency": latency})
+    server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    connection.send({"port": server.server_address[1], "images": len(corpus.images), "bytes": corpus.total_bytes,
+                     "unique_images": len(corpus.unique)})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection.recv()  # Serve until the parent asks to stop
+    server.shutdown()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+
+class BlobStore:
+    """
+    A content-addressed store that keeps every unique downloaded file exactly once.
+    Blobs are addressed by the SHA-256 digest of the downloaded bytes and are materialized at their target paths as hard links,
+    or as symbolic links where hard links are not possible.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """
+        Init a new Blob Store in the given directory.
+        The directory should be on the same file system as all target paths, so hard links can be used.
+        :param root: Root directory of the store
+        """
+        super().__init__()
+        self.root: Path = root
+
+    def blob_path(self, digest: str) -> Path:
+        """
+        Get the path of the blob with the given digest
+        :param digest: Hex SHA-256 digest of the blob
+        :return: the path of the blob, regardless of whether it exists
+        """
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def contains(self, digest: str) -> bool:
+        """
+        Check if a blob with the given digest is already stored
+        :param digest: Hex SHA-256 digest
+        :return: True, if the blob is stored
+        """
+        return self.blob_path(digest).is_file()
+
+    def adopt(self, target_file: Path, digest: str) -> None:
+        """
+        Add the given file to the store, under the given digest. The file stays in place.
+        If the file cannot be hard linked into the store, it is moved into the store and replaced by a symbolic link.
+        :param target_file: File to add
+        :param digest: Hex SHA-256 digest of the downloaded bytes of the file
+        :return: None
+        """
+        blob: Path = self.blob_path(digest)
+        if blob.is_file():
+            return
+        blob.parent.mkdir(exist_ok=True, parents=True)
+        try:
+            os.link(target_file, blob)
+        except FileExistsError:
+            return  # Another scraper process has stored the same blob in the meantime
+        except OSError:
+            shutil.move(target_file, blob)
+            self._symlink(blob, target_file)
+
+    def materialize(self, digest: str, target_file: Path) -> None:
+        """
+        Make the blob with the given digest available at the given target path
+        :param digest: Hex SHA-256 digest of a stored blob
+        :param target_file: Target path
+        :return: None
+        """
+        blob: Path = self.blob_path(digest)
+        target_file.parent.mkdir(exist_ok=True, parents=True)
+        if target_file.exists() or target_file.is_symlink():
+            if target_file.exists() and os.path.samefile(target_file, blob):
+                return
+            target_file.unlink()
+        try:
+            os.link(blob, target_file)
+        except OSError:
+            self._symlink(blob, target_file)
+
+    def _symlink(self, blob: Path, target_file: Path) -> None:
+        try:
+            target_file.symlink_to(os.path.relpath(blob.absolute(), target_file.parent.absolute()))
+        except OSError as e:
+            print(f"Could not link {target_file} to {blob}, storing a copy instead: {e}", file=sys.stderr)
+            shutil.copy2(blob, target_file)
@@ -0,0 +1,127 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from database.FileLock import locked
+
+
+class FailureCache:
+    """
+    A persistent negative cache of URLs that could not be downloaded.
+    URLs that are permanently gone are never retried. URLs that failed transiently are retried in exponentially growing intervals,
+    across runs, until they have been downloaded successfully.
+    The failures are appended to a JSON Lines file, and the latest record of every URL is its current state.
+    """
+
+    def __init__(self, cache_file: Path, retry_seconds: float = 3600.0, max_retry_seconds: float = 7 * 24 * 3600.0, shared: bool = False,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        Init a new Failure Cache, loading all failures from the given cache file
+        :param cache_file: File to load the failures from and to append new failures to
+        :param retry_seconds: Seconds to wait before a URL that failed transiently once is retried. The interval doubles with every failure
+        :param max_retry_seconds: Maximum number of seconds to wait before a URL that failed transiently is retried
+        :param shared: If True, the cache file is shared with other scraper processes. Failures that have been recorded by other
+                       processes are picked up before every lookup, and all writes are done under a file lock.
+        :param clock: Function that returns the current time as epoch seconds
+        """
+        super().__init__()
+        self.cache_file: Path = cache_file
+        self.retry_seconds: float = retry_seconds
+        self.max_retry_seconds: float = max_retry_seconds
+        self.shared: bool = shared
+        self.clock: Callable[[], float] = clock
+        self.failures: dict[str, dict[str, Any]] = {}
+        """The latest failure record of every URL that has not been downloaded successfully since"""
+        self._lock: threading.Lock = threading.Lock()
+        self._offset: int = 0
+        """The number of bytes of the cache file that have been read"""
+        self.cache_file.parent.mkdir(exist_ok=True, parents=True)
+        self.cache_file.touch(exist_ok=True)
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """Read all complete records that have been appended to the cache file since it has been read last"""
+        if self.cache_file.stat().st_size <= self._offset:
+            return
+        with self.cache_file.open("rb") as cf:
+            cf.seek(self._offset)
+            data: bytes = cf.read()
+        end: int = data.rfind(b"\n") + 1  # A line without a newline might still be written, or the last write has been interrupted
+        self._offset += end
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            if not line.strip():
+                continue
+            try:
+                record: dict[str, Any] = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"File {self.cache_file.as_posix()} contained an invalid record: {line}", file=sys.stderr)
+                continue
+            if record.get("failures", 0) > 0:
+                self.failures[record["url"]] = record
+            else:
+                self.failures.pop(record["url"], None)
+
+    def _append(self, record: dict[str, Any]) -> None:
+        """Append the given record to the cache file. The lock must be held"""
+        with self.cache_file.open("ab") as cf, locked(cf):
+            if self.shared:
+                self._refresh()
+            # Anything after the last complete record has been left by an interrupted write, and must not corrupt this record
+            separator: bytes = b"\n" if cf.seek(0, 2) > self._offset else b""
+            cf.write(separator + json.dumps(record).encode("utf-8") + b"\n")
+            self._offset = cf.tell()  # All appends are locked, so the file has been read up to this record
+
+    def blocked(self, url: str) -> Optional[str]:
+        """
+        Check if the given URL must not be downloaded now
+        :param url: URL to check
+        :return: the reason why the URL is skipped, or None, if it may be downloaded
+        """
+        with self._lock:
+            if self.shared:
+                self._refresh()
+            record: Optional[dict[str, Any]] = self.failures.get(url)
+        if record is None:
+            return None
+        if record["permanent"]:
+            return f"it is gone ({record['reason']})"
+        if record["retry_at"] > self.clock():
+            return f"it failed {record['failures']} time{'s' if record['failures'] != 1 else ''} ({record['reason']}) and will be retried after " \
+                   f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['retry_at']))}"
+        return None
+
+    def record(self, url: str, permanent: bool, reason: str) -> None:
+        """
+        Record a failed download of the given URL
+        :param url: URL that could not be downloaded
+        :param permanent: If True, the URL is gone and will never be retried. Otherwise, it is retried after a backoff interval
+        :param reason: Human-readable reason of the failure
+        :return: None
+        """
+        with self._lock:
+            if self.shared:
+                self._refresh()
+            previous: Optional[dict[str, Any]] = self.failures.get(url)
+            failures: int = previous["failures"] + 1 if previous is not None else 1
+            backoff: float = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+            record: dict[str, Any] = {"url": url, "permanent": permanent, "failures": failures, "reason": reason,
+                                      "retry_at": self.clock() + backoff}
+            self._append(record)
+            self.failures[url] = record
+
+    def forget(self, url: str) -> None:
+        """
+        Forget all failures of the given URL, e.g. after it has been downloaded successfully
+        :param url: URL
+        :return: None
+        """
+        with self._lock:
+            if self.shared:
+                self._refresh()
+            if url not in self.failures:
+                return
+            self._append({"url": url, "failures": 0})
+            del self.failures[url]
@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def locked(file: IO) -> Iterator[IO]:
+    """
+    Hold an exclusive advisory lock on the given file, which must be open for writing,
+    so several scraper processes can append to the same file without interleaving their records.
+    POSIX record locks are used, since they also work on network file systems. On platforms without fcntl, no lock is taken.
+    :param file: File to lock
+    :return: a context manager that yields the file and flushes it before the lock is released
+    """
+    if fcntl is None:
+        yield file
+        file.flush()
+        return
+    fcntl.lockf(file, fcntl.LOCK_EX)
+    try:
+        yield file
+    finally:
+        file.flush()
+        fcntl.lockf(file, fcntl.LOCK_UN)
@@ -0,0 +1,136 @@
+import os
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from database.FileLock import locked
+
+_POPCOUNT_TABLE: np.ndarray = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+"""The number of set bits of every byte, for NumPy versions without bitwise_count()"""
+
+
+def hash_to_int(imhash: Any) -> int:
+    """
+    Convert the given perceptual hash to an integer
+    :param imhash: 64-bit perceptual hash, as an integer or as an object whose string representation is hexadecimal, e.g. an ImageHash
+    :return: the hash as unsigned 64-bit integer
+    :raises ValueError: if the hash is not a hexadecimal number of at most 64 bits
+    """
+    value: int = imhash if isinstance(imhash, int) else int(str(imhash), 16)
+    if not 0 <= value < 1 << 64:
+        raise ValueError(f"Not a 64-bit perceptual hash: {imhash}")
+    return value
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Count the set bits of every element of the given uint64 array"""
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0 and newer
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class HashIndex:
+    """
+    An index of 64-bit perceptual hashes, packed into a contiguous NumPy array,
+    that finds near-duplicates by the Hamming distance of their hashes with vectorized XOR and popcount.
+    The hashes are appended to an index file as little-endian 64-bit integers, so the index can be loaded without rehashing any image.
+    """
+
+    def __init__(self, index_file: Optional[Path] = None, shared: bool = False) -> None:
+        """
+        Init a new Hash Index, loading all hashes from the given index file
+        :param index_file: If given, the file to load the hashes from and to append new hashes to
+        :param shared: If True, the index file is shared with other scraper processes. Hashes that have been added by other
+                       processes are picked up before every search, and all appends are done under a file lock.
+        """
+        super().__init__()
+        self.index_file: Optional[Path] = index_file
+        self.shared: bool = shared
+        self._hashes: np.ndarray = np.zeros(1024, dtype=np.uint64)
+        """The packed hashes. Only the first _size entries are used, the rest is capacity for appends"""
+        self._size: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._offset: int = 0
+        """The number of bytes of the index file that have been read"""
+        if self.index_file is not None:
+            self.index_file.parent.mkdir(exist_ok=True, parents=True)
+            self.index_file.touch(exist_ok=True)
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _append(self, values: np.ndarray) -> None:
+        """Append the given hashes to the in-memory array, growing it if necessary"""
+        required: int = self._size + len(values)
+        if required > len(self._hashes):
+            grown: np.ndarray = np.zeros(max(required, 2 * len(self._hashes)), dtype=np.uint64)
+            grown[:self._size] = self._hashes[:self._size]
+            self._hashes = grown
+        self._hashes[self._size:required] = values
+        self._size = required
+
+    def _refresh(self) -> None:
+        """Read all complete hashes that have been appended to the index file since it has been read last"""
+        if self.index_file.stat().st_size <= self._offset:
+            return
+        with self.index_file.open("rb") as idf:
+            idf.seek(self._offset)
+            data: bytes = idf.read()
+        end: int = len(data) - len(data) % 8  # Another process might still be writing the last hash
+        self._offset += end
+        self._append(np.frombuffer(data[:end], dtype="<u8").astype(np.uint64))
+
+    def add(self, imhash: Any) -> None:
+        """
+        Add the given hash to the index
+        :param imhash: 64-bit perceptual hash
+        :return: None
+        """
+        self.add_all([imhash])
+
+    def add_all(self, imhashes: Iterable[Any]) -> None:
+        """
+        Add the given hashes to the index with a single write.
+        An incomplete hash at the end of the index file, which is left behind if a process is killed while it appends,
+        is truncated first, so all following hashes stay aligned.
+        :param imhashes: 64-bit perceptual hashes
+        :return: None
+        """
+        values: np.ndarray = np.array([hash_to_int(imhash) for imhash in imhashes], dtype="<u8")
+        with self._lock:
+            if self.index_file is not None:
+                with self.index_file.open("ab") as idf, locked(idf):
+                    self._refresh()
+                    # All appends are locked, so an incomplete hash cannot be written by another process at the moment
+                    if idf.seek(0, os.SEEK_END) > self._offset:
+                        idf.truncate(self._offset)
+                    idf.write(values.tobytes())
+                self._offset += 8 * len(values)  # The file has been read up to these hashes, since all appends are locked
+            self._append(values.astype(np.uint64))
+
+    def nearest_distance(self, imhash: Any) -> Optional[int]:
+        """
+        Get the Hamming distance of the given hash to the most similar hash in the index
+        :param imhash: 64-bit perceptual hash
+        :return: the distance in bits, or None, if the index is empty
+        """
+        with self._lock:
+            if self.shared and self.index_file is not None:
+                self._refresh()
+            if self._size == 0:
+                return None
+            distances: np.ndarray = _popcount(self._hashes[:self._size] ^ np.uint64(hash_to_int(imhash)))
+        return int(distances.min())
+
+    def contains_within(self, imhash: Any, max_distance: int) -> bool:
+        """
+        Check if the index contains a hash within the given Hamming distance of the given hash
+        :param imhash: 64-bit perceptual hash
+        :param max_distance: Maximum number of differing bits
+        :return: True, if a near-duplicate is in the index
+        """
+        distance: Optional[int] = self.nearest_distance(imhash)
+        return distance is not None and distance <= max_distance
@@ -0,0 +1,309 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from database.SQLiteConnection import connect_shared
+
+_PENDING, _CLAIMED, _FAILED = 0, 1, 2
+
+
+class Job:
+    """
+    A submission that has been claimed from the Job Queue
+    """
+
+    def __init__(self, queue: "JobQueue", seq: int, submission_id: str, target: str, record: dict[str, Any], attempts: int,
+                 done: set[str]) -> None:
+        """
+        Init a new claimed job. Jobs shall only be created by JobQueue.claim()
+        :param queue: The queue the job has been claimed from
+        :param seq: Sequence number of the job in the queue
+        :param submission_id: ID of the submission
+        :param target: The printable name of the RedditObject the submission has been listed in
+        :param record: The Submission Archive record of the submission
+        :param attempts: The number of times the job has been claimed, including this claim
+        :param done: The keys of the parts of the submission that have been processed in previous attempts
+        """
+        self.queue: JobQueue = queue
+        self.seq: int = seq
+        self.submission_id: str = submission_id
+        self.target: str = target
+        self.record: dict[str, Any] = record
+        self.attempts: int = attempts
+        self.done: set[str] = done
+        """The keys of the parts of the submission that have already been processed, e.g. the IDs of stored album images"""
+
+    def is_done(self, key: str) -> bool:
+        """
+        Check if the given part of the submission has already been processed
+        :param key: Key of the part, e.g. the ID of an album image
+        :return: True, if the part has been recorded via mark_done()
+        """
+        return key in self.done
+
+    def mark_done(self, key: str) -> None:
+        """
+        Durably record that the given part of the submission has been processed, so it is skipped if the job is claimed again
+        :param key: Key of the part, e.g. the ID of an album image
+        :return: None
+        """
+        self.queue.record_progress(self, key)
+
+    def complete(self) -> None:
+        """
+        Remove the job from the queue, after the submission has been processed
+        :return: None
+        """
+        self.queue.complete(self)
+
+
+# noinspection SqlResolve
+class JobQueue:
+    """
+    A durable queue of submissions that still have to be processed, shared by all scraper processes that use the same queue file.
+    Submissions are claimed with a lease, which is renewed in the background as long as the claiming process is alive.
+    If a process dies, its leases expire and its submissions are claimed by another process.
+    The listing of every target is claimed the same way, so only one process fetches it from the API at a time,
+    and the position in the listing is stored along with the queued submissions, so an interrupted listing can be continued.
+    """
+
+    def __init__(self, queue_file: Path, lease_seconds: float = 300.0, max_attempts: int = 3, timeout: float = 60.0) -> None:
+        """
+        Open the given queue, creating it if necessary.
+        The database is opened with connect_shared(), so it also works on network file systems.
+        :param queue_file: Queue Database File
+        :param lease_seconds: Duration of a lease. Leases are renewed after a third of this time
+        :param max_attempts: Number of times a submission is claimed before it is given up
+        :param timeout: Seconds to wait for other processes to release the database
+        """
+        super().__init__()
+        self.queue_file: Path = queue_file
+        self.queue_file.parent.mkdir(exist_ok=True, parents=True)
+        self.lease_seconds: float = lease_seconds
+        self.max_attempts: int = max_attempts
+        self.worker: str = f"{socket.gethostname()}:{os.getpid()}"
+        """The identifier of this process in all leases"""
+        self._lock: threading.Lock = threading.Lock()
+        self._connection: sqlite3.Connection = connect_shared(queue_file, timeout)
+        self._transaction(self._create_jobs_table)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_target_state ON jobs (target, state, seq)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS listings (target TEXT PRIMARY KEY, worker TEXT, "
+                                 "lease_until REAL NOT NULL DEFAULT 0, cursor TEXT)")
+        self._stop: threading.Event = threading.Event()
+        self._heartbeat: threading.Thread = threading.Thread(target=self._renew_leases, name="JobQueueHeartbeat", daemon=True)
+        self._heartbeat.start()
+
+    @staticmethod
+    def _create_jobs_table(c: sqlite3.Connection) -> None:
+        """
+        Create the jobs table. A submission is queued once per target, since every target is claimed separately.
+        Queues that have been created with one job per submission are migrated
+        """
+        row: Optional[tuple] = c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone()
+        if row is not None and "submission_id TEXT NOT NULL UNIQUE" not in row[0]:
+            return
+        c.execute("CREATE TABLE jobs_new (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                  "submission_id TEXT NOT NULL, target TEXT NOT NULL, record TEXT NOT NULL, "
+                  "state INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+                  "attempts INTEGER NOT NULL DEFAULT 0, progress TEXT NOT NULL DEFAULT '[]', UNIQUE (submission_id, target))")
+        if row is not None:
+            c.execute("INSERT INTO jobs_new SELECT * FROM jobs")
+            c.execute("DROP TABLE jobs")
+        c.execute("ALTER TABLE jobs_new RENAME TO jobs")
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run the given function in an immediate transaction, so no other process can claim in between"""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result: Any = statements(self._connection)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def _renew_leases(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            lease_until: float = time.time() + self.lease_seconds
+            try:
+                self._transaction(lambda c: (
+                    c.execute("UPDATE jobs SET lease_until = ? WHERE state = ? AND worker = ?", (lease_until, _CLAIMED, self.worker)),
+                    c.execute("UPDATE listings SET lease_until = ? WHERE worker = ?", (lease_until, self.worker))))
+            except sqlite3.Error:
+                pass  # Retry on the next heartbeat, the leases are still valid for two thirds of their duration
+
+    def claim_listing(self, target: str) -> bool:
+        """
+        Claim the listing of the given target, if no other process is listing it
+        :param target: The key of the listing, e.g. the full URL of the RedditObject
+        :return: True, if this process shall fetch the listing
+        """
+        def claim(c: sqlite3.Connection) -> bool:
+            now: float = time.time()
+            row: Optional[tuple] = c.execute("SELECT worker, lease_until FROM listings WHERE target = ?", (target,)).fetchone()
+            if row is not None and row[0] is not None and row[0] != self.worker and row[1] > now:
+                return False
+            c.execute("INSERT INTO listings (target, worker, lease_until) VALUES (?, ?, ?) ON CONFLICT (target) DO UPDATE "
+                      "SET worker = excluded.worker, lease_until = excluded.lease_until", (target, self.worker, now + self.lease_seconds))
+            return True
+
+        return self._transaction(claim)
+
+    def release_listing(self, target: str, finished: bool = False, cursor: Optional[str] = None) -> None:
+        """
+        Release the listing of the given target
+        :param target: The key of the listing
+        :param finished: If True, the whole listing has been fetched, and the next listing shall start from the beginning.
+                         Otherwise, it continues after the given cursor, or after the last submission that has been passed to enqueue()
+                         or advance_listing()
+        :param cursor: If given, the fullname of the last listed submission
+        :return: None
+        """
+        self._transaction(lambda c: c.execute(
+            "UPDATE listings SET worker = NULL, lease_until = 0, cursor = CASE WHEN ? THEN NULL ELSE COALESCE(?, cursor) END "
+            "WHERE target = ? AND worker = ?", (finished, cursor, target, self.worker)))
+
+    def listing_cursor(self, target: str) -> Optional[str]:
+        """
+        Get the position where an interrupted listing of the given target shall be continued
+        :param target: The key of the listing
+        :return: the fullname of the last listed submission, or None, if the listing shall start from the beginning
+        """
+        with self._lock:
+            row: Optional[tuple] = self._connection.execute("SELECT cursor FROM listings WHERE target = ?", (target,)).fetchone()
+        return row[0] if row is not None else None
+
+    def advance_listing(self, target: str, cursor: str) -> None:
+        """
+        Record the position of the claimed listing of the given target, without queueing a submission
+        :param target: The key of the listing
+        :param cursor: The fullname of the last listed submission
+        :return: None
+        """
+        self._transaction(lambda c: c.execute("UPDATE listings SET cursor = ? WHERE target = ? AND worker = ?",
+                                              (cursor, target, self.worker)))
+
+    def listing_in_progress(self, target: str) -> bool:
+        """
+        Check if any process is currently fetching the listing of the given target
+        :param target: The printable name of the RedditObject
+        :return: True, if the listing is claimed
+        """
+        with self._lock:
+            row: Optional[tuple] = self._connection.execute("SELECT lease_until FROM listings WHERE target = ? AND worker IS NOT NULL",
+                                                            (target,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def enqueue(self, submission_id: str, target: str, record: dict[str, Any], listing: Optional[str] = None,
+                cursor: Optional[str] = None) -> bool:
+        """
+        Add a submission to the queue, unless it is already queued for the same target
+        :param submission_id: ID of the submission
+        :param target: The printable name of the RedditObject the submission has been listed in
+        :param record: The Submission Archive record of the submission
+        :param listing: If given, the key of the claimed listing the submission has been listed in
+        :param cursor: The fullname of the submission, stored as position of the listing in the same transaction
+        :return: True, if the submission has been added
+        """
+        def enqueue(c: sqlite3.Connection) -> bool:
+            added: bool = c.execute("INSERT OR IGNORE INTO jobs (submission_id, target, record) VALUES (?, ?, ?)",
+                                    (submission_id, target, json.dumps(record, ensure_ascii=False))).rowcount > 0
+            if listing is not None:
+                c.execute("UPDATE listings SET cursor = ? WHERE target = ? AND worker = ?", (cursor, listing, self.worker))
+            return added
+
+        return self._transaction(enqueue)
+
+    def claim(self, target: Optional[str] = None, submission_id: Optional[str] = None) -> Optional[Job]:
+        """
+        Claim the oldest submission that is neither processed by another process nor given up
+        :param target: If given, only claim submissions of this target
+        :param submission_id: If given, only claim this submission
+        :return: the claimed job, or None, if there is no submission left to claim
+        """
+        def claim(c: sqlite3.Connection) -> Optional[Job]:
+            now: float = time.time()
+            while True:
+                row: Optional[tuple] = c.execute(
+                    "SELECT seq, submission_id, target, record, attempts, progress FROM jobs "
+                    "WHERE (state = ? OR (state = ? AND lease_until < ?)) AND (? IS NULL OR target = ?) "
+                    "AND (? IS NULL OR submission_id = ?) ORDER BY seq LIMIT 1",
+                    (_PENDING, _CLAIMED, now, target, target, submission_id, submission_id)).fetchone()
+                if row is None:
+                    return None
+                seq, job_submission_id, job_target, record, attempts, progress = row
+                if attempts >= self.max_attempts:
+                    c.execute("UPDATE jobs SET state = ?, worker = NULL WHERE seq = ?", (_FAILED, seq))
+                    continue
+                c.execute("UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE seq = ?",
+                          (_CLAIMED, self.worker, now + self.lease_seconds, seq))
+                return Job(self, seq, job_submission_id, job_target, json.loads(record), attempts + 1, set(json.loads(progress)))
+
+        return self._transaction(claim)
+
+    def record_progress(self, job: Job, key: str) -> None:
+        """
+        Durably record that a part of a claimed job has been processed. Use Job.mark_done() instead of calling this directly.
+        :param job: The job
+        :param key: Key of the part
+        :return: None
+        """
+        def record(c: sqlite3.Connection) -> None:
+            job.done.add(key)
+            c.execute("UPDATE jobs SET progress = ? WHERE seq = ?", (json.dumps(sorted(job.done)), job.seq))
+
+        self._transaction(record)
+
+    def complete(self, job: Job) -> None:
+        """
+        Remove a processed job from the queue
+        :param job: The job
+        :return: None
+        """
+        self._transaction(lambda c: c.execute("DELETE FROM jobs WHERE seq = ?", (job.seq,)))
+
+    def release(self) -> None:
+        """
+        Return all submissions and listings claimed by this process, so they can be claimed immediately by the next process
+        :return: None
+        """
+        self._transaction(lambda c: (
+            c.execute("UPDATE jobs SET state = ?, worker = NULL, lease_until = 0 WHERE state = ? AND worker = ?",
+                      (_PENDING, _CLAIMED, self.worker)),
+            c.execute("UPDATE listings SET worker = NULL, lease_until = 0 WHERE worker = ?", (self.worker,))))
+
+    def release_all(self) -> None:
+        """
+        Return the submissions and listings claimed by any process, e.g. by a process that has been killed.
+        This must only be called if no other process uses the queue.
+        :return: None
+        """
+        self._transaction(lambda c: (
+            c.execute("UPDATE jobs SET state = ?, worker = NULL, lease_until = 0 WHERE state = ?", (_PENDING, _CLAIMED)),
+            c.execute("UPDATE listings SET worker = NULL, lease_until = 0")))
+
+    def pending(self, target: Optional[str] = None) -> int:
+        """
+        Get the number of submissions that are still to be processed
+        :param target: If given, only count submissions of this target
+        :return: the number of pending and claimed submissions
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM jobs WHERE state != ? AND (? IS NULL OR target = ?)",
+                                            (_FAILED, target, target)).fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Stop renewing leases and close the queue. Claims that have not been released expire after their lease.
+        :return: None
+        """
+        self._stop.set()
+        self._heartbeat.join()
+        with self._lock:
+            self._connection.close()
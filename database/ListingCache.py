@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from database.SubmissionArchive import ArchivedSubmission
+from database.SQLiteConnection import connect_shared
+
+
+class ListingCache:
+    """
+    A short-lived cache of listing pages, shared by all targets and sort methods and by all scraper processes that use the same file.
+    Every page is stored as the fullnames of its submissions and the cursor of the next page, and the archive records of the submissions
+    are stored once by fullname, so overlapping listings, e.g. a subreddit sorted by new and by top, do not store them twice.
+    Submissions that have been fetched or restored in this run are kept in memory, so every submission is only restored once.
+    """
+
+    def __init__(self, cache_file: Path, ttl_seconds: float = 600.0, timeout: float = 60.0, clock: Callable[[], float] = time.time) -> None:
+        """
+        Open the given cache, creating it if necessary.
+        The database is opened with connect_shared(), so it also works on network file systems.
+        :param cache_file: Cache Database File
+        :param ttl_seconds: Seconds a page is served from the cache after it has been fetched
+        :param timeout: Seconds to wait for other processes to release the database
+        :param clock: Function that returns the current time as epoch seconds
+        """
+        super().__init__()
+        self.cache_file: Path = cache_file
+        self.cache_file.parent.mkdir(exist_ok=True, parents=True)
+        self.ttl_seconds: float = ttl_seconds
+        self.clock: Callable[[], float] = clock
+        self._submissions: dict[str, Any] = {}
+        """The submissions of this run by fullname"""
+        self._lock: threading.Lock = threading.Lock()
+        self._connection: sqlite3.Connection = connect_shared(cache_file, timeout)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS pages (listing TEXT NOT NULL, after TEXT NOT NULL, fullnames TEXT NOT NULL, "
+                                 "next_after TEXT, fetched_at REAL NOT NULL, PRIMARY KEY (listing, after))")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS submissions (fullname TEXT PRIMARY KEY, record TEXT NOT NULL, "
+                                 "fetched_at REAL NOT NULL)")
+
+    def get_page(self, listing: str, after: Optional[str]) -> Optional[tuple[list[Any], Optional[str]]]:
+        """
+        Get a page of the given listing from the cache
+        :param listing: The key of the listing, i.e. the full URL of the RedditObject
+        :param after: The fullname the page starts after, or None for the first page
+        :return: the submissions of the page and the cursor of the next page, or None, if the page is not cached or has expired
+        """
+        with self._lock:
+            row: Optional[tuple] = self._connection.execute(
+                "SELECT fullnames, next_after FROM pages WHERE listing = ? AND after = ? AND fetched_at >= ?",
+                (listing, after or "", self.clock() - self.ttl_seconds)).fetchone()
+            if row is None:
+                return None
+            fullnames: list[str] = json.loads(row[0])
+            missing: list[str] = [fullname for fullname in fullnames if fullname not in self._submissions]
+            for fullname, record in self._connection.execute(
+                    f"SELECT fullname, record FROM submissions WHERE fullname IN ({', '.join('?' * len(missing))})", missing):
+                self._submissions[fullname] = ArchivedSubmission(json.loads(record))
+            if any(fullname not in self._submissions for fullname in fullnames):
+                return None  # The submissions have been pruned by another process
+            return [self._submissions[fullname] for fullname in fullnames], row[1]
+
+    def put_page(self, listing: str, after: Optional[str], submissions: list[Any], records: list[dict[str, Any]],
+                 next_after: Optional[str]) -> None:
+        """
+        Store a page of the given listing that has just been fetched, and remove all expired pages and submissions
+        :param listing: The key of the listing, i.e. the full URL of the RedditObject
+        :param after: The fullname the page starts after, or None for the first page
+        :param submissions: The submissions of the page, e.g. praw Submissions
+        :param records: The archive records of the submissions
+        :param next_after: The cursor of the next page, or None, if this is the last page
+        :return: None
+        """
+        now: float = self.clock()
+        fullnames: list[str] = [f"t3_{record['id']}" for record in records]
+        self._submissions.update(zip(fullnames, submissions))
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany("INSERT OR REPLACE INTO submissions (fullname, record, fetched_at) VALUES (?, ?, ?)",
+                                             ((fullname, json.dumps(record), now) for fullname, record in zip(fullnames, records)))
+                self._connection.execute("INSERT OR REPLACE INTO pages (listing, after, fullnames, next_after, fetched_at) "
+                                         "VALUES (?, ?, ?, ?, ?)", (listing, after or "", json.dumps(fullnames), next_after, now))
+                self._connection.execute("DELETE FROM pages WHERE fetched_at < ?", (now - self.ttl_seconds,))
+                self._connection.execute("DELETE FROM submissions WHERE fetched_at < ?", (now - self.ttl_seconds,))
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def close(self) -> None:
+        """
+        Close the cache
+        :return: None
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,151 @@
+import datetime as dt
+import hashlib
+import threading
+from pathlib import Path
+from typing import BinaryIO
+
+from database.FileLock import locked
+
+
+class NamingIndex:
+    """
+    An index of all file names that have been assigned in a destination directory.
+    It shards the files of every target into subdirectories and guarantees unique target paths,
+    without probing the file system for every candidate name.
+    The index file contains one assigned path per line. Paths that have been released again are recorded as lines starting with "-".
+    """
+
+    LAYOUTS: tuple[str, ...] = ("flat", "year_month", "hash_prefix")
+    """All supported layouts"""
+
+    def __init__(self, root: Path, index_file: Path, layout: str = "flat", shared: bool = False) -> None:
+        """
+        Init a new Naming Index. If the index file does not exist yet, it is created from all files in the root directory.
+        :param root: The destination directory, all indexed paths are relative to it
+        :param index_file: The file to store the index in
+        :param layout: "flat" stores all files of a target in one directory, "year_month" shards them by the year and month
+                       of their submission, "hash_prefix" shards them by the first two hex digits of the hash of their name
+        :param shared: If True, the index file is shared with other scraper processes. Names that have been assigned by other
+                       processes are picked up under a file lock before a name is assigned.
+        """
+        super().__init__()
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown output layout {layout}, expected one of {', '.join(self.LAYOUTS)}")
+        self.root: Path = root
+        self.index_file: Path = index_file
+        self.layout: str = layout
+        self.shared: bool = shared
+        self.paths: set[str] = set()
+        self._lock: threading.Lock = threading.Lock()
+        self._offset: int = 0
+        """The number of bytes of the index file that have been read"""
+        if self.index_file.is_file():
+            with self.index_file.open("rb") as idf:
+                self._refresh(idf)
+        else:
+            self._build()
+
+    def _refresh(self, idf: BinaryIO) -> None:
+        """Read all complete lines that have been appended to the index file since it has been read last"""
+        idf.seek(self._offset)
+        data: bytes = idf.read()
+        end: int = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].decode("utf-8").split("\n"):
+            if line.startswith("-"):
+                self.paths.discard(line[1:])
+            elif line:
+                self.paths.add(line)
+
+    def _build(self) -> None:
+        """Build a new index from the files that already exist in the root directory"""
+        if self.root.is_dir():
+            for file in self.root.rglob("*"):
+                relative: Path = file.relative_to(self.root)
+                if not any(part.startswith(".") for part in relative.parts) and file.is_file():
+                    self.paths.add(relative.as_posix())
+        self.index_file.parent.mkdir(exist_ok=True, parents=True)
+        with self.index_file.open("w", encoding="utf-8") as idf:
+            for path in sorted(self.paths):
+                idf.write(f"{path}\n")
+        self._offset = self.index_file.stat().st_size
+
+    def shard(self, directory: Path, name: str, epoch: float) -> Path:
+        """
+        Get the shard directory for the given name
+        :param directory: The directory of the target, e.g. "out/reddit_sub_wallpapers"
+        :param name: Name of the file or folder to store
+        :param epoch: Creation time of the submission
+        :return: the shard directory
+        """
+        match self.layout:
+            case "year_month":
+                created: dt.datetime = dt.datetime.utcfromtimestamp(epoch)
+                return directory / f"{created.year:04d}" / f"{created.month:02d}"
+            case "hash_prefix":
+                return directory / hashlib.md5(name.encode("utf-8")).hexdigest()[:2]
+            case _:
+                return directory
+
+    def reserve(self, directory: Path, name: str, epoch: float) -> Path:
+        """
+        Reserve a unique path for a file with the given name in the shard of the given directory.
+        If the name is already taken, a counter is appended to it, e.g. "image (2).png".
+        :param directory: The directory of the target, e.g. "out/reddit_sub_wallpapers"
+        :param name: Name of the file
+        :param epoch: Creation time of the submission
+        :return: the reserved path
+        """
+        return self.unique(self.shard(directory, name, epoch) / name)
+
+    def unique(self, path: Path) -> Path:
+        """
+        Reserve the given path, or, if it is already taken, the path with a counter appended to its name, e.g. "image (2).png"
+        :param path: Path to reserve
+        :return: the reserved path
+        """
+        return self.unique_all([path])[0]
+
+    def unique_all(self, paths: list[Path]) -> list[Path]:
+        """
+        Reserve all given paths like unique(), under a single lock, e.g. all images of an album
+        :param paths: Paths to reserve
+        :return: the reserved paths, in the same order
+        """
+        reserved: list[Path] = []
+        with self._lock, self.index_file.open("ab+") as idf, locked(idf):
+            if self.shared:
+                self._refresh(idf)
+            for path in paths:
+                candidate: Path = path
+                i: int = 1
+                while self._key(candidate) in self.paths:
+                    i += 1
+                    candidate = path.with_name(f"{path.stem} ({i}){path.suffix}")
+                key: str = self._key(candidate)
+                idf.write(f"{key}\n".encode("utf-8"))
+                self.paths.add(key)
+                reserved.append(candidate)
+        return reserved
+
+    def release(self, *paths: Path) -> None:
+        """
+        Release reserved paths whose files have not been stored, e.g. because their download failed or they are duplicates,
+        so the next attempt is assigned the same names again
+        :param paths: Reserved paths
+        :return: None
+        """
+        with self._lock, self.index_file.open("ab+") as idf, locked(idf):
+            if self.shared:
+                self._refresh(idf)
+            for path in paths:
+                key: str = self._key(path)
+                if key in self.paths:
+                    idf.write(f"-{key}\n".encode("utf-8"))
+                    self.paths.discard(key)
+
+    def _key(self, path: Path) -> str:
+        try:
+            return path.absolute().relative_to(self.root.absolute()).as_posix()
+        except ValueError:
+            return path.absolute().as_posix()
@@ -0,0 +1,61 @@
+from pathlib import Path
+from typing import Any, Iterable
+
+from database.HashIndex import HashIndex
+
+
+class NearDuplicateImageDatabase:
+    """
+    A perceptual hash library that reports an image as known if the wrapped library contains its exact hash,
+    or if the Hash Index contains a hash within the configured Hamming distance, so re-encoded, resized or watermarked copies
+    are detected as duplicates, too.
+    It provides the methods of the imagehashsort ImageDatabase that are used by the downloaders, and forwards all others.
+    """
+
+    def __init__(self, library: Any, index: HashIndex, max_distance: int) -> None:
+        """
+        Wrap the given library
+        :param library: The perceptual hash library, e.g. a JSONImageDatabase or an SQLiteImageDatabase
+        :param index: The index of all stored hashes
+        :param max_distance: Maximum number of differing bits of the hashes of two near-duplicates
+        """
+        super().__init__()
+        self.library: Any = library
+        self.index: HashIndex = index
+        self.max_distance: int = max_distance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.library, name)
+
+    def hash_in_hashes(self, imhash: Any) -> bool:
+        """
+        Check if an image with the given perceptual hash, or with a similar one, is already stored
+        :param imhash: Perceptual hash
+        :return: True, if the hash or a near-duplicate is known
+        """
+        return self.library.hash_in_hashes(imhash) or self.index.contains_within(imhash, self.max_distance)
+
+    def store_image(self, image_file: Path, imhash: Any) -> None:
+        """
+        Store the given image with its perceptual hash in the library and in the index
+        :param image_file: Image File
+        :param imhash: Perceptual hash
+        :return: None
+        """
+        self.library.store_image(image_file, imhash)
+        self.index.add(imhash)
+
+    def store_images(self, images: Iterable[tuple[Path, Any]]) -> None:
+        """
+        Store the given images with their perceptual hashes in the library and in the index,
+        in a single transaction if the library supports it
+        :param images: Image Files and their perceptual hashes
+        :return: None
+        """
+        images = list(images)
+        if hasattr(self.library, "store_images"):
+            self.library.store_images(images)
+        else:
+            for image_file, imhash in images:
+                self.library.store_image(image_file, imhash)
+        self.index.add_all(imhash for _, imhash in images)
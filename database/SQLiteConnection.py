@@ -0,0 +1,16 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect_shared(database_file: Path, timeout: float = 60.0) -> sqlite3.Connection:
+    """
+    Open the given SQLite database, creating it if necessary, so it can be shared by the threads of this process and by
+    other scraper processes. The connection is in autocommit mode, so transactions are started explicitly.
+    The rollback journal is used instead of a write-ahead log, since the latter does not work on network file systems.
+    :param database_file: Database File
+    :param timeout: Seconds to wait for other processes to release the database
+    :return: the connection. Access to it must be serialized by the caller
+    """
+    connection: sqlite3.Connection = sqlite3.connect(database_file, timeout=timeout, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    return connection
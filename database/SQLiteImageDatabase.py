@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+from database.SQLiteConnection import connect_shared
+
+
+class SQLiteImageDatabase:
+    """
+    A perceptual hash library that is stored in an SQLite database, so it can be shared by several scraper processes.
+    Every stored image is committed immediately, instead of rewriting the whole library on save().
+    It provides the methods of the imagehashsort ImageDatabase that are used by the downloaders.
+    """
+
+    def __init__(self, database_file: Path, timeout: float = 60.0) -> None:
+        """
+        Open the given database, creating it if necessary.
+        The database is opened with connect_shared(), so it also works on network file systems.
+        :param database_file: Database File
+        :param timeout: Seconds to wait for other processes to release the database
+        """
+        super().__init__()
+        self.database_file: Path = database_file
+        self.database_file.parent.mkdir(exist_ok=True, parents=True)
+        self._lock: threading.Lock = threading.Lock()
+        self._connection: sqlite3.Connection = connect_shared(database_file, timeout)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS images (hash TEXT NOT NULL, file TEXT NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS images_hash ON images (hash)")
+        if self._connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'images_file'").fetchone() is None:
+            # Databases of older versions may contain a file several times, e.g. after the library has been imported again
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM images WHERE rowid NOT IN (SELECT MAX(rowid) FROM images GROUP BY file)")
+                self._connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS images_file ON images (file)")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def hash_in_hashes(self, imhash: Any) -> bool:
+        """
+        Check if an image with the given perceptual hash is already stored
+        :param imhash: Perceptual hash
+        :return: True, if the hash is known
+        """
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM images WHERE hash = ? LIMIT 1", (str(imhash),)).fetchone() is not None
+
+    def hashes(self) -> list[str]:
+        """
+        Get the perceptual hashes of all stored images
+        :return: the distinct hashes
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT hash FROM images")]
+
+    def store_image(self, image_file: Path, imhash: Any) -> None:
+        """
+        Store the given image with its perceptual hash, replacing the hash of a file that has been stored before
+        :param image_file: Image File
+        :param imhash: Perceptual hash
+        :return: None
+        """
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO images (hash, file) VALUES (?, ?)", (str(imhash), Path(image_file).as_posix()))
+
+    def store_images(self, images: Iterable[tuple[Path, Any]]) -> None:
+        """
+        Store the given images with their perceptual hashes in a single transaction,
+        replacing the hashes of files that have been stored before
+        :param images: Image Files and their perceptual hashes
+        :return: None
+        """
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany("INSERT OR REPLACE INTO images (hash, file) VALUES (?, ?)",
+                                             ((str(imhash), Path(image_file).as_posix()) for image_file, imhash in images))
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def save(self) -> None:
+        """
+        All images are committed when they are stored, so there is nothing left to save
+        :return: None
+        """
+        pass
+
+    def emergency_save(self) -> None:
+        """
+        All images are committed when they are stored, so there is nothing left to save
+        :return: None
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Close the database
+        :return: None
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,360 @@
+import hashlib
+import json
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Iterator, Optional
+
+from database.FileLock import locked
+
+
+class ArchivedSubmission:
+    """
+    A submission that was restored from the Submission Archive.
+    It provides all attributes of a praw Submission that are needed to scrape its metadata.
+    """
+
+    def __init__(self, record: dict[str, Any]) -> None:
+        """
+        Restore a submission from the given archive record
+        :param record: Archive record
+        """
+        self.id: str = record["id"]
+        self.fullname: str = f"t3_{self.id}"
+        self.permalink: str = record["permalink"]
+        self.url: str = record["url"]
+        self.title: str = record["title"]
+        self.selftext: str = record["selftext"]
+        self.author_flair_text: Optional[str] = record["author_flair_text"]
+        self.score: int = record["score"]
+        self.upvote_ratio: float = record["upvote_ratio"]
+        self.num_comments: int = record["num_comments"]
+        self.created_utc: float = record["created_utc"]
+        self.subreddit = SimpleNamespace(display_name=record["subreddit"])
+        self.author = SimpleNamespace(name=record["author"]) if record["author"] is not None else None
+        self.preview_sizes: list[list[int]] = record.get("preview", [])
+        """The sizes of the preview images as [width, height], the source image first"""
+        self.gallery_items: list[dict[str, Any]] = record.get("gallery", [])
+        """The images of a reddit gallery, see get_gallery_items()"""
+        self.target: Optional[str] = record.get("target")
+        """The printable name of the RedditObject the submission was scraped from"""
+
+
+def get_preview_sizes(submission: Any) -> list[list[int]]:
+    """
+    Get the sizes of the preview images of the given submission, without fetching the submission if it does not have a preview.
+    :param submission: praw Submission or ArchivedSubmission
+    :return: the sizes as [width, height], the size of the source image first, or an empty list if there is no preview
+    """
+    if isinstance(submission, ArchivedSubmission):
+        return submission.preview_sizes
+    preview: Optional[dict] = vars(submission).get("preview")  # getattr() would fetch the whole submission
+    if not preview or not preview.get("images"):
+        return []
+    image: dict = preview["images"][0]
+    return [[size["width"], size["height"]] for size in [image["source"]] + image.get("resolutions", [])]
+
+
+def get_gallery_items(submission: Any) -> list[dict[str, Any]]:
+    """
+    Get the images of a reddit gallery from the media_metadata and gallery_data of the given submission,
+    or of the submission it has been crossposted from, without fetching the submission.
+    :param submission: praw Submission or ArchivedSubmission
+    :return: the images in gallery order as dicts with the keys "id", "file" (the file name on i.redd.it), "caption", "width", "height"
+             and "type", or an empty list if the submission is not a gallery
+    """
+    if isinstance(submission, ArchivedSubmission):
+        return submission.gallery_items
+    data: dict[str, Any] = vars(submission)  # getattr() would fetch the whole submission
+    if not data.get("gallery_data") and data.get("crosspost_parent_list"):
+        data = data["crosspost_parent_list"][0]
+    gallery_data: Optional[dict] = data.get("gallery_data")
+    media_metadata: Optional[dict] = data.get("media_metadata")
+    if not gallery_data or not media_metadata:
+        return []
+    items: list[dict[str, Any]] = []
+    for item in gallery_data.get("items", []):
+        media: Optional[dict] = media_metadata.get(item["media_id"])
+        if media is None or media.get("status") != "valid":
+            continue  # Deleted or still processing
+        mime_type: str = media.get("m", "image/jpg")
+        extension: str = "gif" if media.get("e") == "AnimatedImage" else mime_type.split("/")[-1]
+        source: dict = media.get("s", {})
+        items.append({"id": item["media_id"], "file": f"{item['media_id']}.{extension}", "caption": item.get("caption"),
+                      "width": source.get("x"), "height": source.get("y"), "type": mime_type})
+    return items
+
+
+# noinspection PyMethodMayBeStatic
+class SubmissionArchive:
+    """
+    An append-only archive of all scraped submissions and the images that were downloaded from them.
+    The archive is stored as a JSON Lines file next to the downloaded images, so their metadata can be (re-)written, and the
+    submissions can be re-processed later without accessing the Reddit API.
+    Submissions are indexed by ID and by target in an index file next to the archive. If the index is behind the archive,
+    e.g. because the scraper was killed, the missing part is re-indexed on load.
+    A submission is only appended again if its record changed, e.g. its score, so listing it in every run does not grow the archive.
+    """
+
+    def __init__(self, archive_file: Path) -> None:
+        """
+        Init a new Submission Archive with the given archive file. All image paths are stored relative to the archive file.
+        :param archive_file: Archive File
+        """
+        super().__init__()
+        self.archive_file: Path = archive_file
+        self.index_file: Path = archive_file.with_name(archive_file.name + ".idx")
+        self.base_dir: Path = archive_file.parent
+        self._lock: threading.Lock = threading.Lock()
+        self._by_id: Optional[dict[str, int]] = None
+        """The offset of the latest record of each submission in the archive file"""
+        self._by_target: dict[str, dict[str, None]] = {}
+        """The IDs of all submissions of each target, in the order they have been seen first"""
+        self._digests: dict[str, str] = {}
+        """The digest of the latest record of each submission"""
+        self._archive: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+
+    def _load_index(self) -> None:
+        """Load the index, re-indexing the part of the archive that is not indexed yet. Must be called with the lock held"""
+        if self._by_id is not None:
+            return
+        self._by_id = {}
+        indexed_until: int = 0
+        if self.index_file.is_file():
+            with self.index_file.open("r", encoding="utf-8") as idf:
+                for line in idf:
+                    parts: list[str] = line.rstrip("\n").split("\t")
+                    if len(parts) not in (4, 5):
+                        continue  # Incomplete line
+                    submission_id, target, offset, end = parts[:4]
+                    self._add_to_index(submission_id, target, int(offset), parts[4] if len(parts) == 5 else "")
+                    indexed_until = max(indexed_until, int(end))
+        if self.archive_file.is_file() and self.archive_file.stat().st_size > indexed_until:
+            with self.archive_file.open("rb") as af:
+                af.seek(indexed_until)
+                offset: int = indexed_until
+                for line in af:
+                    end: int = offset + len(line)
+                    try:
+                        record: dict[str, Any] = json.loads(line)
+                    except json.JSONDecodeError:
+                        record = {}
+                    if record.get("kind") == "submission":
+                        self._write_index(record["id"], record.get("target") or "", offset, end, self._digest(line))
+                    offset = end
+
+    def _add_to_index(self, submission_id: str, target: str, offset: int, digest: str) -> None:
+        self._by_id[submission_id] = offset
+        self._digests[submission_id] = digest
+        if target:
+            self._by_target.setdefault(target, {})[submission_id] = None
+
+    def _write_index(self, submission_id: str, target: str, offset: int, end: int, digest: str) -> None:
+        if self._index is None:
+            self._index = self.index_file.open("ab")
+        self._index.write(f"{submission_id}\t{target}\t{offset}\t{end}\t{digest}\n".encode("utf-8"))
+        self._index.flush()
+        self._add_to_index(submission_id, target, offset, digest)
+
+    @staticmethod
+    def _digest(line: bytes) -> str:
+        """Get the digest of a record line of the archive file"""
+        return hashlib.blake2b(line.rstrip(b"\n"), digest_size=8).hexdigest()
+
+    def _append(self, record: dict[str, Any]) -> None:
+        line: bytes = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._load_index()
+            digest: str = self._digest(line)
+            if record["kind"] == "submission" and self._digests.get(record["id"]) == digest:
+                return  # Unchanged since it has been archived last
+            if self._archive is None:
+                self.archive_file.parent.mkdir(exist_ok=True, parents=True)
+                self._archive = self.archive_file.open("ab+")
+            # The archive may be shared by several scraper processes, so the end is only determined under the file lock
+            with locked(self._archive):
+                if self._archive.seek(0, 2) > 0:
+                    self._archive.seek(-1, 2)
+                    if self._archive.read(1) != b"\n":  # Terminate a record that was cut off by a killed scraper
+                        self._archive.write(b"\n")
+                offset: int = self._archive.seek(0, 2)
+                self._archive.write(line)
+                self._archive.flush()
+                if record["kind"] == "submission":
+                    self._write_index(record["id"], record.get("target") or "", offset, offset + len(line), digest)
+
+    def close(self) -> None:
+        """
+        Close all open files of the archive
+        :return: None
+        """
+        with self._lock:
+            for f in (self._archive, self._index):
+                if f is not None:
+                    f.close()
+            self._archive = None
+            self._index = None
+
+    def submission_to_record(self, submission: Any, target: Optional[str] = None) -> dict[str, Any]:
+        """
+        Convert the given submission to an archive record
+        :param submission: praw Submission or ArchivedSubmission
+        :param target: The printable name of the RedditObject the submission was scraped from
+        :return: the record
+        """
+        return {
+            "kind": "submission",
+            "id": submission.id,
+            "target": target,
+            "permalink": submission.permalink,
+            "url": submission.url,
+            "title": submission.title,
+            "selftext": submission.selftext,
+            "author": submission.author.name if submission.author is not None else None,
+            "author_flair_text": submission.author_flair_text,
+            "score": submission.score,
+            "upvote_ratio": submission.upvote_ratio,
+            "num_comments": submission.num_comments,
+            "created_utc": submission.created_utc,
+            "subreddit": submission.subreddit.display_name,
+            "preview": get_preview_sizes(submission),
+            "gallery": get_gallery_items(submission),
+        }
+
+    def add_submission(self, submission: Any, target: Optional[str] = None) -> None:
+        """
+        Store the given submission in the archive, unless it has been stored before with the same record
+        :param submission: praw Submission
+        :param target: The printable name of the RedditObject the submission was scraped from, e.g. "r/wallpapers"
+        :return: None
+        """
+        self._append(self.submission_to_record(submission, target))
+
+    def add_album(self, album_id: str, album_data: dict[str, Any]) -> None:
+        """
+        Store the data of an Imgur album in the archive, without its images
+        :param album_id: Imgur Album ID
+        :param album_data: The "data" part of the Imgur API response
+        :return: None
+        """
+        self._append({"kind": "album", "id": album_id, "data": {k: v for k, v in album_data.items() if k != "images"}})
+
+    def add_image(self, image_file: Path, submission_id: str, album_id: Optional[str] = None,
+                  image_data: Optional[dict[str, Any]] = None, gallery_item: Optional[dict[str, Any]] = None) -> None:
+        """
+        Store a downloaded image in the archive
+        :param image_file: The file the image was stored in
+        :param submission_id: ID of the submission the image belongs to
+        :param album_id: ID of the Imgur album the image belongs to, if any
+        :param image_data: The image data returned by the Imgur API, if the image belongs to an album
+        :param gallery_item: The gallery item, as returned by get_gallery_items(), if the image belongs to a reddit gallery
+        :return: None
+        """
+        record: dict[str, Any] = {"kind": "image", "file": self._relative_path(image_file), "submission": submission_id}
+        if album_id is not None:
+            record["album"] = album_id
+            record["image"] = image_data
+        if gallery_item is not None:
+            record["gallery_item"] = gallery_item
+        self._append(record)
+
+    def _relative_path(self, image_file: Path) -> str:
+        try:
+            return image_file.absolute().relative_to(self.base_dir.absolute()).as_posix()
+        except ValueError:
+            return image_file.absolute().as_posix()
+
+    def get_submission(self, submission_id: str) -> Optional[ArchivedSubmission]:
+        """
+        Get the latest state of the given submission from the archive
+        :param submission_id: ID of the submission, without the "t3_" prefix
+        :return: the submission, or None, if it is not in the archive
+        """
+        with self._lock:
+            self._load_index()
+            offset: Optional[int] = self._by_id.get(submission_id)
+            if offset is None:
+                return None
+            if self._archive is not None:
+                self._archive.flush()
+        with self.archive_file.open("rb") as af:
+            af.seek(offset)
+            return ArchivedSubmission(json.loads(af.readline()))
+
+    def submission_ids(self, target: Optional[str] = None) -> list[str]:
+        """
+        Get the IDs of all archived submissions
+        :param target: If given, only get the submissions that have been scraped from this target, e.g. "r/wallpapers"
+        :return: the IDs, in the order they have been archived first
+        """
+        with self._lock:
+            self._load_index()
+            if target is None:
+                return list(self._by_id.keys())
+            return list(self._by_target.get(target, {}).keys())
+
+    def targets(self) -> list[str]:
+        """
+        Get all targets that submissions have been scraped from
+        :return: the printable names of all targets
+        """
+        with self._lock:
+            self._load_index()
+            return list(self._by_target.keys())
+
+    def submissions(self, target: Optional[str] = None) -> Iterator[ArchivedSubmission]:
+        """
+        Iterate over the latest state of all archived submissions
+        :param target: If given, only iterate over the submissions that have been scraped from this target
+        :return: an iterator over the submissions
+        """
+        for submission_id in self.submission_ids(target):
+            submission: Optional[ArchivedSubmission] = self.get_submission(submission_id)
+            if submission is not None:
+                yield submission
+
+    def records(self) -> Iterator[dict[str, Any]]:
+        """
+        Iterate over all records of the archive, in the order they have been added
+        :return: an iterator over all records
+        """
+        if not self.archive_file.is_file():
+            return
+        with self.archive_file.open("r", encoding="utf-8") as af:
+            for i, line in enumerate(af):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line might be incomplete if the scraper was killed while writing
+                    print(f"File {self.archive_file.as_posix()} contained an invalid record in line {i + 1}", file=sys.stderr)
+
+    def load(self) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, Any]], dict[str, dict[str, Any]]]:
+        """
+        Load the latest state of all submissions, albums and images from the archive
+        :return: the submission records by ID, the album data by ID and the image records by file path
+        """
+        submissions: dict[str, dict[str, Any]] = {}
+        albums: dict[str, dict[str, Any]] = {}
+        images: dict[str, dict[str, Any]] = {}
+        for record in self.records():
+            match record.get("kind"):
+                case "submission":
+                    submissions[record["id"]] = record
+                case "album":
+                    albums[record["id"]] = record["data"]
+                case "image":
+                    images[record["file"]] = record
+        return submissions, albums, images
+
+    def resolve(self, file: str) -> Path:
+        """
+        Get the path of an image file that is stored in the archive
+        :param file: File path as stored in an image record
+        :return: the path
+        """
+        return self.base_dir / file
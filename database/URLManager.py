@@ -1,8 +1,11 @@
 import sys
+import threading
 from collections import namedtuple
 from pathlib import Path
 from urllib.parse import urlparse
 
+from database.FileLock import locked
+
 
 # noinspection PyMethodMayBeStatic
 class URLManager:
@@ -10,25 +13,43 @@ class URLManager:
     A URL Manager that manages URLs that have already been downloaded
     """
 
-    def __init__(self, database_file: Path) -> None:
+    def __init__(self, database_file: Path, shared: bool = False) -> None:
         """
         Init a new URL Manager with the given Database File.
         :param database_file: Database File
+        :param shared: If True, the database file is shared with other scraper processes. URLs that have been added by other
+                       processes are picked up before a URL is reported as unknown, and all writes are done under a file lock.
         """
         super().__init__()
         self.database_file: Path = database_file
         self.database_file.touch(exist_ok=True)
+        self.shared: bool = shared
         self.paths: set[str] = set()
-        with self.database_file.open("r") as df:
-            for line in df:
-                url: str = line.strip()
-                if url:
-                    try:
-                        urlparts = urlparse(url)
-                    except ValueError:
-                        print(f"File {self.database_file.as_posix()} contained invalid URL {url}", file=sys.stderr)
-                        continue
-                    self.paths.add(self._url_to_lookupstring(urlparts))
+        self._lock: threading.Lock = threading.Lock()
+        """Guards writes, since URLs may be committed from metadata writer threads"""
+        self._offset: int = 0
+        """The number of bytes of the database file that have been read"""
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """Read all complete lines that have been appended to the database file since it has been read last"""
+        if self.database_file.stat().st_size <= self._offset:
+            return
+        with self.database_file.open("rb") as df:
+            df.seek(self._offset)
+            data: bytes = df.read()
+        # In a shared file, a line without a newline might still be written by another process
+        end: int = data.rfind(b"\n") + 1 if self.shared else len(data)
+        self._offset += end
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            url: str = line.strip()
+            if url:
+                try:
+                    urlparts = urlparse(url)
+                except ValueError:
+                    print(f"File {self.database_file.as_posix()} contained invalid URL {url}", file=sys.stderr)
+                    continue
+                self.paths.add(self._url_to_lookupstring(urlparts))
 
     def _url_to_lookupstring(self, url: namedtuple) -> str:
         """
@@ -58,7 +79,13 @@ class URLManager:
         :param urlparts: URL to check
         :return: True, if the valid URL is already in the database
         """
-        return self._url_to_lookupstring(urlparts) in self.paths
+        lookupstr: str = self._url_to_lookupstring(urlparts)
+        if lookupstr in self.paths:
+            return True
+        if self.shared:
+            with self._lock:
+                self._refresh()
+        return lookupstr in self.paths
 
     def add_url_to_database(self, url: str) -> None:
         """
@@ -71,8 +98,11 @@ class URLManager:
         except ValueError:
             return
         lookupstr: str = self._url_to_lookupstring(urlparts)
-        if lookupstr in self.paths:
-            return
-        with self.database_file.open("a") as df:
-            df.write(f"{url}\n")
-        self.paths.add(lookupstr)
+        with self._lock:
+            if self.shared:
+                self._refresh()
+            if lookupstr in self.paths:
+                return
+            with self.database_file.open("a") as df, locked(df):
+                df.write(f"{url}\n")
+            self.paths.add(lookupstr)
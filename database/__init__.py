@@ -1 +1,10 @@
 from database.URLManager import URLManager
+from database.BlobStore import BlobStore
+from database.NamingIndex import NamingIndex
+from database.SubmissionArchive import SubmissionArchive, ArchivedSubmission, get_preview_sizes, get_gallery_items
+from database.SQLiteImageDatabase import SQLiteImageDatabase
+from database.JobQueue import JobQueue, Job
+from database.HashIndex import HashIndex, hash_to_int
+from database.NearDuplicateImageDatabase import NearDuplicateImageDatabase
+from database.FailureCache import FailureCache
+from database.ListingCache import ListingCache
@@ -21,6 +21,7 @@ Usage: download_images.py [-s SUBREDDIT] [-n NUMBER OF PICTURES] [-p PAGE] [-q S
 # - Store a URL history, like Ripme
 # - Use sqlite or Mongodb for all storage files
 import argparse
+import signal
 import sys
 from pathlib import Path
 from textwrap import dedent
@@ -30,14 +31,20 @@ import xdg
 from config import Config
 from imagehashsort import ImageDatabase, JSONImageDatabase
 
-from actions import scrape_subreddit
-from database import URLManager
+from actions import scrape_subreddit, metrics, Profiler, is_sidecar_mode, is_blob_storage
+from actions.downloader import BandwidthLimiter
+from database import URLManager, SubmissionArchive, SQLiteImageDatabase, JobQueue, HashIndex, NearDuplicateImageDatabase, FailureCache, \
+    ListingCache
 from reddit import RedditObject, NoValidRedditObjectError
 
 _default_config: str = dedent("""
 metadata_scraper: { # Configuration related to the metadata scraper
     write_metadata: true, # Setting this to false completely disables the metadata scraper
     write_keywords: true, # Setting this to true enables writing keywords (Subreddit name, ...) to the metadata
+    metadata_mode: 'embed', # 'embed' writes the metadata into the images, 'sidecar' writes it to an XMP sidecar file next to each image (e.g. image.png.xmp) and leaves the images untouched
+    writer_threads: 2, # Number of background threads that write metadata to downloaded images. 0 writes metadata on the download thread
+    writer_queue_size: 32, # Maximum number of images waiting for their metadata to be written before the download is paused
+    writer_queue_max_bytes: 268435456, # Maximum number of bytes of the images that are kept in memory while waiting for their metadata to be written before the download is paused. 0 disables the limit
     subreddit_name: 'Subreddit', # Name of a subreddit, parent of all subreddits in the keyword hierarchy
     user_name: 'Reddit User', # Name of a user, parent of all reddit users in the keyword hierarchy
     lightroom_hierarchy_separator: '|' # The hierarchy separator character used in Photoshop Lightroom
@@ -48,34 +55,157 @@ reddit_connector: { # Configuration related to the reddit connector
     client_id: '', # Client ID to use for login
     client_secret: '', # Client Secret
     user_agent: '', # User agent
-    imgur_client_id: '' # imgur Client ID
+    imgur_client_id: '', # imgur Client ID
+    imgur_api_url: 'https://api.imgur.com/3', # Base URL of the imgur API
+    reddit_media_url: 'https://i.redd.it', # Base URL of the images of reddit galleries
+    listing_cache_file: 'listings.sqlite', # Name of the database to cache fetched listing pages in. Will be created in the global data folder
+    listing_cache_seconds: 600 # Seconds a fetched listing page is reused, e.g. when the same subreddit is scraped with several sort methods in a row. 0 disables the cache
 },
 reddit_downloader: { # Configuration related to the reddit downloader
     download_gif: false, # If true, download .gif files from imgur and reddit
     url_history_file: 'url_history.txt', # Name of the text file to store successfully downloaded URLs into. Will be created in the global data folder
+    failure_cache_file: 'failed_urls.jsonl', # Name of the file to record URLs that could not be downloaded into. URLs that are gone are never retried. Will be created in the global data folder
+    failure_retry_seconds: 3600, # Seconds to wait before a URL that failed because of a timeout, a server error or rate limiting is retried. The interval doubles with every failure
+    failure_max_retry_seconds: 604800, # Maximum number of seconds to wait before a failed URL is retried
+    in_memory_max_bytes: 33554432, # Images up to this size are kept in memory until their metadata has been added, so they are written to disk only once. 0 writes every image to disk immediately
+    submission_archive_file: 'submissions.jsonl', # Name of the file to record all seen submissions and downloaded images into, for offline re-processing. Will be created in the destination directory
+    output_layout: 'flat', # 'flat' stores all files of a subreddit or user in one folder, 'year_month' shards them into year/month subfolders by their submission date, 'hash_prefix' shards them into 256 subfolders by the hash of their name
+    naming_index_file: '.naming_index.txt', # Name of the file that records all assigned file names, so that no file is overwritten. Will be created in the destination directory
+    recompress_images: false, # If true, losslessly recompress every downloaded image after its metadata has been written, keeping its pixels and metadata. Uses jpegtran for JPEGs and oxipng or optipng for PNGs if they are installed, and re-deflates PNGs with zlib otherwise. Runs on the metadata writer threads. Has no effect in the sidecar metadata mode, which leaves the images untouched
+    recompress_tools: [], # Names of the external tools that may be used for recompression, e.g. ['jpegtran', 'oxipng']. [] uses all installed tools
+    storage_mode: 'files', # 'files' stores a separate copy of every image, 'blobs' stores identical images only once and hard links (or symlinks) them into every subreddit and user folder. Requires metadata_mode 'sidecar', which keeps separate metadata for every link
+    blob_store_dir: '.blobs', # Name of the directory that stores unique images in 'blobs' storage mode. Will be created in the destination directory
+    pending_queue_file: 'pending.sqlite', # Name of the database of listed submissions that have not been downloaded yet, and of the position of interrupted listings. The next run continues from there. Will be created in the global data folder
     phash_file: 'images.db', # Name of the database file to store perceptual image hashes. Will be created in the global data folder
     discard_phashed_duplicates: true, # If true, discard downloaded images that were detected to be a perceptual duplicate of other images
+    near_duplicate_distance: 0, # If greater than 0, also treat images as perceptual duplicates if their 64-bit hashes differ in at most this many bits, e.g. 6 to catch re-encoded, resized or watermarked copies
+    phash_index_file: 'images.hashes', # Name of the file to store all perceptual hashes in for the near-duplicate search. Will be created in the global data folder, from the hashes of the library in multi-worker mode. For an existing JSON library, build it with import_images.py --restart
+    gallery_threads: 4, # Number of images of a reddit gallery that are downloaded in parallel
+    max_bytes_per_second: 0, # Maximum download bandwidth of all images together, e.g. 5242880 for 5 MiB/s. Applies to every scraper process separately. 0 disables the limit
+    max_bytes_per_second_per_target: 0, # Maximum download bandwidth of the images of every subreddit or user. 0 disables the limit
+    max_bytes_per_second_per_host: 0, # Maximum download bandwidth of the images from every host, e.g. i.redd.it or i.imgur.com. 0 disables the limit
+    imgur_thumbnail_prededup: false, # If true, hash the small thumbnails of the images of imgur albums first, and download only the images whose thumbnails do not match a stored image. Albums whose thumbnails all match are skipped. Requires keep_imgur_album_phash_duplicates to be false, and works best with near_duplicate_distance, since thumbnails are scaled down
     keep_imgur_album_phash_duplicates = true # If true, keep duplicates that were found in imgur albums, even though they would usually be discarded
+},
+filters: { # Images that do not match these filters are skipped before they are downloaded, based on the preview size of reddit images and the image data of imgur albums. Images whose size is not known in advance are checked against the header of the image file, and their transfer is aborted as soon as they are rejected. 0 or [] disables a filter
+    min_width: 0, # Minimum width in pixels
+    min_height: 0, # Minimum height in pixels
+    min_aspect_ratio: 0, # Minimum ratio of width to height, e.g. 1.0 to skip portrait images
+    max_aspect_ratio: 0, # Maximum ratio of width to height, e.g. 2.5 to skip panoramas
+    max_bytes: 0, # Maximum file size in bytes. Only known for imgur images
+    formats: [] # Allowed image formats, e.g. ['jpg', 'png']
+},
+workers: { # Configuration of the multi-worker mode, in which several scraper processes cooperate on the same targets
+    enabled: false, # If true, share the URL history, the perceptual hashes and a queue of submissions with all other scraper processes that use the same files. To cooperate across hosts, use absolute paths on a shared file system for all files below, the URL history and the destination directory
+    queue_file: 'jobs.sqlite', # Name of the database of submissions that still have to be downloaded, replacing reddit_downloader.pending_queue_file. Will be created in the global data folder
+    phash_file: 'images.sqlite', # Name of the database to store perceptual image hashes in, replacing reddit_downloader.phash_file. Will be created in the global data folder
+    lease_seconds: 300, # Submissions claimed by a scraper process that stopped responding for this long are claimed by another process
+    max_attempts: 3, # Number of times a submission is attempted before it is given up
+    poll_seconds: 5 # Seconds to wait for new submissions while another process is fetching the listing
+},
+instrumentation: { # Configuration related to the timing and throughput statistics of every run
+    print_summary: true, # If true, print the latency of every stage and the achieved throughput after each run
+    prometheus_textfile: '', # If set, write all statistics to this file in the Prometheus text format after each run, e.g. for the node_exporter textfile collector. Should end with .prom
+    profile_dir: 'profiles' # Directory to write profiles into, if the scraper is started with --profile or receives SIGUSR1
 }
 """)
 """The default config that is saved if a config file could not be found"""
 
 
-def main():
-    # Initialize global paths
+def get_config_base_dir() -> Path:
+    """
+    Get the global configuration directory, creating it if necessary
+    :return: the configuration directory
+    """
     xdg_conf: Path = xdg.xdg_config_home()
     if xdg_conf is None:
         xdg_conf: Path = (Path.home() / ".config").absolute()
         print(f"XDG_CONFIG_HOME is not set! Attempting to store the global config in {xdg_conf}", file=sys.stderr)
     config_base_dir: Path = xdg_conf / "RedditImageScraper"
     config_base_dir.mkdir(exist_ok=True, parents=False)
+    return config_base_dir
+
 
+def get_data_base_dir() -> Path:
+    """
+    Get the global data directory, creating it if necessary
+    :return: the data directory
+    """
     xdg_data: Path = xdg.xdg_data_home()
     if xdg_data is None:
         xdg_data: Path = (Path.home() / ".local/share").absolute()
         print(f"XDG_DATA_HOME is not set! Attempting to store application data in {xdg_data}", file=sys.stderr)
     data_base_dir: Path = xdg_data / "RedditImageScraper"
     data_base_dir.mkdir(exist_ok=True, parents=False)
+    return data_base_dir
+
+
+def load_config(config_file: Optional[str]) -> Config:
+    """
+    Load the given config file, or the global config file if none is given.
+    If the config file does not exist, the default config is written to it first.
+    :param config_file: Path of the config file, or None
+    :return: the config
+    """
+    cfg_file: Path = Path(config_file) if config_file is not None else (get_config_base_dir() / "RedditImageScraper.cfg")
+    if not cfg_file.is_file():  # Write the default config file
+        with cfg_file.open("w") as cf:
+            cf.write(_default_config)
+    with cfg_file.open("r") as cf:
+        cfg: Config = Config(cf)
+    try:
+        # Reject unknown and conflicting modes before any work is done
+        is_sidecar_mode(cfg)
+        is_blob_storage(cfg)
+    except ValueError as e:
+        print(f"Invalid config file {cfg_file}: {e}", file=sys.stderr)
+        sys.exit(1)
+    return cfg
+
+
+def open_library(cfg: Config, data_base_dir: Path, require_index: bool = True) -> ImageDatabase:
+    """
+    Open the configured perceptual hash library: the JSON library, or the SQLite database in multi-worker mode,
+    wrapped with the near-duplicate index if it is enabled.
+    A new near-duplicate index is filled with the hashes of the SQLite database. The JSON library cannot list its hashes,
+    so if the index is missing for an existing JSON library, the program exits unless require_index is False.
+    :param cfg: The global configuration
+    :param data_base_dir: The global data directory
+    :param require_index: If False, create a missing near-duplicate index even if it cannot be filled, e.g. to import all images into it
+    :return: the library
+    """
+    shared: bool = cfg.get("workers.enabled", False)
+    if shared:
+        library: ImageDatabase = SQLiteImageDatabase(data_base_dir / cfg.get("workers.phash_file", "images.sqlite"))
+    else:
+        imgdb_file: Path = data_base_dir / cfg["reddit_downloader.phash_file"]
+        if imgdb_file.is_file():
+            library: ImageDatabase = JSONImageDatabase.load(imgdb_file)
+        else:
+            library: ImageDatabase = JSONImageDatabase(imgdb_file)
+    near_duplicate_distance: int = cfg.get("reddit_downloader.near_duplicate_distance", 0)
+    if near_duplicate_distance > 0:
+        index_file: Path = data_base_dir / cfg.get("reddit_downloader.phash_index_file", "images.hashes")
+        new_index: bool = not index_file.is_file()
+        if new_index and require_index and not hasattr(library, "hashes") and imgdb_file.is_file():
+            print(f"The near-duplicate index {index_file} does not exist, but the library {imgdb_file} does. "
+                  f"Run import_images.py --restart on the output directory to build the index.", file=sys.stderr)
+            sys.exit(1)
+        index: HashIndex = HashIndex(index_file, shared)
+        if new_index and hasattr(library, "hashes"):
+            index.add_all(library.hashes())
+            print(f"Added {len(index)} hashes of the library to the near-duplicate index {index_file}")
+        library = NearDuplicateImageDatabase(library, index, near_duplicate_distance)
+    return library
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def main():
+    # Initialize global paths
+    data_base_dir: Path = get_data_base_dir()
 
     # Initialize Argument Parser
     parser = argparse.ArgumentParser(prog="Reddit Image Scraper",
@@ -90,25 +220,38 @@ def main():
     parser.add_argument('-c', '--config', required=False, action="store", dest="config_file", default=None,
                         help='Specifies the config file to read the configuration from. Defaults to a global config file '
                              'in the user\'s configuration directory.')
+    parser.add_argument('--profile', required=False, action="store_true", dest="profile",
+                        help='Profile the whole run. Profiling can also be started and stopped by sending SIGUSR1 to a running scraper')
     args = parser.parse_args()
 
     dest_dir: Path = Path(args.dest_dir)
 
-    cfg_file: Path = Path(args.config_file) if args.config_file is not None else (config_base_dir / "RedditImageScraper.cfg")
-    if not cfg_file.is_file():  # Write the default config file
-        with cfg_file.open("w") as cf:
-            cf.write(_default_config)
-    with cfg_file.open("r") as cf:
-        cfg: Config = Config(cf)
+    cfg: Config = load_config(args.config_file)
 
+    shared: bool = cfg.get("workers.enabled", False)
     urlman_file: Path = data_base_dir / cfg["reddit_downloader.url_history_file"]
-    urlmanager: URLManager = URLManager(urlman_file)
+    urlmanager: URLManager = URLManager(urlman_file, shared=shared)
+    failures: FailureCache = FailureCache(data_base_dir / cfg.get("reddit_downloader.failure_cache_file", "failed_urls.jsonl"),
+                                          cfg.get("reddit_downloader.failure_retry_seconds", 3600),
+                                          cfg.get("reddit_downloader.failure_max_retry_seconds", 604800), shared)
 
-    imgdb_file: Path = data_base_dir / cfg["reddit_downloader.phash_file"]
-    if imgdb_file.is_file():
-        library: ImageDatabase = JSONImageDatabase.load(imgdb_file)
+    library: ImageDatabase = open_library(cfg, data_base_dir)
+    if shared:
+        queue_file: Path = data_base_dir / cfg.get("workers.queue_file", "jobs.sqlite")
     else:
-        library: ImageDatabase = JSONImageDatabase(imgdb_file)
+        queue_file: Path = data_base_dir / cfg.get("reddit_downloader.pending_queue_file", "pending.sqlite")
+    queue: JobQueue = JobQueue(queue_file, cfg.get("workers.lease_seconds", 300), cfg.get("workers.max_attempts", 3))
+    if not shared:
+        queue.release_all()  # Take over the claims of a previous run that has been killed
+
+    archive: SubmissionArchive = SubmissionArchive(dest_dir / cfg.get("reddit_downloader.submission_archive_file", "submissions.jsonl"))
+    listing_cache: Optional[ListingCache] = None
+    if cfg.get("reddit_connector.listing_cache_seconds", 600) > 0:
+        listing_cache = ListingCache(data_base_dir / cfg.get("reddit_connector.listing_cache_file", "listings.sqlite"),
+                                     cfg.get("reddit_connector.listing_cache_seconds", 600))
+    bandwidth: BandwidthLimiter = BandwidthLimiter(cfg.get("reddit_downloader.max_bytes_per_second", 0),
+                                                   cfg.get("reddit_downloader.max_bytes_per_second_per_target", 0),
+                                                   cfg.get("reddit_downloader.max_bytes_per_second_per_host", 0))
 
     # initialize variables
     try:
@@ -118,8 +261,26 @@ def main():
         print(f"Could not parse subreddit or user account {args.subreddit}:\n{str(e)}")
         sys.exit(1)
     num_pics: Optional[int] = args.limit
+    # Stop on SIGTERM like on Ctrl+C, so all claimed submissions are returned to the queue
+    signal.signal(signal.SIGTERM, _interrupt)
+    profiler: Profiler = Profiler(Path(cfg.get("instrumentation.profile_dir", "profiles")))
+    profiler.install_signal_handler()
+    if args.profile:
+        profiler.start()
 
-    scrape_subreddit(subreddit, num_pics, dest_dir, cfg, urlmanager, library)
+    try:
+        scrape_subreddit(subreddit, num_pics, dest_dir, cfg, urlmanager, library, archive, queue, failures, listing_cache, bandwidth)
+    finally:
+        archive.close()
+        queue.close()
+        if listing_cache is not None:
+            listing_cache.close()
+        profiler.stop()
+        if cfg.get("instrumentation.print_summary", True):
+            print(metrics.summary())
+        prometheus_textfile: str = cfg.get("instrumentation.prometheus_textfile", "")
+        if prometheus_textfile:
+            metrics.write_prometheus_textfile(Path(prometheus_textfile))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Import an existing image tree into the perceptual hash library, e.g. after moving to a new machine or after losing the library.
+The images are hashed in parallel, and the import can be interrupted and continued.
+Optionally, the URL history is rebuilt from the submission archive and from the metadata of the images, too.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional
+
+from config import Config
+from imagehashsort import ImageDatabase
+
+from actions import import_library
+from database import URLManager
+from download_images import load_config, get_data_base_dir, open_library
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Reddit Image Scraper Library Import",
+                                     description='Add all images in a directory tree to the perceptual hash library.')
+    parser.add_argument('-d', '--dir', required=False, action="store", dest="root_dir", default='out',
+                        help='Specify the directory to import images from. Default is "out/"')
+    parser.add_argument('-c', '--config', required=False, action="store", dest="config_file", default=None,
+                        help='Specifies the config file to read the configuration from. Defaults to a global config file '
+                             'in the user\'s configuration directory.')
+    parser.add_argument('-j', '--jobs', required=False, action="store", type=int, dest="jobs", default=None,
+                        help='Specify the number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('-b', '--batch-size', required=False, action="store", type=int, dest="batch_size", default=5000,
+                        help='Specify the number of images to store before the library is saved. Default is 5000')
+    parser.add_argument('-u', '--seed-urls', required=False, action="store_true", dest="seed_urls",
+                        help='Add the URLs of the imported images to the URL history, so they are not downloaded again')
+    parser.add_argument('--restart', required=False, action="store_true", dest="restart",
+                        help='Import all images again, instead of continuing an interrupted import')
+    args = parser.parse_args()
+
+    root_dir: Path = Path(args.root_dir)
+    if not root_dir.is_dir():
+        print(f"Directory {root_dir} does not exist!", file=sys.stderr)
+        sys.exit(1)
+    data_base_dir: Path = get_data_base_dir()
+    cfg: Config = load_config(args.config_file)
+    library: ImageDatabase = open_library(cfg, data_base_dir, require_index=False)
+    urlmanager: Optional[URLManager] = None
+    if args.seed_urls:
+        urlmanager = URLManager(data_base_dir / cfg["reddit_downloader.url_history_file"], shared=cfg.get("workers.enabled", False))
+    try:
+        import_library(root_dir, library, urlmanager, cfg.get("reddit_downloader.submission_archive_file", "submissions.jsonl"),
+                       args.jobs, max(args.batch_size, 1), args.restart)
+    except KeyboardInterrupt:
+        print("The import has been interrupted. Run it again to continue.", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if hasattr(library, "close"):
+            library.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,24 @@ This file contains all classes that are downloadable Reddit Objects
 """
 from __future__ import annotations
 
+import re
 from abc import ABCMeta, abstractmethod
-from typing import Any
+from typing import Any, Iterable, Optional, Union
 
 from reddit.SortMethod import SortMethod
 from reddit.TopKind import TopKind
 from reddit.UserPageKind import UserPageKind
 
 
+_SLASHES: re.Pattern = re.compile(r"/*")
+_NAME: re.Pattern = re.compile(r"\w+")
+"""Subreddit and user names, \\w matches exactly the characters that are alphanumeric or underscores"""
+_WORD: re.Pattern = re.compile(r"\w*")
+_LETTERS: re.Pattern = re.compile(r"[^\W\d_]+")
+"""Letters, plus some numeric characters that are no decimal digits, which have to be cut off"""
+_VARIABLE: re.Pattern = re.compile(r"([^=]*)=?")
+
+
 class NoValidRedditObjectError(Exception):
     def __init__(self, string: str, *args: object) -> None:
         super().__init__(f"The given request was not a valid RedditObject: \"{string}\"", *args)
@@ -29,6 +39,16 @@ class RedditObject(metaclass=ABCMeta):
     def printable_name(self) -> str:
         pass
 
+    def _key(self) -> tuple:
+        """The attributes that determine which listing this Reddit Object denotes"""
+        return self.printable_name(), self.sort_method, self.top_kind if self.sort_method.has_top_kind() else None
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RedditObject) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
     @property
     def is_subreddit(self) -> bool:
         """
@@ -58,131 +78,44 @@ class RedditObject(metaclass=ABCMeta):
         :return: a Reddit Object
         :raises NoValidRedditObject: if the given request string is not a valid RedditObject
         """
-        SUBREDDIT, USER = 0, 1
-
-        def parse_enum(remaining_string: str, type: Any) -> tuple[str, Any]:
-            tk = ""
-            while len(remaining_string) > 0 and remaining_string[0].isalpha():
-                tk += remaining_string[0]
-                remaining_string = remaining_string[1:]
-            if len(tk) == 0:
-                raise NoValidRedditObjectError(user_string, f"Expected {type}, instead got {remaining_string}")
-            try:
-                return remaining_string, type[tk.upper()]
-            except KeyError:
-                raise NoValidRedditObjectError(user_string, f"Not a {type}: {rem}")
-
-        def parse_topkind(rem: str) -> tuple[str, TopKind]:
-            return parse_enum(rem, TopKind)
-
-        def parse_sortmethod(rem: str) -> tuple[str, SortMethod]:
-            return parse_enum(rem, SortMethod)
-
-        def parse_userpage(rem: str) -> tuple[str, SortMethod]:
-            return parse_enum(rem, UserPageKind)
-
-        def parse_slashes(rem: str, expect=False) -> str:
-            if len(rem) == 0 or rem[0] != '/':
-                if expect:
-                    raise NoValidRedditObjectError(user_string, f"Expected a slash before {rem}")
-                else:
-                    return rem
-            while len(rem) > 0 and rem[0] == '/':
-                rem = rem[1:]
-            return rem
-
-        def parse_variable_name(rem: str) -> tuple[str, str]:
-            """Parse a variable name given like variable=value... and return "value..." """
-            if len(rem) == 0:
-                raise NoValidRedditObjectError(user_string, f"Expected a variable identifier after the question mark, instead got {rem}")
-            ret = ""
-            while len(rem) > 0 and rem[0] != '=':
-                ret += rem[0]
-                rem = rem[1:]
-            if len(rem) > 0 and rem[0] == '=':
-                rem = rem[1:]
-            return rem, ret
-
-        rem: str = user_string.strip()
-
-        # Parse the protocol
-        if rem.lower().startswith("https://"):
-            https = True
-            rem = rem[len("https://"):]
-        elif rem.lower().startswith("http://"):
-            https = False
-            rem = rem[len("http://"):]
-        else:
-            https = True
-        rem = parse_slashes(rem)
-
-        # Parse the host
-        if rem.lower().startswith("www.reddit.com/"):
-            rem = rem[len("www.reddit.com/"):]
-        elif rem.lower().startswith("reddit.com/"):
-            rem = rem[len("reddit.com/"):]
-        rem = parse_slashes(rem)
-
-        # Parse the kind
-        if rem.lower().startswith("r/"):
-            kind = SUBREDDIT
-            rem = rem[len("r/"):]
-        elif rem.lower().startswith("user/"):
-            kind = USER
-            rem = rem[len("user/"):]
-        elif rem.lower().startswith("u/"):
-            kind = USER
-            rem = rem[len("u/"):]
-        else:
-            kind = SUBREDDIT
-        rem = parse_slashes(rem)
-
-        # Parse Name
-        def is_allowable_character(char: str):
-            return char.isalnum() or char == '_'
-
-        if len(rem) == 0 or not is_allowable_character(rem[0]):
-            raise NoValidRedditObjectError(user_string, f"Invalid Subreddit or User name: {rem}")
-        name: str = ""
-        while len(rem) > 0 and is_allowable_character(rem[0]):
-            name += rem[0]
-            rem = rem[1:]
-        if len(name) == 0:
-            raise NoValidRedditObjectError(user_string, f"Empty name! Remaining: {rem}")
-
-        sort_method = default_sort_method
-        top_kind = default_top_kind
-        user_page = default_user_page
-        # Parse specifiers
-        if len(rem) > 0:
-            rem = parse_slashes(rem, expect=True)
-            if kind is USER:
-                rem, user_page = parse_userpage(rem)
-                rem = parse_slashes(rem)
-            if len(rem) > 0:
-                rem, sort_method = parse_sortmethod(rem)
-        rem = parse_slashes(rem)
-        while len(rem) > 0:
-            if rem[0] == '?' or rem[0] == '&':
-                rem = rem[1:]
-                rem, varname = parse_variable_name(rem)
-                if varname == 't':
-                    rem, top_kind = parse_topkind(rem)
-                else:
-                    while len(rem) > 0 and (rem[0].isalnum() or rem[0] == '_'):
-                        rem = rem[1:]
+        return _parse(user_string, default_top_kind, default_sort_method, default_user_page)
+
+    @staticmethod
+    def from_user_strings(user_strings: Iterable[str], /, default_top_kind: TopKind = next(iter(TopKind)),
+                          default_sort_method: SortMethod = next(iter(SortMethod)),
+                          default_user_page: UserPageKind = next(iter(UserPageKind))) \
+            -> tuple[list[RedditObject], list[tuple[int, NoValidRedditObjectError]]]:
+        """
+        Parse and deduplicate a list of requests, e.g. the lines of a target list file.
+        Empty lines and lines starting with "#" are skipped. Requests that denote the same listing, e.g. "r/wallpapers" and
+        "https://www.reddit.com/r/Wallpapers/hot", are only returned once, and identical lines are only parsed once.
+        :param default_user_page: User Page Kind to choose if no one is given
+        :param default_top_kind: Top Kind to choose if no one is given
+        :param default_sort_method: Sort Method to choose if no one is given
+        :param user_strings: Requests given by the user, one per item
+        :return: the unique Reddit Objects in the order of their first occurrence,
+                 and the 1-based index and the error of every invalid request
+        """
+        parsed: dict[str, Union[RedditObject, NoValidRedditObjectError]] = {}
+        """The result of every distinct request"""
+        unique: dict[RedditObject, None] = {}
+        errors: list[tuple[int, NoValidRedditObjectError]] = []
+        for i, user_string in enumerate(user_strings):
+            line: str = user_string.strip()
+            if not line or line.startswith("#"):
+                continue
+            result: Optional[Union[RedditObject, NoValidRedditObjectError]] = parsed.get(line)
+            if result is None:
+                try:
+                    result = _parse(line, default_top_kind, default_sort_method, default_user_page)
+                except NoValidRedditObjectError as e:
+                    result = e
+                parsed[line] = result
+            if isinstance(result, NoValidRedditObjectError):
+                errors.append((i + 1, result))
             else:
-                raise NoValidRedditObjectError(user_string, f"Must have a question mark: {rem}")
-        rem = parse_slashes(rem)
-        if len(rem) > 0:
-            raise NoValidRedditObjectError(user_string, f"Unexpected input: \"{rem}\"")
-
-        if kind is USER:
-            return User(user_name=name.lower(), user_page_kind=user_page, sort_method=sort_method, top_kind=top_kind, https=https)
-        elif kind is SUBREDDIT:
-            return Subreddit(subreddit_name=name.lower(), sort_method=sort_method, top_kind=top_kind, https=https)
-        else:
-            raise NoValidRedditObjectError(user_string, f"Invalid Kind {kind}")
+                unique.setdefault(result, None)
+        return list(unique.keys()), errors
 
     def get_full_url(self) -> str:
         """
@@ -236,6 +169,9 @@ class User(RedditObject):
     def is_user(self) -> bool:
         return True
 
+    def _key(self) -> tuple:
+        return super()._key() + (self.user_page_kind,)
+
     def get_full_url(self) -> str:
         ret: str = f"{super().get_full_url()}/user/{self.user_name}/{self.user_page_kind.name.lower()}/{self.sort_method.name.lower()}"
         if self.sort_method.has_top_kind():
@@ -244,3 +180,102 @@ class User(RedditObject):
 
     def printable_name(self) -> str:
         return f"u/{self.user_name}"
+
+
+def _startswith(s: str, pos: int, prefix: str) -> bool:
+    """Check if s continues with the given lowercase prefix at the given position, ignoring case"""
+    return s[pos:pos + len(prefix)].lower() == prefix
+
+
+def _skip_slashes(s: str, pos: int) -> int:
+    return _SLASHES.match(s, pos).end()
+
+
+def _parse_enum(user_string: str, s: str, pos: int, enum_type: Any) -> tuple[int, Any]:
+    """Parse the name of a member of the given enum at the given position"""
+    m: Optional[re.Match] = _LETTERS.match(s, pos)
+    token: str = m.group() if m is not None else ""
+    if token and not token.isalpha():
+        token = token[:next(i for i, char in enumerate(token) if not char.isalpha())]
+    if len(token) == 0:
+        raise NoValidRedditObjectError(user_string, f"Expected {enum_type}, instead got {s[pos:]}")
+    try:
+        return pos + len(token), enum_type[token.upper()]
+    except KeyError:
+        raise NoValidRedditObjectError(user_string, f"Not a {enum_type}: {s[pos:]}")
+
+
+def _parse(user_string: str, default_top_kind: TopKind, default_sort_method: SortMethod,
+           default_user_page: UserPageKind) -> RedditObject:
+    """
+    Parse the given request in a single pass, advancing an index instead of slicing off every parsed character.
+    See RedditObject.from_user_string()
+    """
+    s: str = user_string.strip()
+    pos: int = 0
+
+    # Parse the protocol
+    https: bool = True
+    if _startswith(s, pos, "https://"):
+        pos += len("https://")
+    elif _startswith(s, pos, "http://"):
+        https = False
+        pos += len("http://")
+    pos = _skip_slashes(s, pos)
+
+    # Parse the host
+    if _startswith(s, pos, "www.reddit.com/"):
+        pos += len("www.reddit.com/")
+    elif _startswith(s, pos, "reddit.com/"):
+        pos += len("reddit.com/")
+    pos = _skip_slashes(s, pos)
+
+    # Parse the kind
+    is_user: bool = False
+    if _startswith(s, pos, "r/"):
+        pos += len("r/")
+    elif _startswith(s, pos, "user/"):
+        is_user = True
+        pos += len("user/")
+    elif _startswith(s, pos, "u/"):
+        is_user = True
+        pos += len("u/")
+    pos = _skip_slashes(s, pos)
+
+    # Parse Name
+    m: Optional[re.Match] = _NAME.match(s, pos)
+    if m is None:
+        raise NoValidRedditObjectError(user_string, f"Invalid Subreddit or User name: {s[pos:]}")
+    name: str = m.group()
+    pos = m.end()
+
+    sort_method: SortMethod = default_sort_method
+    top_kind: TopKind = default_top_kind
+    user_page: UserPageKind = default_user_page
+    # Parse specifiers
+    if pos < len(s):
+        if s[pos] != '/':
+            raise NoValidRedditObjectError(user_string, f"Expected a slash before {s[pos:]}")
+        pos = _skip_slashes(s, pos)
+        if is_user:
+            pos, user_page = _parse_enum(user_string, s, pos, UserPageKind)
+            pos = _skip_slashes(s, pos)
+        if pos < len(s):
+            pos, sort_method = _parse_enum(user_string, s, pos, SortMethod)
+    pos = _skip_slashes(s, pos)
+    while pos < len(s):
+        if s[pos] != '?' and s[pos] != '&':
+            raise NoValidRedditObjectError(user_string, f"Must have a question mark: {s[pos:]}")
+        pos += 1
+        if pos == len(s):
+            raise NoValidRedditObjectError(user_string, f"Expected a variable identifier after the question mark, instead got ")
+        m = _VARIABLE.match(s, pos)
+        pos = m.end()
+        if m.group(1) == 't':
+            pos, top_kind = _parse_enum(user_string, s, pos, TopKind)
+        else:
+            pos = _WORD.match(s, pos).end()
+
+    if is_user:
+        return User(user_name=name.lower(), user_page_kind=user_page, sort_method=sort_method, top_kind=top_kind, https=https)
+    return Subreddit(subreddit_name=name.lower(), sort_method=sort_method, top_kind=top_kind, https=https)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Refresh the score, upvote ratio and number of comments in the metadata of all images in a scraped destination directory.
+The submissions are looked up by their fullnames in batches of 100, so refreshing 100,000 images from 1,000 submissions
+takes 10 API requests, instead of listing all subreddits and users again.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from config import Config
+
+from actions import refresh_submissions, connect_to_reddit
+from download_images import load_config
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Reddit Image Scraper Metadata Refresh",
+                                     description='Refresh the scores of all submissions that have already been scraped in the metadata of their images.')
+    parser.add_argument('-o', '--out-dir', required=False, action="store", dest="dest_dir", default='out',
+                        help='Specify the destination directory the files have been scraped into. Default is "out/"')
+    parser.add_argument('-c', '--config', required=False, action="store", dest="config_file", default=None,
+                        help='Specifies the config file to read the configuration from. Defaults to a global config file '
+                             'in the user\'s configuration directory.')
+    parser.add_argument('-j', '--jobs', required=False, action="store", type=int, dest="jobs", default=None,
+                        help='Specify the number of worker processes. Defaults to the number of CPUs')
+    args = parser.parse_args()
+
+    dest_dir: Path = Path(args.dest_dir)
+    if not dest_dir.is_dir():
+        print(f"Destination directory {dest_dir} does not exist!", file=sys.stderr)
+        sys.exit(1)
+    cfg: Config = load_config(args.config_file)
+    refresh_submissions(dest_dir, cfg, connect_to_reddit(cfg), args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import tempfile
+from pathlib import Path
+from typing import Any
+from unittest import TestCase
+
+from actions.BackfillMetadata import backfill_metadata
+from actions.WriteMetadata import get_sidecar_file
+from database import SubmissionArchive
+from test.test_SubmissionArchive import make_submission
+
+
+class TestBackfillMetadata(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.destination: Path = Path(self.tempdir.name)
+        self.cfg: dict[str, Any] = {"metadata_scraper.metadata_mode": "sidecar", "metadata_scraper.write_keywords": True,
+                                    "metadata_scraper.subreddit_name": "Subreddit", "metadata_scraper.user_name": "Reddit User",
+                                    "metadata_scraper.lightroom_hierarchy_separator": "|"}
+        self.image_file: Path = self.destination / "reddit_sub_wallpapers" / "a.png"
+        self.gallery_file: Path = self.destination / "reddit_sub_wallpapers" / "Title b" / "01 x.jpg"
+        self.gallery_file.parent.mkdir(parents=True)
+        self.image_file.write_bytes(b"image")
+        self.gallery_file.write_bytes(b"image")
+        archive: SubmissionArchive = SubmissionArchive(self.destination / "submissions.jsonl")
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        archive.add_submission(make_submission("b"), "r/wallpapers")
+        archive.add_image(self.image_file, "a")
+        archive.add_image(self.gallery_file, "b", gallery_item={"id": "x", "file": "x.jpg", "caption": "Caption", "width": 1920,
+                                                                "height": 1080, "type": "image/jpg"})
+        archive.close()
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertEqual(2, backfill_metadata(self.destination, self.cfg, workers=1))
+        self.assertIn("Title b", get_sidecar_file(self.gallery_file).read_text(), "Expected the gallery metadata to be written")
+        self.assertEqual(0, backfill_metadata(self.destination, self.cfg, workers=1), "Expected files with current metadata to be skipped")
+
+        get_sidecar_file(self.image_file).unlink()
+        self.assertEqual(1, backfill_metadata(self.destination, self.cfg, workers=1), "Expected deleted sidecars to be rewritten")
+
+        self.cfg["metadata_scraper.subreddit_name"] = "Reddit"
+        self.assertEqual(2, backfill_metadata(self.destination, self.cfg, workers=1), "Expected all files to be rewritten after the config changed")
+        for image_file in (self.image_file, self.gallery_file):
+            self.assertIn("Reddit|wallpapers", get_sidecar_file(image_file).read_text())
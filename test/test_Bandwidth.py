@@ -0,0 +1,59 @@
+import unittest
+
+from actions.downloader import BandwidthLimiter, Throttle
+
+
+class TestBandwidth(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now: float = 0.0
+        self.waits: list[float] = []
+
+    def sleep(self, seconds: float) -> None:
+        self.waits.append(seconds)
+        self.now += seconds
+
+    def limiter(self, *limits: float) -> BandwidthLimiter:
+        return BandwidthLimiter(*limits, clock=lambda: self.now, sleep=self.sleep)
+
+    def test_unlimited(self):
+        limiter: BandwidthLimiter = self.limiter()
+        self.assertFalse(limiter.enabled)
+        limiter.for_target("r/pics").for_url("https://i.redd.it/a.jpg").consume(10 ** 9)
+        self.assertEqual([], self.waits)
+
+    def test_global_limit_allows_one_second_burst(self):
+        throttle: Throttle = self.limiter(1000).for_target("r/pics").for_url("https://i.redd.it/a.jpg")
+        throttle.consume(1000)
+        self.assertEqual([], self.waits)
+        throttle.consume(500)
+        self.assertEqual([0.5], self.waits)
+        for _ in range(10):
+            throttle.consume(100)
+        self.assertAlmostEqual(1.5, self.now)
+
+    def test_global_limit_is_shared_by_targets(self):
+        limiter: BandwidthLimiter = self.limiter(1000)
+        limiter.for_target("r/pics").consume(1000)
+        limiter.for_target("r/earthporn").consume(1000)
+        self.assertEqual([1.0], self.waits)
+
+    def test_per_target_limit(self):
+        limiter: BandwidthLimiter = self.limiter(0, 100, 1000)
+        limiter.for_target("r/pics").for_url("https://i.redd.it/a.jpg").consume(100)
+        limiter.for_target("r/earthporn").for_url("https://i.redd.it/b.jpg").consume(100)
+        self.assertEqual([], self.waits)
+        # The most restrictive bucket applies
+        limiter.for_target("r/pics").for_url("https://i.redd.it/c.jpg").consume(50)
+        self.assertEqual([0.5], self.waits)
+
+    def test_per_host_limit(self):
+        limiter: BandwidthLimiter = self.limiter(0, 0, 100)
+        limiter.for_target("r/pics").for_url("https://i.redd.it/a.jpg").consume(100)
+        limiter.for_target("r/earthporn").for_url("https://i.imgur.com/b.jpg").consume(100)
+        self.assertEqual([], self.waits)
+        limiter.for_target("r/earthporn").for_url("https://i.redd.it/c.jpg").consume(100)
+        self.assertEqual([1.0], self.waits)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from actions import is_blob_storage
+from database import BlobStore
+
+
+class TestBlobStore(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root: Path = Path(self.tempdir.name)
+        self.store: BlobStore = BlobStore(self.root / ".blobs")
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_adopt_and_materialize(self):
+        digest: str = "ab" * 32
+        first: Path = self.root / "reddit_sub_a" / "image.png"
+        first.parent.mkdir()
+        first.write_bytes(b"image")
+        self.assertFalse(self.store.contains(digest), "Expected an empty store")
+        self.store.adopt(first, digest)
+        self.assertTrue(self.store.contains(digest), "Expected the adopted file to be stored")
+        self.assertTrue(first.is_file(), "Expected the adopted file to stay in place")
+
+        second: Path = self.root / "reddit_user_b" / "image.png"
+        self.store.materialize(digest, second)
+        self.assertEqual(b"image", second.read_bytes())
+        self.assertTrue(os.path.samefile(first, second), "Expected both targets to share the stored blob")
+        self.store.materialize(digest, second)  # Materializing twice must not fail
+        self.assertTrue(os.path.samefile(first, second))
+
+    def test_adopt_existing_blob(self):
+        digest: str = "cd" * 32
+        first: Path = self.root / "first.png"
+        first.write_bytes(b"first")
+        second: Path = self.root / "second.png"
+        second.write_bytes(b"second")
+        self.store.adopt(first, digest)
+        self.store.adopt(second, digest)
+        self.assertEqual(b"first", self.store.blob_path(digest).read_bytes(), "Expected the first adopted file to be kept")
+
+    def test_storage_mode_requires_sidecar(self):
+        self.assertFalse(is_blob_storage({}))
+        self.assertTrue(is_blob_storage({"reddit_downloader.storage_mode": "blobs", "metadata_scraper.metadata_mode": "sidecar"}))
+        # Metadata could still be embedded by a backfill, even if the scraper does not write any
+        for write_metadata in (True, False):
+            with self.subTest(write_metadata=write_metadata), self.assertRaises(ValueError):
+                is_blob_storage({"reddit_downloader.storage_mode": "blobs", "metadata_scraper.write_metadata": write_metadata})
+        with self.assertRaises(ValueError):
+            is_blob_storage({"reddit_downloader.storage_mode": "copies"})
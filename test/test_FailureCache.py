@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from database import FailureCache
+
+
+class TestFailureCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache_file: Path = Path(self.tempdir.name) / "failed_urls.jsonl"
+        self.now: float = 1000.0
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def cache(self) -> FailureCache:
+        return FailureCache(self.cache_file, 10, 35, clock=lambda: self.now)
+
+    def test_permanent_failures_are_never_retried(self):
+        self.cache().record("https://i.redd.it/gone.jpg", True, "HTTP 404")
+        self.now += 10 ** 9
+        self.assertIn("HTTP 404", self.cache().blocked("https://i.redd.it/gone.jpg"))
+
+    def test_transient_failures_back_off_exponentially(self):
+        cache: FailureCache = self.cache()
+        url: str = "https://i.redd.it/busy.jpg"
+        self.assertIsNone(cache.blocked(url))
+        for backoff in (10, 20, 35, 35):
+            cache.record(url, False, "HTTP 503")
+            self.now += backoff - 1
+            self.assertIsNotNone(self.cache().blocked(url))
+            self.now += 1
+            self.assertIsNone(self.cache().blocked(url))
+
+    def test_forget(self):
+        cache: FailureCache = self.cache()
+        cache.record("https://i.redd.it/a.jpg", False, "timed out")
+        cache.record("https://i.redd.it/b.jpg", False, "timed out")
+        cache.forget("https://i.redd.it/a.jpg")
+        self.assertEqual({"https://i.redd.it/b.jpg"}, set(self.cache().failures))
+
+    def test_interrupted_write(self):
+        self.cache().record("https://i.redd.it/a.jpg", True, "HTTP 410")
+        with self.cache_file.open("a") as cf:
+            cf.write('{"url": "https://i.redd.it/b.jp')
+        cache: FailureCache = self.cache()
+        cache.record("https://i.redd.it/c.jpg", True, "HTTP 404")
+        self.assertEqual({"https://i.redd.it/a.jpg", "https://i.redd.it/c.jpg"}, set(self.cache().failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from database import HashIndex, NearDuplicateImageDatabase, SQLiteImageDatabase, hash_to_int
+
+
+class TestHashIndex(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.index_file: Path = Path(self.tempdir.name) / "images.hashes"
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_hash_to_int(self):
+        self.assertEqual(0xffd8000000000001, hash_to_int("ffd8000000000001"))
+        self.assertEqual(5, hash_to_int(5))
+        with self.assertRaises(ValueError):
+            hash_to_int("1" * 17)
+
+    def test_near_duplicates(self):
+        index: HashIndex = HashIndex()
+        self.assertIsNone(index.nearest_distance(0))
+        self.assertFalse(index.contains_within(0, 64))
+        for i in range(3000):  # Grow beyond the initial capacity
+            index.add(i << 16)
+        index.add("f0f0f0f0f0f0f0f0")
+        self.assertEqual(3001, len(index))
+        self.assertEqual(0, index.nearest_distance(0xf0f0f0f0f0f0f0f0))
+        self.assertEqual(3, index.nearest_distance(0xf0f0f0f0f0f0f0f7))
+        self.assertTrue(index.contains_within("f0f0f0f0f0f0f0f7", 3))
+        self.assertFalse(index.contains_within("f0f0f0f0f0f0f0f7", 2))
+
+    def test_persistence_and_sharing(self):
+        index: HashIndex = HashIndex(self.index_file, shared=True)
+        other: HashIndex = HashIndex(self.index_file, shared=True)
+        index.add(0xffffffffffffffff)
+        self.assertTrue(other.contains_within(0xfffffffffffffffe, 1), "Expected hashes of other processes to be picked up")
+        other.add(1)
+        self.assertEqual(2, len(HashIndex(self.index_file)))
+        self.assertEqual(1, index.nearest_distance(0))
+
+    def test_incomplete_hash_is_truncated(self):
+        HashIndex(self.index_file).add(1)
+        with self.index_file.open("ab") as idf:
+            idf.write(b"\xff\xff\xff")  # A process has been killed while appending
+        index: HashIndex = HashIndex(self.index_file)
+        self.assertEqual(1, len(index))
+        index.add(2)
+        self.assertEqual(16, self.index_file.stat().st_size)
+        reloaded: HashIndex = HashIndex(self.index_file)
+        self.assertEqual(2, len(reloaded))
+        self.assertEqual(0, reloaded.nearest_distance(2))
+
+    def test_sqlite_library_stores_every_file_once(self):
+        database_file: Path = Path(self.tempdir.name) / "images.sqlite"
+        with sqlite3.connect(database_file) as connection:  # A library of an older version, which has been imported twice
+            connection.execute("CREATE TABLE images (hash TEXT NOT NULL, file TEXT NOT NULL)")
+            connection.executemany("INSERT INTO images (hash, file) VALUES (?, ?)", [("00000000000000ff", "a.png")] * 2)
+        connection.close()
+        library: SQLiteImageDatabase = SQLiteImageDatabase(database_file)
+        library.store_images([(Path("a.png"), "00000000000000ff"), (Path("b.png"), "000000000000ff00")])
+        library.store_image(Path("b.png"), "0000000000ff0000")  # The file has been replaced
+        self.assertEqual(["00000000000000ff", "0000000000ff0000"], sorted(library.hashes()))
+        self.assertEqual(2, library._connection.execute("SELECT COUNT(*) FROM images").fetchone()[0])
+        library.close()
+
+    def test_near_duplicate_library(self):
+        sqlite_library: SQLiteImageDatabase = SQLiteImageDatabase(Path(self.tempdir.name) / "images.sqlite")
+        library: NearDuplicateImageDatabase = NearDuplicateImageDatabase(sqlite_library, HashIndex(self.index_file), 4)
+        library.store_image(Path("a.png"), "00000000000000ff")
+        self.assertTrue(library.hash_in_hashes("00000000000000ff"))
+        self.assertTrue(library.hash_in_hashes("000000000000000f"), "Expected a near-duplicate within 4 bits")
+        self.assertFalse(library.hash_in_hashes("0000000000000000"))
+        self.assertEqual(["00000000000000ff"], library.hashes())
+        library.save()
+        library.close()
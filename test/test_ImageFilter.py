@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from actions.ImageFilter import ImageFilter, normalize_format
+
+
+class TestImageFilter(TestCase):
+    def test_disabled(self):
+        image_filter: ImageFilter = ImageFilter()
+        self.assertFalse(image_filter.enabled)
+        self.assertIsNone(image_filter.rejects(1, 1000, 10 ** 9, "gif"))
+
+    def test_constraints(self):
+        image_filter: ImageFilter = ImageFilter(min_width=1920, min_height=1080, min_aspect_ratio=1.0, max_aspect_ratio=2.5,
+                                                max_bytes=10 ** 7, formats=["jpg", "png"])
+        self.assertIsNone(image_filter.rejects(3840, 2160, 4 * 10 ** 6, "image/jpeg"))
+        self.assertIsNotNone(image_filter.rejects(1280, 1080))
+        self.assertIsNotNone(image_filter.rejects(1920, 720))
+        self.assertIsNotNone(image_filter.rejects(2160, 3840), "Expected portrait images to be rejected")
+        self.assertIsNotNone(image_filter.rejects(7680, 1080), "Expected panoramas to be rejected")
+        self.assertIsNotNone(image_filter.rejects(size=2 * 10 ** 7))
+        self.assertIsNotNone(image_filter.rejects(image_format="image/gif"))
+
+    def test_unknown_values_pass(self):
+        image_filter: ImageFilter = ImageFilter(min_width=1920, min_height=1080, min_aspect_ratio=1.0, max_bytes=10 ** 7, formats=["png"])
+        self.assertIsNone(image_filter.rejects())
+        self.assertIsNone(image_filter.rejects(width=3840), "Expected the aspect ratio to be ignored if the height is unknown")
+
+    def test_normalize_format(self):
+        for image_format in (".JPG", "jpg", "jpeg", "image/jpeg"):
+            self.assertEqual("jpeg", normalize_format(image_format))
+        self.assertEqual("png", normalize_format("image/png"))
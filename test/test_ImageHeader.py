@@ -0,0 +1,66 @@
+import struct
+import unittest
+from io import BytesIO
+
+from actions.ImageFilter import ImageFilter
+from actions.downloader.ImageHeader import sniff_image, is_html
+from actions.downloader.Transfer import DownloadFailure, ImageRejected, _Transfer
+
+
+def png(width: int, height: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I4sII", 13, b"IHDR", width, height) + bytes(5000)
+
+
+def jpeg(width: int, height: int, exif_bytes: int = 100) -> bytes:
+    app1: bytes = b"\xff\xe1" + struct.pack(">H", exif_bytes + 2) + bytes(exif_bytes)
+    sof0: bytes = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 3) + bytes(6)
+    return b"\xff\xd8" + app1 + sof0 + bytes(200000)
+
+
+class TestImageHeader(unittest.TestCase):
+    def test_formats(self):
+        for data, expected in ((png(161, 81), ("png", 161, 81)),
+                               (jpeg(4032, 3024), ("jpeg", 4032, 3024)),
+                               (b"GIF89a" + struct.pack("<HH", 320, 240) + bytes(100), ("gif", 320, 240)),
+                               (b"RIFF\0\0\0\0WEBPVP8X" + bytes(8) + (1919).to_bytes(3, "little") + (1079).to_bytes(3, "little"),
+                                ("webp", 1920, 1080))):
+            with self.subTest(expected=expected):
+                header = sniff_image(data)
+                self.assertEqual(expected, (header.format, header.width, header.height))
+
+    def test_incomplete_and_unknown(self):
+        self.assertFalse(sniff_image(jpeg(800, 600, exif_bytes=60000)[:30000]).complete)
+        self.assertTrue(sniff_image(jpeg(800, 600, exif_bytes=60000)[:70000]).complete)
+        self.assertIsNone(sniff_image(b"\0\0\0\x20ftypisom" + bytes(100)))
+        self.assertTrue(is_html(b"\n  <!DOCTYPE html><html><body>Not found</body></html>"))
+        self.assertFalse(is_html(png(1, 1)))
+
+    def test_transfer_is_aborted_early(self):
+        response = BytesIO(jpeg(640, 480))
+        transfer = _Transfer("https://i.redd.it/small.jpg", response, None, 0)
+        with self.assertRaises(ImageRejected):
+            transfer.check_header(ImageFilter(min_width=1920))
+        self.assertLess(response.tell(), 10000)
+
+    def test_imgur_placeholder_and_html(self):
+        with self.assertRaises(DownloadFailure) as placeholder:
+            _Transfer("https://i.imgur.com/abcdef.jpg", BytesIO(png(161, 81)), None, 0).check_header(None)
+        self.assertTrue(placeholder.exception.permanent)
+        with self.assertRaises(DownloadFailure) as html:
+            _Transfer("https://i.redd.it/a.jpg", BytesIO(b"<html><body>Error</body></html>"), None, 0).check_header(None)
+        self.assertFalse(html.exception.permanent)
+        # The same size is a valid image on other hosts
+        _Transfer("https://i.redd.it/a.png", BytesIO(png(161, 81)), None, 0).check_header(None)
+        with self.assertRaises(DownloadFailure) as empty:
+            _Transfer("https://i.redd.it/a.png", BytesIO(b""), None, 0).check_header(None)
+        self.assertFalse(empty.exception.permanent)
+
+    def test_max_bytes(self):
+        transfer = _Transfer("https://i.redd.it/large.jpg", BytesIO(jpeg(640, 480)), None, 100000)
+        transfer.check_header(None)
+        with self.assertRaises(ImageRejected):
+            transfer.receive(None, 10 ** 6, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
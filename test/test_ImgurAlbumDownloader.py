@@ -0,0 +1,74 @@
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from unittest import TestCase
+from unittest.mock import patch
+
+from actions.downloader.ImgurAlbumDownloader import ImgurAlbumDownloader, get_thumbnail_url
+from actions.downloader.Transfer import ImageRejected
+
+
+def thumbnail_hash(image_data: dict, throttle: Any) -> str:
+    return f"hash-{image_data['id']}"
+
+
+def album_response(*image_ids: str) -> SimpleNamespace:
+    images: list[dict[str, Any]] = [{"id": image_id, "link": f"https://i.imgur.com/{image_id}.jpg", "is_ad": False, "title": None,
+                                     "description": None, "datetime": 1650000000, "views": 1} for image_id in image_ids]
+    data: dict[str, Any] = {"id": "album", "title": "Album", "description": None, "datetime": 1650000000, "link": "https://imgur.com/a/album",
+                            "is_album": True, "images": images, "views": 1, "account_url": None, "account_id": None}
+    return SimpleNamespace(status_code=200, text=json.dumps({"data": data}))
+
+
+class FakeJob:
+    def __init__(self) -> None:
+        self.done: list[str] = []
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str) -> None:
+        self.done.append(key)
+
+
+class TestImgurAlbumDownloader(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.library = SimpleNamespace(hash_in_hashes=lambda imhash: imhash in {"hash-a", "hash-b"})
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def download(self, response: SimpleNamespace, job: FakeJob) -> int:
+        with patch("actions.downloader.ImgurAlbumDownloader._hash_thumbnail", thumbnail_hash), \
+                patch("actions.downloader.ImgurAlbumDownloader.requests.request", return_value=response), \
+                patch("actions.downloader.ImgurAlbumDownloader.download_image", side_effect=ImageRejected("url", "rejected")) as download:
+            downloaded: int = ImgurAlbumDownloader().download_single_album(
+                "https://imgur.com/a/album", Path(self.tempdir.name), "client", library=self.library, allow_duplicate_phashes=False,
+                job=job, thumbnail_prededup=True, threads=2)
+            self.downloaded_urls: list[str] = [call.args[0] for call in download.call_args_list]
+        return downloaded
+
+    def test_thumbnail_url(self):
+        self.assertEqual("https://i.imgur.com/abc123t.jpg", get_thumbnail_url({"id": "abc123", "link": "https://i.imgur.com/abc123.png"}))
+        self.assertEqual("http://i.imgur.com/abc123t.jpg", get_thumbnail_url({"id": "abc123", "link": "http://i.imgur.com/abc123.gif"}))
+
+    def test_known_by_thumbnail(self):
+        images: list[dict[str, Any]] = json.loads(album_response("a", "c", "b").text)["data"]["images"]
+        with patch("actions.downloader.ImgurAlbumDownloader._hash_thumbnail", thumbnail_hash):
+            known: set[str] = ImgurAlbumDownloader()._known_by_thumbnail(images, self.library.hash_in_hashes, None, 2)
+        self.assertEqual({"a", "b"}, known)
+
+    def test_album_with_known_thumbnails_is_skipped(self):
+        job: FakeJob = FakeJob()
+        self.assertEqual(0, self.download(album_response("a", "b"), job))
+        self.assertEqual([], self.downloaded_urls, "Expected no image of the album to be downloaded")
+        self.assertEqual([], job.done, "Expected the album to be skipped before its images are selected")
+
+    def test_known_thumbnails_are_marked_done(self):
+        job: FakeJob = FakeJob()
+        self.assertEqual(0, self.download(album_response("a", "c", "b"), job))
+        self.assertEqual(["https://i.imgur.com/c.jpg"], self.downloaded_urls, "Expected only the unknown image to be downloaded")
+        self.assertEqual(["a", "b"], job.done, "Expected the images with known thumbnails to be recorded in the job")
@@ -0,0 +1,31 @@
+import unittest
+
+from actions.ImportLibrary import get_source_url
+
+
+class TestImportLibrary(unittest.TestCase):
+    permalink: str = "https://www.reddit.com/r/wallpapers/comments/abc123/a_title/"
+
+    def test_reddit_image(self):
+        self.assertEqual("https://i.redd.it/0a1b2c3d4e5f6.jpg",
+                         get_source_url({"Xmp.dc.source": self.permalink, "Xmp.xmpMM.PreservedFileName": "0a1b2c3d4e5f6.jpg"}))
+
+    def test_imgur_image(self):
+        self.assertEqual("https://i.imgur.com/AbCdEfG.png",
+                         get_source_url({"Xmp.dc.source": self.permalink, "Xmp.xmpMM.PreservedFileName": "AbCdEfG.png"}))
+
+    def test_reddit_gallery(self):
+        self.assertEqual("https://www.reddit.com/gallery/abc123",
+                         get_source_url({"Xmp.dc.source": self.permalink, "Xmp.xmpMM.PreservedFileName": "01 x.jpg",
+                                         "Xmp.xmpDM.album": "A Title abc123"}))
+
+    def test_imgur_album(self):
+        self.assertIsNone(get_source_url({"Xmp.dc.source": self.permalink, "Xmp.xmpMM.PreservedFileName": "x.jpg",
+                                          "Xmp.xmpDM.album": "Imgur Album"}))
+
+    def test_no_metadata(self):
+        self.assertIsNone(get_source_url({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+
+from actions.Instrumentation import Metrics
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self) -> None:
+        self.metrics: Metrics = Metrics()
+
+    def test_histogram(self):
+        for seconds in (0.002, 0.002, 0.002, 0.2):
+            self.metrics.observe("perceptual_hash", seconds)
+        histogram = self.metrics.histograms["perceptual_hash"]
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(0.206, histogram.sum)
+        self.assertEqual(0.0025, histogram.quantile(0.5))
+        self.assertEqual(0.25, histogram.quantile(1.0))
+
+    def test_timed_iter(self):
+        self.assertEqual([1, 2, 3], list(self.metrics.timed_iter("listing", [1, 2, 3])))
+        self.assertEqual(3, self.metrics.histograms["listing"].count)
+
+    def test_time_records_failures(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.time("metadata_write"):
+                raise ValueError()
+        self.assertEqual(1, self.metrics.histograms["metadata_write"].count)
+
+    def test_context_marks_active_stages(self):
+        with self.metrics.context("HTTPDownloader"):
+            with self.metrics.time("http_transfer"):
+                self.assertEqual(["HTTPDownloader", "http_transfer"], self.metrics.active[threading.get_ident()])
+        self.assertEqual([], self.metrics.active[threading.get_ident()])
+        self.assertNotIn("HTTPDownloader", self.metrics.histograms)
+
+    def test_prometheus_textfile(self):
+        self.metrics.count("http_bytes", 1024)
+        self.metrics.observe("http_ttfb", 0.03)
+        with tempfile.TemporaryDirectory() as tempdir:
+            target: Path = Path(tempdir) / "scraper.prom"
+            self.metrics.write_prometheus_textfile(target)
+            lines: list[str] = target.read_text().splitlines()
+        self.assertIn('reddit_image_scraper_stage_seconds_bucket{stage="http_ttfb",le="0.025"} 0', lines)
+        self.assertIn('reddit_image_scraper_stage_seconds_bucket{stage="http_ttfb",le="0.05"} 1', lines)
+        self.assertIn('reddit_image_scraper_stage_seconds_count{stage="http_ttfb"} 1', lines)
+        self.assertIn("reddit_image_scraper_http_bytes_total 1024", lines)
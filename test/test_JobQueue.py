@@ -0,0 +1,98 @@
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from database import JobQueue
+
+
+class TestJobQueue(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.queue_file: Path = Path(self.tempdir.name) / "jobs.sqlite"
+        self.queue: JobQueue = JobQueue(self.queue_file, lease_seconds=60, max_attempts=2)
+
+    def tearDown(self) -> None:
+        self.queue.close()
+        self.tempdir.cleanup()
+
+    def _other_worker(self, lease_seconds: float = 60) -> JobQueue:
+        other: JobQueue = JobQueue(self.queue_file, lease_seconds=lease_seconds, max_attempts=2)
+        other.worker = "other"
+        return other
+
+    def test_claim_and_complete(self):
+        self.assertTrue(self.queue.enqueue("a", "r/pics", {"id": "a"}))
+        self.assertFalse(self.queue.enqueue("a", "r/pics", {"id": "a"}), "Expected a queued submission not to be queued twice")
+        self.queue.enqueue("b", "r/pics", {"id": "b"})
+        job = self.queue.claim("r/pics")
+        self.assertEqual("a", job.submission_id)
+        self.assertEqual({"id": "a"}, job.record)
+        other: JobQueue = self._other_worker()
+        self.assertEqual("b", other.claim("r/pics").submission_id, "Expected claimed jobs to be skipped")
+        other.close()
+        self.assertIsNone(self.queue.claim("r/pics"))
+        job.complete()
+        self.assertEqual(1, self.queue.pending())
+
+    def test_expired_lease_and_max_attempts(self):
+        other: JobQueue = self._other_worker(lease_seconds=0.01)
+        self.queue.enqueue("a", "r/pics", {"id": "a"})
+        self.assertEqual(1, other.claim().attempts)
+        other.close()  # The process dies without releasing its claims
+        time.sleep(0.05)
+        self.assertEqual(2, self.queue.claim().attempts, "Expected the job of the expired lease to be claimed again")
+        self.queue.release()
+        self.assertIsNone(self.queue.claim(), "Expected the job to be given up after the maximum number of attempts")
+        self.assertEqual(0, self.queue.pending())
+
+    def test_listing_claims(self):
+        other: JobQueue = self._other_worker()
+        self.assertTrue(self.queue.claim_listing("r/pics"))
+        self.assertFalse(other.claim_listing("r/pics"))
+        self.assertTrue(other.listing_in_progress("r/pics"))
+        self.queue.release()
+        self.assertFalse(other.listing_in_progress("r/pics"))
+        self.assertTrue(other.claim_listing("r/pics"))
+        other.close()
+
+    def test_listing_cursor(self):
+        self.assertTrue(self.queue.claim_listing("https://www.reddit.com/r/pics/new"))
+        self.queue.enqueue("a", "r/pics", {"id": "a"}, "https://www.reddit.com/r/pics/new", "t3_a")
+        self.queue.advance_listing("https://www.reddit.com/r/pics/new", "t3_b")
+        self.queue.release_listing("https://www.reddit.com/r/pics/new")
+        self.assertTrue(self.queue.claim_listing("https://www.reddit.com/r/pics/new"))
+        self.assertEqual("t3_b", self.queue.listing_cursor("https://www.reddit.com/r/pics/new"),
+                         "Expected an interrupted listing to be continued after the last listed submission")
+        self.queue.release_listing("https://www.reddit.com/r/pics/new", finished=True)
+        self.assertIsNone(self.queue.listing_cursor("https://www.reddit.com/r/pics/new"))
+
+    def test_progress_survives_release(self):
+        self.queue.enqueue("a", "r/pics", {"id": "a"})
+        job = self.queue.claim()
+        job.mark_done("img1")
+        self.queue.release_all()
+        job = self.queue.claim()
+        self.assertTrue(job.is_done("img1"), "Expected the progress of an interrupted job to be kept")
+        self.assertFalse(job.is_done("img2"))
+
+    def test_submission_in_several_targets(self):
+        self.assertTrue(self.queue.enqueue("a", "r/pics", {"id": "a"}))
+        self.assertTrue(self.queue.enqueue("a", "r/earthporn", {"id": "a"}), "Expected the submission to be queued for every target")
+        self.assertEqual("r/earthporn", self.queue.claim("r/earthporn").target)
+        self.assertEqual("r/pics", self.queue.claim("r/pics").target)
+
+    def test_migrate_queue_with_one_job_per_submission(self):
+        self.queue.close()
+        self.queue_file.unlink()
+        with sqlite3.connect(self.queue_file) as c:
+            c.execute("CREATE TABLE jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                      "submission_id TEXT NOT NULL UNIQUE, target TEXT NOT NULL, record TEXT NOT NULL, "
+                      "state INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+                      "attempts INTEGER NOT NULL DEFAULT 0, progress TEXT NOT NULL DEFAULT '[]')")
+            c.execute("INSERT INTO jobs (submission_id, target, record) VALUES ('a', 'r/pics', '{\"id\": \"a\"}')")
+        c.close()
+        self.queue = JobQueue(self.queue_file, lease_seconds=60, max_attempts=2)
+        self.assertTrue(self.queue.enqueue("a", "r/earthporn", {"id": "a"}))
+        self.assertEqual({"id": "a"}, self.queue.claim("r/pics").record, "Expected the queued jobs to be migrated")
@@ -0,0 +1,42 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from database import ListingCache, SubmissionArchive, ArchivedSubmission
+from test.test_SubmissionArchive import make_submission
+
+
+class TestListingCache(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache_file: Path = Path(self.tempdir.name) / "listings.sqlite"
+        self.archive: SubmissionArchive = SubmissionArchive(Path(self.tempdir.name) / "submissions.jsonl")
+        self.now: float = 1000.0
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def cache(self) -> ListingCache:
+        return ListingCache(self.cache_file, 60, clock=lambda: self.now)
+
+    def put(self, cache: ListingCache, listing: str, after, ids: list[str], next_after) -> None:
+        submissions = [make_submission(i) for i in ids]
+        cache.put_page(listing, after, submissions, [self.archive.submission_to_record(s) for s in submissions], next_after)
+
+    def test_pages_are_shared_until_they_expire(self):
+        writer: ListingCache = self.cache()
+        self.put(writer, "https://www.reddit.com/r/wallpapers/new", None, ["a", "b"], "t3_b")
+        self.put(writer, "https://www.reddit.com/r/wallpapers/top/?t=day", None, ["b", "c"], None)
+        self.assertIsNone(writer.get_page("https://www.reddit.com/r/wallpapers/new", "t3_b"))
+
+        reader: ListingCache = self.cache()
+        submissions, next_after = reader.get_page("https://www.reddit.com/r/wallpapers/new", None)
+        self.assertEqual(["a", "b"], [s.id for s in submissions])
+        self.assertEqual("t3_b", next_after)
+        self.assertIsInstance(submissions[0], ArchivedSubmission)
+        self.assertEqual("t3_a", submissions[0].fullname)
+        top, _ = reader.get_page("https://www.reddit.com/r/wallpapers/top/?t=day", None)
+        self.assertIs(submissions[1], top[0], "Expected every submission to be restored once per run")
+
+        self.now += 61
+        self.assertIsNone(self.cache().get_page("https://www.reddit.com/r/wallpapers/new", None))
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+
+from actions.MetadataWriter import MetadataWriterPool, MetadataWriteBatch
+from actions.downloader.Transfer import DownloadedImage
+from database import BlobStore, SQLiteImageDatabase
+
+
+class TestMetadataWriter(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root: Path = Path(self.tempdir.name)
+        self.library: SQLiteImageDatabase = SQLiteImageDatabase(self.root / "library.sqlite")
+        self.committed: list[str] = []
+
+    def tearDown(self) -> None:
+        self.library.close()
+        self.tempdir.cleanup()
+
+    def test_commit_after_successful_write(self):
+        pool: MetadataWriterPool = MetadataWriterPool(1, 4, library=self.library)
+        batch: MetadataWriteBatch = pool.batch(lambda: self.committed.append("url"))
+        batch.write(self.root / "image.png", None, b"image", phash="00000000000000ff")
+        self.assertTrue(batch.hash_known("00000000000000ff"), "Expected a pending hash to be known")
+        batch.close()
+        pool.close()
+        self.assertEqual(["url"], self.committed)
+        self.assertEqual(b"image", (self.root / "image.png").read_bytes())
+        self.assertTrue(self.library.hash_in_hashes("00000000000000ff"), "Expected the hash to be stored after the write")
+        self.assertEqual((1, 0), (pool.completed, pool.failed))
+
+    def test_no_commit_after_failed_write(self):
+        pool: MetadataWriterPool = MetadataWriterPool(1, 4, library=self.library)
+        batch: MetadataWriteBatch = pool.batch(lambda: self.committed.append("url"))
+        batch.write(self.root / "image.png", None, b"image", phash="00000000000000ff")
+        # Not an image, so the metadata cannot be embedded
+        batch.write(self.root / "broken.jpg", ({"Exif.Image.ImageDescription": "Title"}, {}, {}), b"broken", phash="000000000000ff00")
+        batch.close()
+        pool.close()
+        self.assertEqual([], self.committed, "Expected the URL not to be committed")
+        self.assertFalse((self.root / "broken.jpg").exists(), "Expected the failed file to be deleted")
+        self.assertFalse(self.library.hash_in_hashes("000000000000ff00"), "Expected the failed hash not to be stored")
+        self.assertFalse(pool.hash_known("000000000000ff00"))
+        self.assertEqual((1, 1), (pool.completed, pool.failed))
+
+    def test_store_gif_without_metadata(self):
+        pool: MetadataWriterPool = MetadataWriterPool(1, 4, library=self.library)
+        batch: MetadataWriteBatch = pool.batch(lambda: self.committed.append("url"))
+        gif: bytes = b"GIF89a" + bytes(100)
+        batch.write(self.root / "image.gif", ({"Exif.Image.ImageDescription": "Title"}, {}, {}), gif, phash="00000000000000ff")
+        batch.close()
+        pool.close()
+        self.assertEqual(["url"], self.committed, "Expected the URL to be committed, since the GIF cannot carry embedded metadata")
+        self.assertEqual(gif, (self.root / "image.gif").read_bytes())
+        self.assertTrue(self.library.hash_in_hashes("00000000000000ff"))
+
+    def test_bounded_queue(self):
+        release: threading.Event = threading.Event()
+        pool: MetadataWriterPool = MetadataWriterPool(1, 1)
+        batch: MetadataWriteBatch = pool.batch()
+        batch.write(self.root / "1.png", None, b"1", on_written=release.wait)  # Blocks the worker
+        batch.write(self.root / "2.png", None, b"2")  # Fills the queue
+        submitter: threading.Thread = threading.Thread(target=batch.write, args=(self.root / "3.png", None, b"3"))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive(), "Expected the submission to block while the queue is full")
+        release.set()
+        submitter.join(5)
+        self.assertFalse(submitter.is_alive())
+        pool.close()
+        self.assertEqual(3, pool.completed)
+
+    def test_bounded_bytes(self):
+        release: threading.Event = threading.Event()
+        pool: MetadataWriterPool = MetadataWriterPool(1, 32, max_queued_bytes=100)
+        batch: MetadataWriteBatch = pool.batch()
+        batch.write(self.root / "1.png", None, bytes(60), on_written=release.wait)  # Blocks the worker
+        submitter: threading.Thread = threading.Thread(target=batch.write, args=(self.root / "2.png", None, bytes(60)))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive(), "Expected the submission to block while the queued images exceed the limit")
+        release.set()
+        submitter.join(5)
+        self.assertFalse(submitter.is_alive())
+        batch.write(self.root / "3.png", None, bytes(1000))  # Larger than the limit, but queued alone
+        pool.close()
+        self.assertEqual(3, pool.completed)
+
+    def test_link_to_pending_blob(self):
+        release: threading.Event = threading.Event()
+        store: BlobStore = BlobStore(self.root / ".blobs")
+        pool: MetadataWriterPool = MetadataWriterPool(1, 4, sidecar=True, blob_store=store)
+        batch: MetadataWriteBatch = pool.batch()
+        batch.write(self.root / "a.png", None, b"image", "ab" * 32, on_written=release.wait)  # Blocks the worker
+        # The first copy has not been stored in the blob store yet
+        self.assertTrue(batch.link_known(DownloadedImage(self.root / "b.png", b"image", "ab" * 32), None))
+        self.assertFalse(batch.link_known(DownloadedImage(self.root / "c.png", b"other", "cd" * 32), None))
+        release.set()
+        batch.close()
+        pool.close()
+        self.assertTrue(os.path.samefile(self.root / "a.png", self.root / "b.png"), "Expected the second copy to be linked")
+        self.assertTrue(os.path.samefile(self.root / "a.png", store.blob_path("ab" * 32)))
+        self.assertFalse(pool.digest_pending("ab" * 32))
@@ -0,0 +1,57 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from database import NamingIndex
+
+
+class TestNamingIndex(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root: Path = Path(self.tempdir.name)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_unique_names(self):
+        index: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt")
+        target: Path = self.root / "reddit_sub_wallpapers"
+        self.assertEqual(target / "image.png", index.reserve(target, "image.png", 0))
+        self.assertEqual(target / "image (2).png", index.reserve(target, "image.png", 0))
+        self.assertEqual(target / "image (3).png", index.reserve(target, "image.png", 0))
+        self.assertEqual(target / "other.png", index.reserve(target, "other.png", 0))
+
+    def test_persistence(self):
+        target: Path = self.root / "reddit_sub_wallpapers"
+        NamingIndex(self.root, self.root / ".naming_index.txt").reserve(target, "image.png", 0)
+        index: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt")
+        self.assertEqual(target / "image (2).png", index.reserve(target, "image.png", 0), "Expected the reserved name to be persisted")
+
+    def test_build_from_existing_files(self):
+        target: Path = self.root / "reddit_sub_wallpapers"
+        target.mkdir()
+        (target / "image.png").write_bytes(b"")
+        index: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt")
+        self.assertEqual(target / "image (2).png", index.reserve(target, "image.png", 0), "Expected existing files to be indexed")
+
+    def test_layouts(self):
+        target: Path = self.root / "reddit_sub_wallpapers"
+        index: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt", "year_month")
+        self.assertEqual(target / "2022" / "04" / "image.png", index.reserve(target, "image.png", 1650000000))
+        index = NamingIndex(self.root, self.root / ".naming_index.txt", "hash_prefix")
+        sharded: Path = index.reserve(target, "image.png", 1650000000)
+        self.assertEqual(target, sharded.parent.parent)
+        self.assertEqual(2, len(sharded.parent.name))
+        with self.assertRaises(ValueError):
+            NamingIndex(self.root, self.root / ".naming_index.txt", "unknown")
+
+    def test_release(self):
+        target: Path = self.root / "reddit_sub_wallpapers"
+        index: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt", shared=True)
+        first, second = index.unique_all([target / "image.png", target / "image.png"])
+        self.assertEqual((target / "image.png", target / "image (2).png"), (first, second))
+        index.release(first)
+        self.assertEqual(target / "image.png", index.reserve(target, "image.png", 0), "Expected a released name to be assigned again")
+        index.release(second)
+        other: NamingIndex = NamingIndex(self.root, self.root / ".naming_index.txt", shared=True)
+        self.assertEqual(target / "image (2).png", other.reserve(target, "image.png", 0), "Expected the release to be persisted")
@@ -0,0 +1,63 @@
+import tempfile
+import threading
+import tracemalloc
+from pathlib import Path
+from unittest import TestCase
+
+from actions.Instrumentation import metrics
+from actions.Profiler import Profiler
+
+
+class TestProfiler(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.profiler: Profiler = Profiler(Path(self.tempdir.name), sample_interval=0.001)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_start_and_stop(self):
+        self.assertIsNone(self.profiler.stop(), "Expected nothing to be written if the profiler was not running")
+        started: threading.Event = threading.Event()
+        release: threading.Event = threading.Event()
+
+        def work() -> None:
+            with metrics.time("perceptual_hash"):
+                started.set()
+                release.wait(5)
+
+        worker: threading.Thread = threading.Thread(target=work, name="Worker-1")
+        worker.start()
+        started.wait(5)
+        self.profiler.start()
+        self.assertTrue(self.profiler.active)
+        self.assertTrue(tracemalloc.is_tracing())
+        sum(range(100000))
+        threading.Event().wait(0.1)
+        target_dir: Path = self.profiler.stop()
+        release.set()
+        worker.join()
+        self.assertFalse(self.profiler.active)
+        for name in ("main_thread.prof", "stages.txt", "stacks.folded", "allocations.txt"):
+            self.assertTrue((target_dir / name).is_file(), f"Expected {name} to be written")
+        self.assertRegex((target_dir / "stages.txt").read_text(), r"Worker\s+perceptual_hash\s+\d+")
+        self.assertIn("Worker;perceptual_hash;", (target_dir / "stacks.folded").read_text())
+        self.assertFalse(tracemalloc.is_tracing(), "Expected tracemalloc to be stopped by the profiler that started it")
+
+    def test_keeps_tracemalloc_of_others(self):
+        tracemalloc.start()
+        try:
+            self.profiler.start()
+            self.profiler.stop()
+            self.assertTrue(tracemalloc.is_tracing(), "Expected tracemalloc to keep running, since it has been started before")
+        finally:
+            tracemalloc.stop()
+
+    def test_restart_while_writing(self):
+        self.profiler.start()
+        self.profiler.toggle()  # Writes the profile on a separate thread
+        self.profiler.start()
+        self.assertIsNone(self.profiler._dumper, "Expected the previous profile to be written before the profiler is restarted")
+        second: Path = self.profiler.stop()
+        self.assertEqual(2, len(list(Path(self.tempdir.name).iterdir())), "Expected profiles of the same second to be kept apart")
+        self.assertTrue((second / "stages.txt").is_file())
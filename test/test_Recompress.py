@@ -0,0 +1,73 @@
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+from unittest.mock import patch
+
+from actions.Recompress import Recompressor, redeflate_png
+
+
+def chunk(chunk_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", len(body), chunk_type) + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def chunks(data: bytes) -> list[tuple[bytes, bytes]]:
+    result: list[tuple[bytes, bytes]] = []
+    offset: int = 8
+    while offset < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        body: bytes = data[offset + 8:offset + 8 + length]
+        crc: int = struct.unpack(">I", data[offset + 8 + length:offset + 12 + length])[0]
+        assert crc == zlib.crc32(chunk_type + body)
+        result.append((chunk_type, body))
+        offset += 12 + length
+    return result
+
+
+class TestRecompress(unittest.TestCase):
+    def setUp(self) -> None:
+        # A poorly compressed 64x64 grayscale PNG, whose image data is split into two chunks, with metadata in between
+        raw: bytes = b"".join(b"\0" + bytes((x * y) % 256 for x in range(64)) for y in range(64))
+        idat: bytes = zlib.compress(raw, 0)
+        self.raw: bytes = raw
+        self.png: bytes = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 64, 64, 8, 0, 0, 0, 0)) + \
+            chunk(b"iTXt", b"XML:com.adobe.xmp\0\0\0\0\0<x:xmpmeta/>") + chunk(b"IDAT", idat[:1000]) + chunk(b"IDAT", idat[1000:]) + \
+            chunk(b"IEND", b"")
+
+    def test_redeflate_png_keeps_pixels_and_metadata(self):
+        recompressed: bytes = redeflate_png(self.png)
+        self.assertLess(len(recompressed), len(self.png))
+        parsed: list[tuple[bytes, bytes]] = chunks(recompressed)
+        self.assertEqual([b"IHDR", b"iTXt", b"IDAT", b"IEND"], [chunk_type for chunk_type, _ in parsed])
+        self.assertEqual(chunks(self.png)[1], parsed[1])
+        self.assertEqual(self.raw, zlib.decompress(parsed[2][1]))
+        self.assertIsNone(redeflate_png(self.png[:-20]), "Expected truncated files to be left alone")
+
+    def test_recompress_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            image_file: Path = Path(tempdir) / "image.png"
+            image_file.write_bytes(self.png)
+            recompressor: Recompressor = Recompressor(tools=[])
+            saved: int = recompressor.recompress(image_file)
+            self.assertEqual(len(self.png) - image_file.stat().st_size, saved)
+            self.assertGreater(saved, 0)
+            self.assertEqual(0, recompressor.recompress(image_file), "Expected a recompressed file to stay unchanged")
+            self.assertEqual(["image.png"], [f.name for f in Path(tempdir).iterdir()])
+
+    def test_sidecar_mode_is_not_recompressed(self):
+        self.assertIsNone(Recompressor.from_config({"reddit_downloader.recompress_images": True, "metadata_scraper.metadata_mode": "sidecar"}))
+        self.assertIsNotNone(Recompressor.from_config({"reddit_downloader.recompress_images": True}))
+
+    def test_errors_leave_the_file_untouched(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            image_file: Path = Path(tempdir) / "image.png"
+            image_file.write_bytes(self.png)
+            with patch("actions.Recompress.redeflate_png", side_effect=MemoryError()):
+                self.assertEqual(0, Recompressor(tools=[]).recompress(image_file))
+            self.assertEqual(self.png, image_file.read_bytes())
+            self.assertEqual(["image.png"], [f.name for f in Path(tempdir).iterdir()])
+
+
+if __name__ == '__main__':
+    unittest.main()
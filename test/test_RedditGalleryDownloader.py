@@ -0,0 +1,102 @@
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Optional
+from unittest import TestCase
+from unittest.mock import patch
+
+from actions.downloader.RedditGalleryDownloader import RedditGalleryDownloader
+from actions.downloader.Transfer import DownloadedImage, DownloadFailure
+from database import NamingIndex
+
+
+def gallery_submission(*media: tuple[str, int, str]) -> SimpleNamespace:
+    return SimpleNamespace(
+        id="g1", title="Gallery", url="https://www.reddit.com/gallery/g1", created_utc=1650000000,
+        gallery_data={"items": [{"media_id": media_id, "caption": None} for media_id, _, _ in media]},
+        media_metadata={media_id: {"status": "valid", "m": mime_type, "s": {"x": width, "y": 1000}} for media_id, width, mime_type in media})
+
+
+class FakeBatch:
+    def __init__(self) -> None:
+        self.written: list[Path] = []
+
+    def link_known(self, image: DownloadedImage, model: Any) -> bool:
+        return False
+
+    def hash_known(self, phash: Any) -> bool:
+        return False
+
+    def write(self, target_file: Path, model: Any, data: Optional[bytes] = None, *args: Any) -> None:
+        self.written.append(target_file)
+
+
+class TestRedditGalleryDownloader(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.destination: Path = Path(self.tempdir.name)
+        self.naming: NamingIndex = NamingIndex(self.destination, self.destination / ".naming_index.txt")
+        self.batch: FakeBatch = FakeBatch()
+        self.archived: list[Path] = []
+        self.archive = SimpleNamespace(add_image=lambda image_file, submission_id, gallery_item=None: self.archived.append(image_file))
+        self.cfg: dict[str, Any] = {"reddit_downloader.discard_phashed_duplicates": True, "metadata_scraper.write_metadata": False,
+                                    "reddit_downloader.download_gif": False, "filters.min_width": 500}
+        self.gallery_folder: Path = self.destination / "Gallery g1"
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def download(self, submission: SimpleNamespace, fetch: Any) -> int:
+        with patch("actions.downloader.RedditGalleryDownloader.download_image", side_effect=fetch) as download, \
+                patch("actions.downloader.RedditGalleryDownloader.perceptual_hash", return_value="phash"):
+            downloaded: int = RedditGalleryDownloader().download(submission, self.cfg, self.destination, None, None, self.batch,
+                                                                 self.archive, self.naming)
+            self.downloaded_urls: list[str] = sorted(call.args[0] for call in download.call_args_list)
+        return downloaded
+
+    def test_items_in_gallery_order(self):
+        def fetch(url: str, target_file: Path, *args: Any) -> DownloadedImage:
+            return DownloadedImage(target_file, url.encode(), hashlib.sha256(url.encode()).hexdigest())
+
+        submission: SimpleNamespace = gallery_submission(("b", 1000, "image/png"), ("small", 100, "image/jpg"),
+                                                         ("anim", 1000, "image/gif"), ("a", 1000, "image/jpg"))
+        self.assertEqual(2, self.download(submission, fetch))
+        self.assertEqual(["https://i.redd.it/a.jpg", "https://i.redd.it/b.png"], self.downloaded_urls,
+                         "Expected the too small image and the GIF to be skipped without downloading them")
+        expected: list[Path] = [self.gallery_folder / "01 b.png", self.gallery_folder / "04 a.jpg"]
+        self.assertEqual(expected, self.batch.written, "Expected the images to be named and stored in gallery order")
+        self.assertEqual(expected, self.archived)
+
+    def test_gone_items_are_skipped(self):
+        def fetch(url: str, target_file: Path, *args: Any) -> DownloadedImage:
+            if url.endswith("gone.jpg"):
+                raise DownloadFailure(url, "HTTP 404", permanent=True)
+            return DownloadedImage(target_file, b"image", "digest")
+
+        self.assertEqual(1, self.download(gallery_submission(("gone", 1000, "image/jpg"), ("b", 1000, "image/jpg")), fetch))
+        self.assertEqual([self.gallery_folder / "02 b.jpg"], self.batch.written)
+        self.assertEqual(self.gallery_folder / "01 gone.jpg", self.naming.unique(self.gallery_folder / "01 gone.jpg"),
+                         "Expected the name of the gone image to be released")
+
+    def test_transient_failure_discards_fetched_items(self):
+        fetched: threading.Event = threading.Event()
+
+        def fetch(url: str, target_file: Path, *args: Any) -> DownloadedImage:
+            if url.endswith("slow.jpg"):
+                fetched.wait(5)  # The next image has been written to its file before this one fails
+                raise DownloadFailure(url, "HTTP 503", permanent=False)
+            target_file.write_bytes(b"image")
+            if url.endswith("c.jpg"):
+                fetched.set()
+            return DownloadedImage(target_file, None, "digest")
+
+        submission: SimpleNamespace = gallery_submission(("a", 1000, "image/jpg"), ("slow", 1000, "image/jpg"), ("c", 1000, "image/jpg"))
+        with self.assertRaises(DownloadFailure):
+            self.download(submission, fetch)
+        self.assertEqual([self.gallery_folder / "01 a.jpg"], self.batch.written, "Expected the images before the failure to be stored")
+        self.assertFalse((self.gallery_folder / "03 c.jpg").exists(), "Expected the fetched image after the failure to be discarded")
+        for name in ("02 slow.jpg", "03 c.jpg"):
+            self.assertEqual(self.gallery_folder / name, self.naming.unique(self.gallery_folder / name),
+                             "Expected the next attempt to be assigned the same names")
@@ -92,3 +92,37 @@ class TestRedditObjectParser(TestCase):
             with self.subTest(msg=f"Invalid Test {i}", invalid_str=invalid_str):
                 with self.assertRaises(NoValidRedditObjectError) as cm:
                     RedditObject.from_user_string(invalid_str)
+
+    def test_error_messages(self):
+        params: list[tuple[str, str]] = [
+            ("r/subreddit^with.invalid/characters", "Expected a slash before ^with.invalid/characters"),
+            ("u/example_user/hot", "Not a <enum 'UserPageKind'>: hot"),
+            ("r/wallpapers/top?t=decade", "Not a <enum 'TopKind'>: decade"),
+            ("r/wallpapers/top/.", "Must have a question mark: ."),
+            ("r/wallpapers/hot/?", "Expected a variable identifier after the question mark, instead got "),
+        ]
+        for invalid_str, message in params:
+            with self.subTest(invalid_str=invalid_str):
+                with self.assertRaises(NoValidRedditObjectError) as cm:
+                    RedditObject.from_user_string(invalid_str)
+                self.assertEqual((f"The given request was not a valid RedditObject: \"{invalid_str}\"", message), cm.exception.args)
+
+    def test_bulk_parse_and_deduplicate(self):
+        lines: list[str] = [
+            "# Wallpapers",
+            "r/wallpapers\n",
+            "https://www.reddit.com/r/WallPapers/hot",
+            "",
+            "r/wallpapers/top/?t=week",
+            "!@#$%",
+            "http://reddit.com/r/wallpapers/top?t=week",
+            "u/example_user",
+            "r/example_user",
+            "!@#$%",
+        ]
+        targets, errors = RedditObject.from_user_strings(lines)
+        self.assertEqual(["https://www.reddit.com/r/wallpapers/hot", "https://www.reddit.com/r/wallpapers/top/?t=week",
+                          "https://www.reddit.com/user/example_user/submitted/hot", "https://www.reddit.com/r/example_user/hot"],
+                         [target.get_full_url() for target in targets])
+        self.assertEqual([6, 10], [line for line, _ in errors])
+        self.assertTrue(all(isinstance(e, NoValidRedditObjectError) for _, e in errors))
@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from actions.RefreshSubmissions import fetch_submissions, refresh_submissions, _read_comment
+from actions.WriteMetadata import get_upvotes_comment, set_long_comment, write_xmp_sidecar
+from database import SubmissionArchive
+from test.test_SubmissionArchive import make_submission
+
+
+class FakeReddit:
+    def __init__(self, submissions: dict[str, SimpleNamespace] = None) -> None:
+        self.requests: list[list[str]] = []
+        self.submissions: dict[str, SimpleNamespace] = submissions or {}
+
+    def info(self, fullnames: list[str]):
+        self.requests.append(list(fullnames))
+        return [self.submissions.get(fullname[3:], SimpleNamespace(id=fullname[3:])) for fullname in fullnames if fullname != "t3_deleted"]
+
+
+class TestRefreshSubmissions(unittest.TestCase):
+    def test_fetch_in_batches_of_100(self):
+        reddit: FakeReddit = FakeReddit()
+        ids: list[str] = [f"{i:x}" for i in range(250)] + ["deleted"]
+        submissions = list(fetch_submissions(reddit, ids))
+        self.assertEqual([100, 100, 51], [len(request) for request in reddit.requests])
+        self.assertEqual("t3_0", reddit.requests[0][0])
+        self.assertEqual(ids[:-1], [submission.id for submission in submissions])
+
+    def test_archive_newer_than_metadata(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            destination: Path = Path(tempdir)
+            image_file: Path = destination / "reddit_sub_wallpapers" / "a.png"
+            image_file.parent.mkdir()
+            image_file.write_bytes(b"image")
+            write_xmp_sidecar(image_file, *set_long_comment(({}, {}, {}), f"Title {get_upvotes_comment(make_submission('a'))}"))
+            # The submission has been listed again after the download, so the archive already has the current score
+            archive: SubmissionArchive = SubmissionArchive(destination / "submissions.jsonl")
+            archive.add_submission(make_submission("a"), "r/wallpapers")
+            archive.add_image(image_file, "a")
+            archive.add_submission(make_submission("a", score=5), "r/wallpapers")
+            archive.close()
+            cfg: dict = {"metadata_scraper.metadata_mode": "sidecar"}
+            self.assertEqual(1, refresh_submissions(destination, cfg, FakeReddit({"a": make_submission("a", score=5)}), workers=1))
+            self.assertEqual(f"Title {get_upvotes_comment(make_submission('a', score=5))}", _read_comment(image_file, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
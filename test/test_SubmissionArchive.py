@@ -0,0 +1,95 @@
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase
+
+from database import SubmissionArchive, ArchivedSubmission, get_gallery_items
+
+
+def make_submission(submission_id: str, score: int = 1) -> SimpleNamespace:
+    return SimpleNamespace(id=submission_id, permalink=f"/r/wallpapers/comments/{submission_id}/", url=f"https://i.redd.it/{submission_id}.png",
+                           title="Title", selftext="", author=SimpleNamespace(name="exampleuser"), author_flair_text=None, score=score,
+                           upvote_ratio=0.9, num_comments=2, created_utc=1650000000.0, subreddit=SimpleNamespace(display_name="wallpapers"),
+                           preview={"images": [{"source": {"width": 1920, "height": 1080}, "resolutions": [{"width": 108, "height": 60}]}]})
+
+
+class TestSubmissionArchive(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.archive_file: Path = Path(self.tempdir.name) / "submissions.jsonl"
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_indexes(self):
+        archive: SubmissionArchive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        archive.add_submission(make_submission("b"), "u/exampleuser")
+        archive.add_image(Path(self.tempdir.name) / "reddit_sub_wallpapers" / "a.png", "a")
+        archive.add_submission(make_submission("a", score=5), "r/wallpapers")
+        archive.close()
+
+        archive = SubmissionArchive(self.archive_file)
+        self.assertEqual(["a", "b"], archive.submission_ids())
+        self.assertEqual(["a"], archive.submission_ids("r/wallpapers"))
+        self.assertEqual(["r/wallpapers", "u/exampleuser"], archive.targets())
+        submission: ArchivedSubmission = archive.get_submission("a")
+        self.assertEqual(5, submission.score, "Expected the latest state of the submission")
+        self.assertEqual("exampleuser", submission.author.name)
+        self.assertEqual([[1920, 1080], [108, 60]], submission.preview_sizes)
+        self.assertIsNone(archive.get_submission("c"))
+        _, _, images = archive.load()
+        self.assertEqual(["reddit_sub_wallpapers/a.png"], list(images.keys()))
+
+    def test_unchanged_submissions_are_not_appended(self):
+        archive: SubmissionArchive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        archive.close()
+        archive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        self.assertEqual(1, len(self.archive_file.read_bytes().splitlines()), "Expected an unchanged submission to be archived once")
+        archive.add_submission(make_submission("a", score=5), "r/wallpapers")
+        archive.add_submission(make_submission("a"), "u/exampleuser")
+        archive.close()
+        self.assertEqual(3, len(self.archive_file.read_bytes().splitlines()), "Expected changed submissions to be appended")
+        archive.index_file.unlink()
+        archive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("a"), "u/exampleuser")
+        archive.close()
+        self.assertEqual(3, len(self.archive_file.read_bytes().splitlines()), "Expected the re-indexed records to be compared")
+
+    def test_reindex_after_crash(self):
+        archive: SubmissionArchive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("a"), "r/wallpapers")
+        archive.close()
+        archive.index_file.unlink()
+        with self.archive_file.open("a") as af:
+            af.write('{"kind": "submission", "id": "incompl')  # Simulate a record that was cut off
+        archive = SubmissionArchive(self.archive_file)
+        archive.add_submission(make_submission("b"), "r/wallpapers")
+        archive.close()
+        archive = SubmissionArchive(self.archive_file)
+        self.assertEqual(["a", "b"], archive.submission_ids("r/wallpapers"))
+        self.assertEqual("b", archive.get_submission("b").id)
+
+    def test_gallery_items(self):
+        gallery = make_submission("g")
+        gallery.url = "https://www.reddit.com/gallery/g"
+        gallery.gallery_data = {"items": [{"media_id": "m2", "id": 2, "caption": "Second"}, {"media_id": "m1", "id": 1},
+                                          {"media_id": "gone", "id": 3}]}
+        gallery.media_metadata = {"m1": {"status": "valid", "e": "Image", "m": "image/png", "s": {"x": 800, "y": 600}},
+                                  "m2": {"status": "valid", "e": "Image", "m": "image/jpg", "s": {"x": 1920, "y": 1080}},
+                                  "gone": {"status": "failed"}}
+        crosspost = make_submission("x")
+        crosspost.crosspost_parent_list = [vars(gallery)]
+        expected = [{"id": "m2", "file": "m2.jpg", "caption": "Second", "width": 1920, "height": 1080, "type": "image/jpg"},
+                    {"id": "m1", "file": "m1.png", "caption": None, "width": 800, "height": 600, "type": "image/png"}]
+        self.assertEqual(expected, get_gallery_items(gallery))
+        self.assertEqual(expected, get_gallery_items(crosspost), "Expected the gallery of the crossposted submission")
+        self.assertEqual([], get_gallery_items(make_submission("a")))
+
+        archive: SubmissionArchive = SubmissionArchive(self.archive_file)
+        archive.add_submission(gallery, "r/wallpapers")
+        self.assertEqual(expected, get_gallery_items(archive.get_submission("g")))
+        archive.close()